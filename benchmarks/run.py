@@ -0,0 +1,348 @@
+# Run: Offline benchmarks of PyCallisto on synthetic e-Callisto FITS files
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+"""Time and measure the peak memory of the main steps of PyCallisto (loading
+FITS files one by one or through the ingest pipeline, stitching them,
+removing their background, generating the time ticks of a plot and
+rendering it with fitsplot) on 1, 10, 100 and 1000 synthetic files, as well
+as the time it takes to import pycallisto, and store the results as JSON:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --sizes 1 10 --compare results.json
+
+When comparing, the exit status is 1 if any benchmark got slower (or used
+more memory) than the given tolerance allows, or if importing pycallisto
+started importing matplotlib.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Sequence
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+from matplotlib import pyplot as plt  # noqa: E402
+from matplotlib.ticker import AutoLocator  # noqa: E402
+
+from pycallisto import fitsplot  # noqa: E402
+from pycallisto.fitsbackground import remove_background  # noqa: E402
+from pycallisto.fitscatalog import FitsCatalog  # noqa: E402
+from pycallisto.fitsfile import ECallistoFitsFile  # noqa: E402
+from pycallisto.fitshelpers import time_ticks  # noqa: E402
+from pycallisto.fitsingest import ingest  # noqa: E402
+from pycallisto.fitsstitch import stitch  # noqa: E402
+
+from .synthetic import SYNTHETIC_VERSION, synthetic_station  # noqa: E402
+
+RESULTS_VERSION = 1
+SIZES = (1, 10, 100, 1000)
+DATA_DIR = Path(tempfile.gettempdir(), "pycallisto-benchmarks")
+# Imports pycallisto in a fresh interpreter and prints the time it took, the
+# peak memory allocated (if traced) and whether matplotlib got imported
+IMPORT_SCRIPT = """
+import sys, time, tracemalloc
+if sys.argv[1:] == ["trace"]:
+    tracemalloc.start()
+start = time.perf_counter()
+import pycallisto
+seconds = time.perf_counter() - start
+print(seconds, tracemalloc.get_traced_memory()[1], "matplotlib" in sys.modules)
+"""
+
+
+class Benchmark(NamedTuple):
+    """A benchmarked step: `setup` prepares the arguments of `run` from the
+    paths of the FITS files, outside of the timed section."""
+
+    name: str
+    setup: Callable[[List[Path]], tuple]
+    run: Callable
+
+
+def _load(paths: List[Path]) -> List[ECallistoFitsFile]:
+    fitsfiles = [ECallistoFitsFile(path.name, path) for path in paths]
+    for fitsfile in fitsfiles:
+        fitsfile.hdul_dataset["db"]
+
+    return fitsfiles
+
+
+def _ticks(time_axis: np.ndarray):
+    locs = AutoLocator().tick_values(time_axis[0], time_axis[-1])
+    locs = locs[(locs >= time_axis[0]) & (locs <= time_axis[-1])]
+
+    return time_ticks(locs, time_axis[0], time_axis[-1])
+
+
+def _plot(paths: List[Path], catalog: FitsCatalog):
+    fitsplot([path.name for path in paths], show=False, catalog=catalog)
+
+
+def _plot_setup(paths: List[Path]) -> tuple:
+    catalog = FitsCatalog(":memory:")
+    catalog.update(paths[0].parent)
+
+    return paths, catalog
+
+
+BENCHMARKS = (
+    Benchmark("load", lambda paths: (paths,), _load),
+    Benchmark("ingest", lambda paths: (paths,), lambda paths: list(ingest(paths))),
+    Benchmark("stitch", lambda paths: (_load(paths),), stitch),
+    Benchmark(
+        "background", lambda paths: (stitch(_load(paths))[0],), remove_background
+    ),
+    Benchmark("ticks", lambda paths: (stitch(_load(paths))[1],), _ticks),
+    Benchmark("fitsplot", _plot_setup, _plot),
+)
+
+
+def measure(benchmark: Benchmark, paths: List[Path], repeat: int = 3) -> dict:
+    """Time a benchmark and measure its peak memory.
+
+    The run is timed `repeat` times, then run once more with tracemalloc
+    (which NumPy reports its arrays to) to get the peak memory allocated
+    while it runs, on top of what its setup allocated.
+
+    :param benchmark: The benchmark.
+    :param paths: Paths of the FITS files.
+    :param repeat: Number of timed runs.
+    :returns: Result of the benchmark.
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = benchmark.setup(paths)
+        gc.collect()
+        start = time.perf_counter()
+        benchmark.run(*args)
+        seconds.append(time.perf_counter() - start)
+        del args
+
+    args = benchmark.setup(paths)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark.run(*args)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "benchmark": benchmark.name,
+        "files": len(paths),
+        "seconds": seconds,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "peak_bytes": peak_bytes,
+    }
+
+
+def _import(trace: bool = False) -> tuple:
+    process = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT] + (["trace"] if trace else []),
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, peak_bytes, matplotlib_imported = process.stdout.split()
+
+    return float(seconds), int(peak_bytes), matplotlib_imported == "True"
+
+
+def measure_import(repeat: int = 3) -> dict:
+    """Time the import of pycallisto and measure its peak memory, each
+    time in a new Python interpreter, so that nothing is imported yet.
+
+    :param repeat: Number of timed imports.
+    :returns: Result of the benchmark, with the number of files set to 0
+    and whether importing pycallisto imported matplotlib.
+    """
+    seconds = [_import()[0] for _ in range(repeat)]
+    _, peak_bytes, matplotlib_imported = _import(trace=True)
+
+    return {
+        "benchmark": "import",
+        "files": 0,
+        "seconds": seconds,
+        "best": min(seconds),
+        "median": statistics.median(seconds),
+        "peak_bytes": peak_bytes,
+        "matplotlib": matplotlib_imported,
+    }
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "commit": commit,
+    }
+
+
+def run(
+    sizes: Sequence[int] = SIZES,
+    names: Sequence[str] = (),
+    repeat: int = 3,
+    data_dir: Path = DATA_DIR,
+    rows: int = 200,
+    columns: int = 3600,
+) -> dict:
+    """Run the benchmarks.
+
+    :param sizes: Numbers of FITS files to run every benchmark on.
+    :param names: Names of the benchmarks to run. All of them if empty.
+    :param repeat: Number of timed runs of every benchmark.
+    :param data_dir: Folder in which the synthetic FITS files are kept
+    across runs.
+    :param rows: Number of frequency channels of the synthetic files.
+    :param columns: Number of time samples of the synthetic files.
+    :returns: Results, as stored in the JSON file.
+    """
+    folder = Path(data_dir, f"{rows}x{columns}-v{SYNTHETIC_VERSION}")
+    paths = synthetic_station(folder, max(sizes), rows=rows, columns=columns)
+
+    results = []
+    if not names or "import" in names:
+        results.append(measure_import(repeat))
+        print(_format(results[-1]), file=sys.stderr)
+    for benchmark in BENCHMARKS:
+        if names and benchmark.name not in names:
+            continue
+        for size in sizes:
+            try:
+                result = measure(benchmark, paths[:size], repeat)
+            except MemoryError:
+                result = {"benchmark": benchmark.name, "files": size}
+                result["error"] = "MemoryError"
+            results.append(result)
+            plt.close("all")
+            print(_format(result), file=sys.stderr)
+
+    return {
+        "version": RESULTS_VERSION,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "environment": _environment(),
+        "parameters": {"repeat": repeat, "rows": rows, "columns": columns},
+        "results": results,
+    }
+
+
+def _format(result: dict) -> str:
+    line = f"{result['benchmark']:>10} {result['files']:>5} files: "
+    if "error" in result:
+        return line + result["error"]
+
+    return line + f"{result['best']:9.4f} s {result['peak_bytes'] / 2 ** 20:9.1f} MiB"
+
+
+def compare(old: dict, new: dict, tolerance: float = 0.1) -> List[str]:
+    """Compare two sets of results.
+
+    :param old: Results to compare against (e.g., of the main branch).
+    :param new: New results.
+    :param tolerance: Largest relative increase of the best time or of the
+    peak memory that is not reported as a regression.
+    :returns: Lines describing the regressions found.
+    """
+    baseline: Dict[tuple, dict] = {
+        (result["benchmark"], result["files"]): result
+        for result in old["results"]
+        if "error" not in result
+    }
+
+    regressions = []
+    for result in new["results"]:
+        key = (result["benchmark"], result["files"])
+        if key not in baseline or "error" in result:
+            continue
+        for field in ("best", "peak_bytes"):
+            ratio = result[field] / max(baseline[key][field], 1e-12)
+            if ratio > 1 + tolerance:
+                regressions.append(f"{key[0]} on {key[1]} files: {field} x{ratio:.2f}")
+        if result.get("matplotlib") and not baseline[key].get("matplotlib"):
+            regressions.append(f"{key[0]}: matplotlib is imported")
+
+    return regressions
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        default=[],
+        choices=["import"] + [b.name for b in BENCHMARKS],
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--columns", type=int, default=3600)
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    parser.add_argument("--output", type=Path, help="JSON file to store the results")
+    parser.add_argument("--compare", type=Path, help="JSON file of earlier results")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.sizes, args.benchmarks, args.repeat, args.data_dir, args.rows, args.columns
+    )
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.compare is not None:
+        regressions = compare(
+            json.loads(args.compare.read_text()), results, args.tolerance
+        )
+        for regression in regressions:
+            print(regression)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# Synthetic: Generator of synthetic e-Callisto FITS files for benchmarks
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+from astropy.io import fits
+
+# Version of the synthetic files, part of the name of the folders they are
+# kept in across runs, so that files written by older versions are not reused
+SYNTHETIC_VERSION = 2
+
+
+def synthetic_digits(rows: int = 200, columns: int = 3600, seed: int = 0) -> np.ndarray:
+    """Make the image data of an e-Callisto spectrogram: a smooth background
+    level per channel, noise, a few channels of narrowband interference and
+    a drifting (type III-like) burst.
+
+    :param rows: Number of frequency channels.
+    :param columns: Number of time samples.
+    :param seed: Seed of the random number generator.
+    :returns: (rows x columns) array of uint8 digits.
+    """
+    rng = np.random.default_rng(seed)
+    channels = np.arange(rows)
+    background = 110 + 30 * np.sin(np.pi * channels / rows) + rng.normal(0, 4, rows)
+    image = rng.normal(0, 2, (rows, columns)).astype(np.float32)
+    image += background[:, np.newaxis].astype(np.float32)
+
+    # Channels hit by interference, brighter and noisier
+    interference = rng.choice(rows, size=max(1, rows // 20), replace=False)
+    image[interference] += rng.normal(25, 6, (interference.size, columns))
+
+    # Burst drifting from the highest frequency channel down
+    start = int(rng.integers(0, max(1, columns - rows // 2 - 40)))
+    for row in channels:
+        first = start + row // 2
+        image[row, first : first + 40] += 30 * np.exp(
+            -np.arange(40)[: columns - first] / 10
+        )
+
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def synthetic_fits(
+    path: Union[str, Path],
+    start: datetime,
+    rows: int = 200,
+    columns: int = 3600,
+    dt: float = 0.25,
+    station: str = "SYNTH",
+    seed: int = 0,
+) -> Path:
+    """Write a synthetic e-Callisto FITS file: a primary HDU of uint8
+    digits with the observation headers, and a binary table extension with
+    the time and frequency axes.
+
+    :param path: Path of the FITS file (e.g., ending in .fit.gz to have it
+    gzipped).
+    :param start: Start time of the observation.
+    :param rows: Number of frequency channels.
+    :param columns: Number of time samples.
+    :param dt: Time step, in seconds.
+    :param station: Name of the station (INSTRUME header).
+    :param seed: Seed of the random number generator of the image data.
+    The frequency channels only depend on the station, as all the files of
+    a station share the same frequency file.
+    :returns: Path of the FITS file.
+    """
+    path = Path(path)
+    end = start + timedelta(seconds=dt * columns)
+    seconds_of_day = start - datetime.combine(start.date(), datetime.min.time())
+    seconds_of_day = seconds_of_day.total_seconds()
+
+    primary = fits.PrimaryHDU(synthetic_digits(rows, columns, seed))
+    header = primary.header
+    header["DATE"] = (start.strftime("%Y-%m-%d"), "Time of observation")
+    header["CONTENT"] = (
+        f"{start:%Y/%m/%d}  Radio flux density, e-CALLISTO ({station})",
+        "Title of image",
+    )
+    header["ORIGIN"] = ("PyCallisto", "Organization name")
+    header["TELESCOP"] = ("Radio Spectrometer", "Type of instrument")
+    header["INSTRUME"] = (station, "Name of the spectrometer")
+    header["OBJECT"] = ("Sun", "object description")
+    header["DATE-OBS"] = (f"{start:%Y/%m/%d}", "Date observation starts")
+    header["TIME-OBS"] = (
+        f"{start:%H:%M:%S}.{start.microsecond // 1000:03d}",
+        "Time observation starts",
+    )
+    header["DATE-END"] = (f"{end:%Y/%m/%d}", "date observation ends")
+    header["TIME-END"] = (f"{end:%H:%M:%S}", "time observation ends")
+    header["BZERO"] = (0.0, "scaling offset")
+    header["BSCALE"] = (1.0, "scaling factor")
+    header["BUNIT"] = ("digits", "z-axis title")
+    header["CRVAL1"] = (
+        int(seconds_of_day),
+        "value on axis 1 at reference pixel [sec of day]",
+    )
+    header["CRPIX1"] = (0, "reference pixel of axis 1")
+    header["CTYPE1"] = ("Time [UT]", "title of axis 1")
+    header["CDELT1"] = (dt, "step between first and second element in x-axis")
+    header["CTYPE2"] = ("Frequency [MHz]", "title of axis 2")
+    header["FRQFILE"] = ("FRQSYNTH.CFG", "name of frequency file")
+
+    # Frequencies go from the highest channel down, unevenly spaced as in
+    # real frequency files
+    rng = np.random.default_rng(zlib.crc32(station.encode()))
+    steps = rng.uniform(0.5, 1.5, rows - 1)
+    frequency = 870 - np.concatenate([[0], np.cumsum(steps)]) * 825 / steps.sum()
+    time = np.round(dt * np.arange(columns), 3)
+    table = fits.BinTableHDU.from_columns(
+        [
+            fits.Column("TIME", f"{columns}D8.3", array=time[np.newaxis]),
+            fits.Column("FREQUENCY", f"{rows}D8.3", array=frequency[np.newaxis]),
+        ]
+    )
+
+    fits.HDUList([primary, table]).writeto(path, overwrite=True)
+
+    return path
+
+
+def synthetic_station(
+    folder: Union[str, Path],
+    count: int,
+    start: datetime = datetime(2011, 8, 9, 6),
+    station: str = "SYNTH",
+    focus_code: str = "01",
+    **kwargs,
+) -> List[Path]:
+    """Write the consecutive FITS files of a synthetic station, named like
+    e-Callisto files (e.g., SYNTH_20110809_060000_01.fit.gz). Files that
+    already exist are kept, so the same folder can be reused across runs.
+
+    :param folder: Folder in which the files are written.
+    :param count: Number of files.
+    :param start: Start time of the first file.
+    :param station: Name of the station.
+    :param focus_code: Focus code in the filenames.
+    :param kwargs: Keyword arguments passed on to synthetic_fits (e.g.,
+    rows and columns).
+    :returns: Paths of the files, in time order.
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    duration = timedelta(seconds=kwargs.get("dt", 0.25) * kwargs.get("columns", 3600))
+
+    paths = []
+    for index in range(count):
+        file_start = start + index * duration
+        path = folder / f"{station}_{file_start:%Y%m%d_%H%M%S}_{focus_code}.fit.gz"
+        if not path.is_file():
+            synthetic_fits(path, file_start, station=station, seed=index, **kwargs)
+        paths.append(path)
+
+    return paths
@@ -0,0 +1,474 @@
+# Archive: Bulk downloads of FITS files from the e-Callisto data archive
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+from urllib.parse import unquote, urljoin, urlparse
+
+import aiofiles
+import httpx
+
+from .fitscatalog import parse_filename
+
+ECALLISTO_ARCHIVE = (
+    "http://soleil80.cs.technik.fhnw.ch/solarradio/data/2002-20yy_Callisto/"
+)
+
+# Links to files of the same directory in an HTML directory listing
+LISTING_HREF = re.compile(r'href="([^"/?#]+)"', re.IGNORECASE)
+
+# HTTP status codes worth retrying a download for
+RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class DownloadError(Exception):
+    """A download ended before the whole file was received."""
+
+
+class ArchiveFile(NamedTuple):
+    """A FITS file listed in the archive."""
+
+    url: str
+    name: str
+    station: str
+    start: datetime
+    focus_code: str
+
+
+class DownloadResult(NamedTuple):
+    """Outcome of downloading a single file."""
+
+    url: str
+    path: Path
+    status: str  # "downloaded", "resumed", "skipped" or "failed"
+    received: int  # Bytes received by the last attempt
+    error: Optional[str] = None
+
+
+def archive_url(filename: str, archive: str = ECALLISTO_ARCHIVE) -> str:
+    """Get the URL of an e-Callisto FITS file in the archive, which keeps
+    the files in one directory per day (YYYY/MM/DD).
+
+    :param filename: Name of the FITS file (e.g., BLEN7M_20110809_080004_25.fit.gz).
+    :param archive: Base URL of the archive.
+    :returns: URL of the file.
+    """
+    info = parse_filename(filename)
+    if info is None:
+        error_message = f"{filename} does not follow the e-Callisto naming "
+        error_message += "convention (e.g., BLEN7M_20110809_080004_25.fit.gz)."
+        raise ValueError(error_message)
+
+    return day_url(info.start, archive) + filename
+
+
+def day_url(day: date, archive: str = ECALLISTO_ARCHIVE) -> str:
+    """Get the URL of the archive directory holding the files of a day.
+
+    :param day: The day (or any datetime within it).
+    :param archive: Base URL of the archive.
+    :returns: URL of the directory.
+    """
+    return f"{archive.rstrip('/')}/{day:%Y/%m/%d}/"
+
+
+def parse_listing(listing: str, url: str) -> List[ArchiveFile]:
+    """Parse the e-Callisto FITS files out of a directory listing (e.g., an
+    Apache index page).
+
+    :param listing: HTML of the listing.
+    :param url: URL of the listed directory.
+    :returns: The files, sorted by name.
+    """
+    files = []
+    for href in sorted(set(LISTING_HREF.findall(listing))):
+        name = unquote(href)
+        info = parse_filename(name)
+        if info is not None:
+            files.append(ArchiveFile(urljoin(url, href), name, *info))
+
+    return files
+
+
+class _HostLimits(object):
+    """Concurrency and request rate limits of a single host."""
+
+    def __init__(self, connections: int, rate: Optional[float]):
+        self.semaphore = asyncio.Semaphore(connections)
+        self.interval = 1 / rate if rate else 0.0  # Seconds between requests
+        self.next_request = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        """Wait until the rate limit allows another request."""
+        if not self.interval:
+            return
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            delay = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ArchiveDownloader(object):
+    """Downloads files from the e-Callisto archive (or any HTTP server)
+    over a bounded pool of connections.
+
+    Files are streamed to a `<name>.part` file, which is renamed once it is
+    complete, so an interrupted download is resumed with an HTTP Range
+    request instead of being started over. The ETag of every file is kept
+    in a `<name>.etag` file next to it, so files that are already present
+    and did not change on the server are skipped. The ETag of a partial
+    download is kept in `<name>.part.etag` until it is complete.
+    """
+
+    def __init__(
+        self,
+        folder: Union[str, Path] = "",
+        max_connections: int = 16,
+        per_host: int = 4,
+        rate: Optional[float] = None,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+        chunk_size: int = 1 << 16,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        """
+        :param folder: Directory where the files are saved.
+        :param max_connections: Maximum number of concurrent downloads.
+        :param per_host: Maximum number of concurrent downloads per host.
+        :param rate: Maximum number of requests per second per host.
+        :param retries: Number of times a failed download is retried.
+        :param backoff: Seconds to wait before the first retry, doubled on
+        every following one.
+        :param timeout: Network timeout, in seconds.
+        :param chunk_size: Size, in bytes, of the chunks written at a time.
+        :param client: Optional client to use instead of creating one.
+        """
+        self.folder = Path(folder)
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.client = client
+        self._own_client = client is None
+        self._hosts: Dict[str, _HostLimits] = {}
+
+    async def __aenter__(self) -> "ArchiveDownloader":
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=self.timeout,
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._own_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def fetch(self, url: str, filename: str = "") -> DownloadResult:
+        """Download a single file, retrying on network errors and on
+        transient HTTP errors.
+
+        :param url: URL of the file.
+        :param filename: Name to save the file as. Defaults to the last
+        part of the URL's path.
+        :returns: The outcome of the download.
+        """
+        path = self.folder / (filename or unquote(Path(urlparse(url).path).name))
+        try:
+            return await self._with_retries(url, lambda: self._fetch(url, path))
+        except (httpx.HTTPError, DownloadError) as e:
+            return DownloadResult(url, path, "failed", 0, str(e) or type(e).__name__)
+
+    async def fetch_all(self, urls: Iterable[str]) -> List[DownloadResult]:
+        """Download many files, at most `max_connections` at a time.
+
+        :param urls: URLs of the files.
+        :returns: The outcome of every download, in the order of `urls`.
+        """
+        return await self._map(self.fetch, urls)
+
+    async def _map(self, function, items: Iterable) -> list:
+        """Await `function` on every item, at most `max_connections` at a
+        time, and return the results in the order of `items`.
+        """
+        items = list(items)
+        results = [None] * len(items)
+        # The workers share a single iterator, so no more than
+        # max_connections requests are ever pending at once.
+        tasks = iter(enumerate(items))
+
+        async def worker():
+            for index, item in tasks:
+                results[index] = await function(item)
+
+        workers = min(self.max_connections, len(items))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        return results
+
+    async def _with_retries(self, url: str, request):
+        """Await `request()` within the limits of the URL's host, retrying
+        it on network errors and on transient HTTP errors.
+        """
+        netloc = urlparse(url).netloc
+        host = self._hosts.get(netloc)
+        if host is None:
+            host = self._hosts[netloc] = _HostLimits(self.per_host, self.rate)
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                async with host.semaphore:
+                    await host.wait()
+                    return await request()
+            except httpx.HTTPStatusError as e:
+                if (
+                    e.response.status_code not in RETRY_STATUS
+                    or attempt == self.retries
+                ):
+                    raise
+            except (httpx.TransportError, DownloadError):
+                if attempt == self.retries:
+                    raise
+
+    async def _fetch(self, url: str, path: Path) -> DownloadResult:
+        part_path = path.with_name(path.name + ".part")
+        # ETags of the downloaded file and of the partial download, which is
+        # only given to the file once the download is complete
+        etag_path = path.with_name(path.name + ".etag")
+        part_etag_path = path.with_name(part_path.name + ".etag")
+        # Ask for the raw bytes, so that Range offsets match the file's
+        headers = {"Accept-Encoding": "identity"}
+
+        offset = 0
+        if part_path.is_file():
+            # Resume the download, whether of a new file or of an update
+            offset = part_path.stat().st_size
+            headers["Range"] = f"bytes={offset}-"
+            if part_etag_path.is_file():
+                # Send the whole file instead if it changed in the meantime
+                headers["If-Range"] = part_etag_path.read_text()
+        elif path.is_file():
+            if etag_path.is_file():
+                headers["If-None-Match"] = etag_path.read_text()
+            else:
+                response = await self.client.head(url, headers=headers)
+                response.raise_for_status()
+                size = response.headers.get("Content-Length")
+                if size is not None and int(size) == path.stat().st_size:
+                    return DownloadResult(url, path, "skipped", 0)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return DownloadResult(url, path, "skipped", 0)
+            if response.status_code == 416:
+                # The partial file does not match the one on the server
+                part_path.unlink()
+                part_etag_path.unlink(missing_ok=True)
+                raise DownloadError(f"{url} could not be resumed.")
+            response.raise_for_status()
+
+            if response.status_code != 206:
+                offset = 0
+            elif not response.headers.get("Content-Range", "").startswith(
+                f"bytes {offset}-"
+            ):
+                part_path.unlink()
+                part_etag_path.unlink(missing_ok=True)
+                raise DownloadError(f"{url} was resumed at the wrong offset.")
+            if "ETag" in response.headers:
+                part_etag_path.write_text(response.headers["ETag"])
+            else:
+                part_etag_path.unlink(missing_ok=True)
+
+            size = response.headers.get("Content-Length")
+            received = 0
+            async with aiofiles.open(part_path, "ab" if offset else "wb") as f:
+                async for chunk in response.aiter_raw(self.chunk_size):
+                    await f.write(chunk)
+                    received += len(chunk)
+
+        if size is not None and received != int(size):
+            error_message = f"{url} ended after {received} of {size} bytes."
+            raise DownloadError(error_message)
+        os.replace(part_path, path)
+        if part_etag_path.is_file():
+            os.replace(part_etag_path, etag_path)
+        else:
+            etag_path.unlink(missing_ok=True)
+
+        return DownloadResult(
+            url, path, "resumed" if offset else "downloaded", received
+        )
+
+
+class ArchiveCrawler(ArchiveDownloader):
+    """Lists the FITS files the archive holds for given days.
+
+    Listings are kept in a local cache, along with their ETag and
+    Last-Modified date, and are revalidated with conditional requests, so
+    the listing of a day is only downloaded again when it changed.
+    """
+
+    def __init__(
+        self,
+        archive: str = ECALLISTO_ARCHIVE,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_age: Optional[float] = None,
+        **kwargs,
+    ):
+        """
+        :param archive: Base URL of the archive.
+        :param cache_dir: Directory of the listing cache. Listings are not
+        cached if it is not given.
+        :param max_age: Age, in seconds, under which cached listings are
+        used without being revalidated. Defaults to always revalidating.
+        :param kwargs: Keyword arguments passed on to ArchiveDownloader
+        (e.g., max_connections, per_host, rate or retries).
+        """
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_age = max_age
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    async def list_day(self, day: date) -> List[ArchiveFile]:
+        """List the FITS files of a day.
+
+        :param day: The day.
+        :returns: The files, sorted by name (empty if the archive has no
+        directory for the day).
+        """
+        url = day_url(day, self.archive)
+        return await self._with_retries(url, lambda: self._list(url))
+
+    async def list_days(self, days: Iterable[date]) -> Dict[date, List[ArchiveFile]]:
+        """List the FITS files of many days, at most `max_connections`
+        listings at a time.
+
+        :param days: The days.
+        :returns: The files of every day, sorted by name.
+        """
+        days = list(days)
+        listings = await self._map(self.list_day, days)
+
+        return dict(zip(days, listings))
+
+    async def _list(self, url: str) -> List[ArchiveFile]:
+        cache_path = self._cache_path(url)
+        cached = None
+        if cache_path is not None and cache_path.is_file():
+            cached = json.loads(cache_path.read_text())
+
+        headers = {}
+        if cached is not None:
+            if self.max_age is not None and time.time() - cached["time"] < self.max_age:
+                return parse_listing(cached["listing"], url)
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = await self.client.get(url, headers=headers)
+        if response.status_code == 304:
+            listing = cached["listing"]
+        elif response.status_code == 404:
+            return []
+        else:
+            response.raise_for_status()
+            listing = response.text
+        if cache_path is not None:
+            cached = {
+                "etag": response.headers.get("ETag", cached and cached["etag"]),
+                "last_modified": response.headers.get(
+                    "Last-Modified", cached and cached["last_modified"]
+                ),
+                "time": time.time(),
+                "listing": listing,
+            }
+            # Write to a temporary file first, so that concurrent readers
+            # never see a partially written listing.
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(cached))
+            os.replace(tmp_path, cache_path)
+
+        return parse_listing(listing, url)
+
+    def _cache_path(self, url: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / (
+            hashlib.blake2b(url.encode(), digest_size=16).hexdigest() + ".json"
+        )
+
+
+def download(
+    urls: Iterable[str], folder: Union[str, Path] = "", **kwargs
+) -> List[DownloadResult]:
+    """Download many files with an ArchiveDownloader.
+
+    :param urls: URLs of the files (see archive_url).
+    :param folder: Directory where the files are saved.
+    :param kwargs: Keyword arguments passed on to ArchiveDownloader.
+    :returns: The outcome of every download, in the order of `urls`.
+    """
+
+    async def fetch_all():
+        async with ArchiveDownloader(folder, **kwargs) as downloader:
+            return await downloader.fetch_all(urls)
+
+    return asyncio.run(fetch_all())
+
+
+def crawl(days: Iterable[date], **kwargs) -> Dict[date, List[ArchiveFile]]:
+    """List the FITS files of many days with an ArchiveCrawler.
+
+    :param days: The days.
+    :param kwargs: Keyword arguments passed on to ArchiveCrawler.
+    :returns: The files of every day, sorted by name.
+    """
+
+    async def list_days():
+        async with ArchiveCrawler(**kwargs) as crawler:
+            return await crawler.list_days(days)
+
+    return asyncio.run(list_days())
@@ -0,0 +1,223 @@
+# FitsBackground: Streaming background estimation for e-Callisto spectrograms
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Decibels between two consecutive digits of e-Callisto's 8-bit image data
+DB_PER_DIGIT = 2500.0 / 255.0 / 25.4
+
+
+class ChannelHistogram(object):
+    """Per-channel histogram of decibel values.
+
+    Values are binned in steps of `step` dB, which by default is the
+    resolution of the 8-bit digits the decibels were decoded from, so the
+    medians it gives are those of the binned values. Its memory use only
+    depends on the number of channels and bins, not on the number of
+    samples added to it.
+    """
+
+    def __init__(self, rows: int, step: float = DB_PER_DIGIT, levels: int = 256):
+        self.step = step  # Width of the bins, in dB
+        self.levels = levels  # Number of bins per channel
+        self.counts = np.zeros((rows, levels), dtype=np.int64)
+
+    def histogram(self, db: np.ndarray) -> np.ndarray:
+        """Bin a (channels x time) array of decibels, without adding it.
+
+        :param db: Array of decibels, with one row per channel.
+        :returns: Array of counts, with one row per channel.
+        """
+        rows, levels = self.counts.shape
+        bins = np.rint(db / self.step)
+        np.clip(bins, 0, levels - 1, out=bins)
+        bins = bins.astype(np.intp)
+        bins += (np.arange(rows) * levels)[:, np.newaxis]
+
+        return np.bincount(bins.ravel(), minlength=rows * levels).reshape(rows, levels)
+
+    def add(self, db: np.ndarray) -> np.ndarray:
+        """Add a (channels x time) array of decibels to the histogram.
+
+        :param db: Array of decibels, with one row per channel.
+        :returns: Counts of the added values, which can be given to
+        `remove` later on.
+        """
+        counts = self.histogram(db)
+        self.counts += counts
+
+        return counts
+
+    def remove(self, counts: np.ndarray):
+        """Remove counts previously returned by `add`."""
+        self.counts -= counts
+
+    def merge(self, other: "ChannelHistogram"):
+        """Add the counts of another histogram (e.g., built by another
+        worker) to this one.
+        """
+        self.counts += other.counts
+
+    def median(self) -> np.ndarray:
+        """Get the median of every channel, shaped as a column so that it
+        can be subtracted straight from a (channels x time) array.
+
+        :returns: Array of medians (NaN for channels without values).
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1:]
+        # Indices of the bins holding the two middle values of each channel
+        lower = np.sum(cumulative <= (total - 1) // 2, axis=1)
+        upper = np.sum(cumulative <= total // 2, axis=1)
+        median = (lower + upper) / 2 * self.step
+        median[total[:, 0] == 0] = np.nan
+
+        return median.astype(np.float32)[:, np.newaxis]
+
+
+def channel_median(chunks: Iterable[np.ndarray], **kwargs) -> np.ndarray:
+    """Estimate the median of every channel over a stream of chunks.
+
+    :param chunks: (channels x time) arrays of decibels, e.g., the ones of
+    consecutive FITS files.
+    :param kwargs: Keyword arguments passed on to ChannelHistogram.
+    :returns: Column of medians, one per channel.
+    """
+    histogram = None
+    for chunk in chunks:
+        if histogram is None:
+            histogram = ChannelHistogram(chunk.shape[0], **kwargs)
+        histogram.add(chunk)
+    if histogram is None:
+        raise ValueError("At least one chunk is needed to estimate a median.")
+
+    return histogram.median()
+
+
+class RunningBackground(object):
+    """Sliding-window background subtraction over a stream of chunks.
+
+    The background of every chunk is the per-channel median over a window
+    of about `window` columns centered on it. Only the histograms of the
+    chunks in the window and the chunks that still wait for the second
+    half of their window are kept in memory.
+    """
+
+    def __init__(self, window: int, **kwargs):
+        """
+        :param window: Width of the window, in columns (time samples).
+        :param kwargs: Keyword arguments passed on to ChannelHistogram.
+        """
+        self.window = window
+        self._kwargs = kwargs
+        self._histogram = None
+        self._blocks = deque()  # (columns, counts) of the chunks in the window
+        self._pending = deque()  # Chunks that were not subtracted yet
+        self._columns_ahead = 0  # Columns added after the first pending chunk
+
+    def push(self, chunk: np.ndarray) -> List[np.ndarray]:
+        """Add a chunk to the stream.
+
+        :param chunk: (channels x time) array of decibels.
+        :returns: Background-subtracted chunks that became ready, in order.
+        """
+        if self._histogram is None:
+            self._histogram = ChannelHistogram(chunk.shape[0], **self._kwargs)
+        self._blocks.append((chunk.shape[1], self._histogram.add(chunk)))
+        if self._pending:
+            self._columns_ahead += chunk.shape[1]
+        self._pending.append(chunk)
+
+        ready = []
+        while self._pending and self._columns_ahead >= self.window // 2:
+            ready.append(self._subtract_next())
+
+        return ready
+
+    def flush(self) -> List[np.ndarray]:
+        """Subtract the background of the chunks still waiting for the end
+        of their window, at the end of the stream.
+
+        :returns: Background-subtracted chunks, in order.
+        """
+        ready = []
+        while self._pending:
+            ready.append(self._subtract_next())
+
+        return ready
+
+    def _subtract_next(self) -> np.ndarray:
+        chunk = self._pending.popleft()
+        behind = sum(columns for columns, _ in self._blocks)
+        behind -= chunk.shape[1] + self._columns_ahead
+        if self._pending:
+            self._columns_ahead -= self._pending[0].shape[1]
+
+        # Drop the blocks that ended more than half a window before the
+        # chunk, keeping those that make up the first half of its window.
+        while self._blocks and behind - self._blocks[0][0] >= self.window // 2:
+            columns, counts = self._blocks.popleft()
+            self._histogram.remove(counts)
+            behind -= columns
+
+        return chunk - self._histogram.median()
+
+
+def subtract_background(
+    chunks: Iterable[np.ndarray], window: int, **kwargs
+) -> Iterator[np.ndarray]:
+    """Subtract a sliding-window per-channel median from a stream of chunks.
+
+    :param chunks: (channels x time) arrays of decibels, in time order.
+    :param window: Width of the window, in columns (time samples).
+    :param kwargs: Keyword arguments passed on to ChannelHistogram.
+    :returns: Iterator over the background-subtracted chunks.
+    """
+    running = RunningBackground(window, **kwargs)
+    for chunk in chunks:
+        yield from running.push(chunk)
+    yield from running.flush()
+
+
+def remove_background(db: np.ndarray, window: Optional[int] = None) -> np.ndarray:
+    """Subtract the background of a (channels x time) array of decibels.
+
+    :param db: Array of decibels, with one row per channel.
+    :param window: Width, in columns, of the running median to subtract.
+    If not given, the median of every whole channel is subtracted.
+    :returns: Background-subtracted array of decibels.
+    """
+    if window is None:
+        return db - np.median(db, axis=1, keepdims=True)
+
+    # The subtracted blocks are written into the result as they come, rather
+    # than joined at the end, which would need a second array of its size
+    subtracted = np.empty(db.shape, dtype=np.result_type(db, np.float32))
+    blocks = np.array_split(db, max(1, 8 * db.shape[1] // window), axis=1)
+    start = 0
+    for block in subtract_background(blocks, window):
+        subtracted[:, start : start + block.shape[1]] = block
+        start += block.shape[1]
+
+    return subtracted
@@ -0,0 +1,353 @@
+# FitsBursts: Detection of solar radio bursts in e-Callisto spectrograms
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+from pathlib import Path, PurePath
+from typing import Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from .fitsbackground import RunningBackground
+from .fitsfile import ECallistoFitsFile
+
+
+class BurstEvent(NamedTuple):
+    """A burst (connected region above the threshold) of a spectrogram."""
+
+    start: float  # Time of the first column, in hours
+    end: float  # Time of the last column, in hours
+    freq_low: float  # Lowest frequency, in MHz
+    freq_high: float  # Highest frequency, in MHz
+    peak: float  # Highest value, in dB above the background
+    peak_time: float  # Time of the peak, in hours
+    peak_frequency: float  # Frequency of the peak, in MHz
+    drift: float  # Frequency drift rate, in MHz/s (NaN if unknown)
+    pixels: int  # Number of pixels above the threshold
+
+
+def label_runs(mask: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Label the 8-connected components of a (channels x time) mask.
+
+    The mask is split into runs of consecutive channels within a column,
+    and runs of adjacent columns that touch are then merged with a
+    vectorized union-find, so the work done in Python does not depend on
+    the size of the mask.
+
+    :param mask: Boolean array, with one row per channel.
+    :returns: Rows, columns and component labels (0, 1, ...) of the pixels
+    set in the mask, sorted by column and then by row.
+    """
+    rows = mask.shape[0]
+    pixel_columns, pixel_rows = np.nonzero(mask.T)
+    if pixel_rows.size == 0:
+        return pixel_rows, pixel_columns, np.zeros(0, dtype=np.intp)
+
+    # Split the pixels into runs of consecutive rows of a column
+    new_run = np.ones(pixel_rows.size, dtype=bool)
+    new_run[1:] = (pixel_columns[1:] != pixel_columns[:-1]) | (
+        pixel_rows[1:] != pixel_rows[:-1] + 1
+    )
+    run_of_pixel = np.cumsum(new_run) - 1
+    run_column = pixel_columns[new_run]
+    run_first = pixel_rows[new_run]
+    run_last = pixel_rows[np.append(new_run[1:], True)]
+
+    # Runs of the next column that touch a run (diagonals included) make up
+    # a contiguous range of run indices. Keys are spaced by more than the
+    # number of rows, so the ±1 of the diagonals never crosses a column.
+    spacing = rows + 2
+    first_keys = run_column * spacing + run_first
+    last_keys = run_column * spacing + run_last
+    next_column = (run_column + 1) * spacing
+    lo = np.searchsorted(last_keys, next_column + run_first - 1, side="left")
+    hi = np.searchsorted(first_keys, next_column + run_last + 1, side="right")
+    counts = np.maximum(hi - lo, 0)
+    u = np.repeat(np.arange(run_column.size), counts)
+    v = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    v += np.repeat(lo, counts)
+
+    # Union-find over the runs: hook the larger root of every edge onto the
+    # smaller one, then compress the paths, until every edge is settled.
+    parent = np.arange(run_column.size)
+    while True:
+        root_u, root_v = parent[u], parent[v]
+        unsettled = root_u != root_v
+        if not unsettled.any():
+            break
+        np.minimum.at(
+            parent,
+            np.maximum(root_u, root_v)[unsettled],
+            np.minimum(root_u, root_v)[unsettled],
+        )
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    _, labels = np.unique(parent, return_inverse=True)
+
+    return pixel_rows, pixel_columns, labels[run_of_pixel]
+
+
+def find_bursts(
+    db: np.ndarray,
+    time_axis: np.ndarray,
+    frequency: np.ndarray,
+    threshold: float = 3.0,
+    min_pixels: int = 20,
+) -> List[BurstEvent]:
+    """Find the bursts of a background-subtracted spectrogram.
+
+    :param db: Array of decibels above the background, with one row per
+    channel.
+    :param time_axis: Time of every column, in hours.
+    :param frequency: Frequency of every row, in MHz.
+    :param threshold: Decibels above the background a pixel needs to be
+    part of a burst.
+    :param min_pixels: Smallest number of pixels of a burst.
+    :returns: The bursts, sorted by start time.
+    """
+    rows, columns, labels = label_runs(db > threshold)
+
+    return _measure(db, time_axis, frequency, rows, columns, labels, min_pixels)
+
+
+def _measure(
+    db: np.ndarray,
+    time_axis: np.ndarray,
+    frequency: np.ndarray,
+    rows: np.ndarray,
+    columns: np.ndarray,
+    labels: np.ndarray,
+    min_pixels: int,
+    keep: Optional[np.ndarray] = None,
+) -> List[BurstEvent]:
+    """Measure the labelled components (all of them, or those for which
+    `keep` is True) of a spectrogram.
+    """
+    if labels.size == 0:
+        return []
+    components = labels.max() + 1
+    pixels = np.bincount(labels, minlength=components)
+    selected = pixels >= min_pixels
+    if keep is not None:
+        selected &= keep
+    if not selected.any():
+        return []
+
+    values = db[rows, columns].astype(np.float64)
+    channels = frequency[rows].astype(np.float64)
+
+    # Sort the pixels by component, and by value within a component, so
+    # that every component is a contiguous slice ending with its peak.
+    order = np.lexsort((values, labels))
+    starts = np.searchsorted(labels[order], np.arange(components))
+    ends = np.append(starts[1:], order.size)
+    peak = order[ends - 1]
+    first_column = np.minimum.reduceat(columns[order], starts)
+    last_column = np.maximum.reduceat(columns[order], starts)
+    freq_low = np.minimum.reduceat(channels[order], starts)
+    freq_high = np.maximum.reduceat(channels[order], starts)
+
+    # Seconds since the start of the component of every pixel
+    times = (time_axis[columns] - time_axis[first_column[labels]]) * 3600.0
+
+    # Drift rate: slope of the frequency of every channel of a component
+    # against the value-weighted mean time of the component in that channel.
+    keys, channel_of_pixel = np.unique(
+        labels * len(frequency) + rows, return_inverse=True
+    )
+    weights = np.bincount(channel_of_pixel, values)
+    channel_time = np.bincount(channel_of_pixel, values * times) / weights
+    channel_frequency = frequency[keys % len(frequency)].astype(np.float64)
+    channel_label = keys // len(frequency)
+    n = np.bincount(channel_label, minlength=components)
+    st = np.bincount(channel_label, channel_time, components)
+    sf = np.bincount(channel_label, channel_frequency, components)
+    stt = np.bincount(channel_label, channel_time**2, components)
+    stf = np.bincount(channel_label, channel_time * channel_frequency, components)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = n * stt - st**2
+        drift = np.where(
+            (n > 1) & (denominator > 1e-9 * n**2),
+            (n * stf - st * sf) / denominator,
+            np.nan,
+        )
+
+    return sorted(
+        BurstEvent(
+            float(time_axis[first_column[i]]),
+            float(time_axis[last_column[i]]),
+            float(freq_low[i]),
+            float(freq_high[i]),
+            float(values[peak[i]]),
+            float(time_axis[columns[peak[i]]]),
+            float(channels[peak[i]]),
+            float(drift[i]),
+            int(pixels[i]),
+        )
+        for i in np.flatnonzero(selected)
+    )
+
+
+class BurstDetector(object):
+    """Finds bursts over a stream of consecutive spectrogram chunks.
+
+    Bursts that reach the end of a chunk are kept open, along with the
+    columns they span, and are only reported once a later chunk shows
+    where they end. At most `max_carry` columns are carried over, so a
+    channel that stays above the threshold (e.g., because of
+    interference) cannot make the detector hold on to the whole stream.
+    """
+
+    def __init__(
+        self,
+        frequency: np.ndarray,
+        threshold: float = 3.0,
+        min_pixels: int = 20,
+        max_carry: int = 3600,
+    ):
+        """
+        :param frequency: Frequency of every row, in MHz.
+        :param threshold: Decibels above the background a pixel needs to be
+        part of a burst.
+        :param min_pixels: Smallest number of pixels of a burst.
+        :param max_carry: Largest number of columns carried over to the
+        next chunk. Bursts longer than that are split.
+        """
+        self.frequency = np.asarray(frequency)
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.max_carry = max_carry
+        self._db = None  # Columns carried over from the previous chunks
+        self._time_axis = None
+
+    def push(self, db: np.ndarray, time_axis: np.ndarray) -> List[BurstEvent]:
+        """Add a chunk to the stream.
+
+        :param db: Array of decibels above the background, with one row per
+        channel.
+        :param time_axis: Time of every column, in hours.
+        :returns: The bursts that ended, sorted by start time.
+        """
+        if self._db is not None:
+            db = np.concatenate((self._db, db), axis=1)
+            time_axis = np.concatenate((self._time_axis, time_axis))
+        rows, columns, labels = label_runs(db > self.threshold)
+
+        # Carry over every column from the start of the first burst that is
+        # still open, extending the cut to bursts that straddle it.
+        cut = db.shape[1]
+        if labels.size:
+            components = labels.max() + 1
+            first_column = np.full(components, db.shape[1])
+            last_column = np.full(components, -1)
+            np.minimum.at(first_column, labels, columns)
+            np.maximum.at(last_column, labels, columns)
+            is_open = last_column == db.shape[1] - 1
+            if is_open.any():
+                cut = first_column[is_open].min()
+                while True:
+                    straddling = (first_column < cut) & (last_column >= cut)
+                    if not straddling.any():
+                        break
+                    cut = first_column[straddling].min()
+            if db.shape[1] - cut > self.max_carry:
+                cut = db.shape[1]
+            keep = last_column < cut
+        else:
+            keep = None
+
+        events = _measure(
+            db, time_axis, self.frequency, rows, columns, labels, self.min_pixels, keep
+        )
+        if cut < db.shape[1]:
+            self._db = db[:, cut:].copy()
+            self._time_axis = time_axis[cut:].copy()
+        else:
+            self._db = self._time_axis = None
+
+        return events
+
+    def flush(self) -> List[BurstEvent]:
+        """Report the bursts still open at the end of the stream.
+
+        :returns: The bursts, sorted by start time.
+        """
+        if self._db is None:
+            return []
+        events = find_bursts(
+            self._db, self._time_axis, self.frequency, self.threshold, self.min_pixels
+        )
+        self._db = self._time_axis = None
+
+        return events
+
+
+def detect_bursts(
+    files: Iterable[Union[str, PurePath, ECallistoFitsFile]],
+    background_window: Optional[int] = None,
+    **kwargs
+) -> List[BurstEvent]:
+    """Find the bursts of consecutive FITS files (e.g., a whole day of a
+    station), decoding a single file at a time.
+
+    :param files: ECallistoFitsFile instances, paths to FITS files or names
+    of FITS files, in time order.
+    :param background_window: Width, in columns, of the running median
+    subtracted as background. If not given, the median of every channel
+    of each file is subtracted.
+    :param kwargs: Keyword arguments passed on to BurstDetector.
+    :returns: The bursts, sorted by start time.
+    """
+    detector = None
+    background = RunningBackground(background_window) if background_window else None
+    time_axes = []  # Time axes of the chunks waiting for their background
+    events = []
+
+    def push(chunks):
+        for chunk in chunks:
+            events.extend(detector.push(chunk, time_axes.pop(0)))
+
+    for fits in files:
+        if not isinstance(fits, ECallistoFitsFile):
+            filepath = Path(fits)
+            if filepath.is_file():
+                fits = ECallistoFitsFile(filepath.name, filepath)
+            else:
+                fits = ECallistoFitsFile(fits)
+        dataset = fits.hdul_dataset
+        if detector is None:
+            detector = BurstDetector(dataset["f0"], **kwargs)
+        db = fits.read_db()
+        time_axes.append(dataset["time_axis"])
+        if background is None:
+            push([db - np.median(db, axis=1, keepdims=True)])
+        else:
+            push(background.push(db))
+
+    if detector is None:
+        return []
+    if background is not None:
+        push(background.flush())
+    events.extend(detector.flush())
+
+    return events
@@ -0,0 +1,171 @@
+# FitsCache: On-disk cache of decoded e-Callisto spectrograms
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+from astropy.io import fits
+
+
+class CachedSpectrogram(NamedTuple):
+    """Decoded spectrogram read back from a SpectrogramCache."""
+
+    header: fits.Header
+    time: np.ndarray
+    frequency: np.ndarray
+    db: np.ndarray
+
+
+class SpectrogramCache(object):
+    """On-disk cache of decoded e-Callisto spectrograms.
+
+    Every entry is a directory holding the primary header and uncompressed
+    .npy files for the time and frequency axes and the array of decibels.
+    Entries are keyed by the content hash and modification time of the
+    source FITS file and are read back as memory maps, so a hit neither
+    decompresses the FITS file nor copies the arrays. Once the cache grows
+    over `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int = 2**30):
+        self.cache_dir = Path(cache_dir)  # Directory holding the entries
+        self.max_bytes = max_bytes  # Size cap of the cache, in bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, filepath: Union[str, Path], block_size: int = 1 << 20) -> str:
+        """Get the cache key of a FITS file.
+
+        :param filepath: Path to the FITS file.
+        :param block_size: size, in bytes, of file chunks to be read
+        at a time.
+        :returns: hex string made from the file's content hash and mtime.
+        """
+        file_hash = hashlib.blake2b(digest_size=20)
+        with open(filepath, "rb") as f:
+            file_hash.update(str(os.fstat(f.fileno()).st_mtime_ns).encode())
+            while chunk := f.read(block_size):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def get(
+        self, filepath: Union[str, Path], key: Optional[str] = None
+    ) -> Optional[CachedSpectrogram]:
+        """Look up the decoded spectrogram of a FITS file.
+
+        :param filepath: Path to the FITS file.
+        :param key: Cache key of the FITS file, if already computed, so that
+        the file is not hashed again.
+        :returns: The cached spectrogram, or None on a cache miss.
+        """
+        entry = self.cache_dir / (key or self.key(filepath))
+        try:
+            header = fits.Header.fromtextfile(entry / "header.txt")
+            cached = CachedSpectrogram(
+                header,
+                np.load(entry / "time.npy", mmap_mode="r"),
+                np.load(entry / "frequency.npy", mmap_mode="r"),
+                np.load(entry / "db.npy", mmap_mode="r"),
+            )
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Mark the entry as the most recently used one
+        os.utime(entry)
+
+        return cached
+
+    def put(
+        self,
+        filepath: Union[str, Path],
+        header: fits.Header,
+        time: np.ndarray,
+        frequency: np.ndarray,
+        db: np.ndarray,
+        key: Optional[str] = None,
+    ):
+        """Store the decoded spectrogram of a FITS file.
+
+        :param filepath: Path to the FITS file.
+        :param header: Header of the FITS file's primary HDU.
+        :param time: Time column of the FITS file's binary table.
+        :param frequency: Frequency column of the FITS file's binary table.
+        :param db: Array of decibels decoded from the FITS file.
+        :param key: Cache key of the FITS file, if already computed (e.g., by
+        the get that missed), so that the file is not hashed again.
+        """
+        entry = self.cache_dir / (key or self.key(filepath))
+        if entry.is_dir():
+            return
+
+        # Write to a temporary directory first, so that concurrent readers
+        # never see a partially written entry.
+        tmp_entry = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        tmp_entry.mkdir(exist_ok=True)
+        header.totextfile(tmp_entry / "header.txt", overwrite=True)
+        np.save(tmp_entry / "time.npy", time)
+        np.save(tmp_entry / "frequency.npy", frequency)
+        np.save(tmp_entry / "db.npy", db)
+        try:
+            tmp_entry.rename(entry)
+        except OSError:
+            # Another process stored the same entry in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        self.evict()
+
+    def size(self) -> int:
+        """Get the total size of the cache entries, in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Remove the least recently used entries until the cache is no
+        larger than `max_bytes` (defaults to the cache's size cap).
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for entry, size, _ in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        self.evict(0)
+
+    def _entries(self):
+        """Yield the path, size and last use time of every cache entry."""
+        for entry in self.cache_dir.iterdir():
+            if not entry.is_dir() or entry.suffix == ".tmp":
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                last_used = entry.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            yield entry, size, last_used
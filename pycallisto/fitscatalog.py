@@ -0,0 +1,256 @@
+# FitsCatalog: Persistent index of e-Callisto FITS files
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+
+# e.g. BLEN7M_20110809_080004_25.fit.gz -> station, date, start time, focus code
+ECALLISTO_FILENAME = re.compile(
+    r"^(?P<station>.+)_(?P<date>\d{8})_(?P<time>\d{6})_(?P<focus_code>\d+)"
+    r"\.(?:fits?|fts)(?:\.gz)?$"
+)
+FITS_FILENAME = re.compile(r"\.(?:fits?|fts)(?:\.gz)?$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    station TEXT,
+    start TEXT,
+    focus_code TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE INDEX IF NOT EXISTS files_station_start ON files (station, start);
+"""
+
+
+class ECallistoFileInfo(NamedTuple):
+    """Fields encoded in an e-Callisto FITS filename."""
+
+    station: str
+    start: datetime
+    focus_code: str
+
+
+class CatalogEntry(NamedTuple):
+    """A FITS file indexed by a FitsCatalog."""
+
+    path: Path
+    station: str
+    start: datetime
+    focus_code: str
+
+
+def parse_filename(filename: str) -> Optional[ECallistoFileInfo]:
+    """Parse the station, start time and focus code out of an e-Callisto
+    FITS filename (e.g., BLEN7M_20110809_080004_25.fit.gz).
+
+    :param filename: Name of the FITS file.
+    :returns: The parsed fields, or None if the name does not follow the
+    e-Callisto naming convention.
+    """
+    match = ECALLISTO_FILENAME.match(Path(filename).name)
+    if match is None:
+        return None
+    try:
+        start = datetime.strptime(match["date"] + match["time"], "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+    return ECallistoFileInfo(match["station"], start, match["focus_code"])
+
+
+class FitsCatalog(object):
+    """Persistent on-disk index mapping FITS filenames to their paths.
+
+    The index is kept in an SQLite database. It is built by the first call
+    to `update` and every later call only rescans the directories whose
+    modification time has changed since they were last indexed.
+    """
+
+    def __init__(self, database: Union[str, Path]):
+        self.database = database  # Path to the SQLite database file
+        self._connection = sqlite3.connect(str(database))
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def update(self, top_dir: Union[str, Path] = ""):
+        """Index the FITS files found under `top_dir`.
+
+        :param top_dir: Root of the directory tree to index. Defaults to the
+        current working directory.
+        """
+        top_dir = str(Path(top_dir or os.getcwd()).resolve())
+        db = self._connection
+        with db:
+            db.execute(
+                "INSERT OR IGNORE INTO directories VALUES (?, NULL, NULL)", (top_dir,)
+            )
+            pending = [top_dir]
+            while pending:
+                directory = pending.pop()
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    self._forget_directory(directory)
+                    continue
+
+                (indexed_mtime_ns,) = db.execute(
+                    "SELECT mtime_ns FROM directories WHERE path = ?", (directory,)
+                ).fetchone()
+                if indexed_mtime_ns == mtime_ns:
+                    # Unchanged since the last update, only its subdirectories
+                    # may hold new files.
+                    pending.extend(self._subdirectories(directory))
+                    continue
+
+                pending.extend(self._scan_directory(directory))
+                db.execute(
+                    "UPDATE directories SET mtime_ns = ? WHERE path = ?",
+                    (mtime_ns, directory),
+                )
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        """Look up the path of an indexed FITS file.
+
+        :param filename: Name of the FITS file.
+        :returns: Path to the file, or None if it is not in the catalog.
+        """
+        for (path,) in self._connection.execute(
+            "SELECT path FROM files WHERE name = ? ORDER BY path", (str(filename),)
+        ):
+            if os.path.isfile(path):
+                return Path(path)
+
+        return None
+
+    def query(
+        self,
+        station: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        focus_code: Optional[str] = None,
+    ) -> List[CatalogEntry]:
+        """Get the files of a station whose start times fall between `start`
+        and `end` (both inclusive).
+
+        :param station: Name of the station (e.g., BLEN7M).
+        :param start: Earliest start time. Unbounded if not given.
+        :param end: Latest start time. Unbounded if not given.
+        :param focus_code: Only return files with this focus code.
+        :returns: Catalog entries sorted by start time.
+        """
+        sql = "SELECT path, station, start, focus_code FROM files WHERE station = ?"
+        params = [station]
+        if start is not None:
+            sql += " AND start >= ?"
+            params.append(start.isoformat(sep=" "))
+        if end is not None:
+            sql += " AND start <= ?"
+            params.append(end.isoformat(sep=" "))
+        if focus_code is not None:
+            sql += " AND focus_code = ?"
+            params.append(focus_code)
+        sql += " ORDER BY start, path"
+
+        return [
+            CatalogEntry(Path(path), station, datetime.fromisoformat(start), focus_code)
+            for path, station, start, focus_code in self._connection.execute(
+                sql, params
+            )
+        ]
+
+    def _subdirectories(self, directory: str) -> List[str]:
+        return [
+            path
+            for (path,) in self._connection.execute(
+                "SELECT path FROM directories WHERE parent = ?", (directory,)
+            )
+        ]
+
+    def _scan_directory(self, directory: str) -> List[str]:
+        """Re-index the files of `directory` and return its subdirectories."""
+        db = self._connection
+        subdirs = []
+        rows = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif FITS_FILENAME.search(entry.name) and entry.is_file():
+                    info = parse_filename(entry.name)
+                    if info is None:
+                        rows.append(
+                            (entry.path, entry.name, directory, None, None, None)
+                        )
+                    else:
+                        rows.append(
+                            (
+                                entry.path,
+                                entry.name,
+                                directory,
+                                info.station,
+                                info.start.isoformat(sep=" "),
+                                info.focus_code,
+                            )
+                        )
+
+        db.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        for removed in set(self._subdirectories(directory)).difference(subdirs):
+            self._forget_directory(removed)
+        db.executemany(
+            "INSERT OR IGNORE INTO directories VALUES (?, ?, NULL)",
+            [(subdir, directory) for subdir in subdirs],
+        )
+
+        return subdirs
+
+    def _forget_directory(self, directory: str):
+        """Drop a directory, and everything below it, from the index."""
+        for subdir in self._subdirectories(directory):
+            self._forget_directory(subdir)
+        self._connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        self._connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
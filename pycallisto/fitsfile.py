@@ -19,88 +19,436 @@
 # along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
 
 
+import collections.abc
 import fnmatch
 import os
 from pathlib import Path
+from typing import NamedTuple, Optional, Union
 
 import numpy as np
 from astropy.io import fits
 
 from pycallisto.fitserror import FitsFileError
+from pycallisto.fitsmetrics import stage
+from pycallisto.fitsspectrogram import Spectrogram
 
 
 class FitsFile(object):
     """Main entry point to the FITS file format."""
 
-    def __init__(self, filename, filepath=""):
+    def __init__(self, filename, filepath="", catalog=None, lazy=False):
         self.filename = filename  # Name of the FITS file
         if filepath:
             self.filepath = Path(filepath)  # Path to the FITS file
+        elif catalog is not None:
+            # Look the file up in the given pycallisto.fitscatalog.FitsCatalog
+            self.filepath = catalog.resolve(self.filename)
+            if self.filepath is None:
+                error_message = f"{self.filename} was not found in the FITS "
+                error_message += f"catalog ({catalog.database})."
+                raise FileNotFoundError(error_message)
         else:
             # Look for the file and set its path
             matches = []
             top_dir = os.getcwd()
-            for root, _, files in os.walk(top_dir):
-                for name in fnmatch.filter(files, self.filename):
-                    matches.append(os.path.join(root, name))
+            with stage("find", self.filename):
+                for root, _, files in os.walk(top_dir):
+                    for name in fnmatch.filter(files, self.filename):
+                        matches.append(os.path.join(root, name))
             if not matches:
                 error_message = f"{self.filename} was not found under the "
                 error_message += f"current working directory ({top_dir})."
                 raise FileNotFoundError(error_message)
             else:
                 self.filepath = Path(matches[0])
+        if lazy:
+            self.hdul = None  # Left for the caller to open when needed
+        else:
+            with stage("open", self.filename):
+                self.hdul = self.open()  # List of HDUs (Header Data Unit)
+
+    def open(self, **kwargs) -> fits.HDUList:
+        """Open the FITS file.
+
+        :param kwargs: Keyword arguments passed on to astropy.io.fits.open.
+        :returns: List of HDUs (Header Data Unit).
+        """
         try:
-            self.hdul = fits.open(self.filepath)  # List of HDUs
-            # (Header Data Unit)
+            return fits.open(self.filepath, **kwargs)
         except OSError:
             error_message = f"{self.filename} is not a valid FITS file "
             error_message += "(e.g., .fits, .fit, .fit.gz, .fts)"
             raise FitsFileError(error_message)
 
 
-class ECallistoFitsFile(FitsFile):
-    def __init__(self, filename, filepath=""):
-        FitsFile.__init__(self, filename, filepath)
-
-        # Extract the data from the FITS file Header Data Units
-        hdul_dataset = {}
-        hdul = self.hdul
-        header = hdul[0].header  # Header of the primary HDU
-        data = hdul[1].data  # Data of the first extension HDU
-        # Data of the primary HDU
-        hdul_dataset["data"] = hdul[0].data.astype(np.float32)
-        hdul_dataset["v_min"] = -1  # -0.5, 100
-        hdul_dataset["v_max"] = 8  # 4, 160
-        hdul_dataset["dref"] = hdul_dataset["data"] - np.min(hdul_dataset["data"])
-        # conversion digit->voltage->into db
-        hdul_dataset["db"] = self.digit_to_voltage(hdul_dataset["dref"]) / 25.4
-        hdul_dataset["db_median"] = np.median(hdul_dataset["db"], axis=1, keepdims=True)
-        hdul_dataset["hh"] = float(header["TIME-OBS"].split(":")[0])
-        hdul_dataset["mm"] = float(header["TIME-OBS"].split(":")[1])
-        hdul_dataset["ss"] = float(header["TIME-OBS"].split(":")[2])
-        hdul_dataset["time"] = data[0][0].astype(np.float32)
-        hdul_dataset["f0"] = data[0][1].astype(np.float32)
+class ECallistoDataset(dict):
+    """Dataset of an e-Callisto FITS file, filled in on demand.
+
+    It has the same keys, in the same order, as the dict that used to be
+    built eagerly by ECallistoFitsFile. The header values are set right
+    away, while the fields derived from the image data are only computed
+    (and then cached) the first time they are read.
+    """
+
+    FIELDS = (
+        "data",
+        "v_min",
+        "v_max",
+        "dref",
+        "db",
+        "db_median",
+        "hh",
+        "mm",
+        "ss",
+        "time",
+        "f0",
+        "frequency",
+        "start_time",
+        "rows",
+        "columns",
+        "dt",
+        "time_axis",
+        "freq_axis",
+    )
+    V_MIN = -1  # -0.5, 100
+    V_MAX = 8  # 4, 160
+
+    def __init__(self, header, time, frequency, read_image):
+        """
+        :param header: Header of the primary HDU.
+        :param time: Time column of the first extension HDU.
+        :param frequency: Frequency column of the first extension HDU.
+        :param read_image: Callable returning the primary HDU's image data.
+        """
+        super().__init__()
+        self.header = header
+        self.read_image = read_image
+
+        hh, mm, ss = header["TIME-OBS"].split(":")
+        fields = {}
+        fields["v_min"] = self.V_MIN
+        fields["v_max"] = self.V_MAX
+        fields["hh"] = float(hh)
+        fields["mm"] = float(mm)
+        fields["ss"] = float(ss)
+        fields["time"] = time.astype(np.float32)
+        fields["f0"] = frequency.astype(np.float32)
         # cut lower 10 channels:
-        hdul_dataset["frequency"] = hdul_dataset["f0"][:-10]
-        hdul_dataset["start_time"] = (
-            hdul_dataset["hh"] * 3600 + hdul_dataset["mm"] * 60 + hdul_dataset["ss"]
+        fields["frequency"] = fields["f0"][:-10]
+        fields["start_time"] = fields["hh"] * 3600 + fields["mm"] * 60 + fields["ss"]
+        fields["rows"] = header["NAXIS2"]
+        fields["columns"] = header["NAXIS1"]
+        fields["dt"] = fields["time"][1] - fields["time"][0]
+        self.update(fields)
+
+    def __missing__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        value = getattr(self, "_compute_" + key)()
+        self[key] = value
+
+        return value
+
+    def __iter__(self):
+        yield from self.FIELDS
+        for key in super().__iter__():
+            if key not in self.FIELDS:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in self.FIELDS or super().__contains__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return collections.abc.KeysView(self)
+
+    def items(self):
+        return collections.abc.ItemsView(self)
+
+    def values(self):
+        return collections.abc.ValuesView(self)
+
+    def is_loaded(self, key) -> bool:
+        """Check whether a field has already been computed."""
+        return super().__contains__(key)
+
+    def _compute_data(self):
+        # Data of the primary HDU
+        return self.read_image().astype(np.float32)
+
+    def _compute_dref(self):
+        return self["data"] - np.min(self["data"])
+
+    def _compute_db(self):
+        if self.is_loaded("dref"):
+            # conversion digit->voltage->into db
+            return ECallistoFitsFile.digit_to_voltage(self["dref"]) / 25.4
+
+        # Same values, looked up straight from the digits
+        digits = self.read_image()
+        with stage("decode") as measured:
+            db = ECallistoFitsFile.digits_to_db(digits)
+            measured.allocated(db)
+
+        return db
+
+    def _compute_db_median(self):
+        db = self["db"]
+        with stage("median") as measured:
+            median = np.median(db, axis=1, keepdims=True)
+            measured.allocated(median)
+
+        return median
+
+    def _compute_time_axis(self):
+        return (self["start_time"] + self["dt"] * np.arange(self["columns"])) / 3600
+
+    def _compute_freq_axis(self):
+        return np.linspace(self["frequency"][0], self["frequency"][-1], 3600)
+
+
+class ScaledDigits(NamedTuple):
+    """Image data of an e-Callisto FITS file kept as 8-bit digits, along
+    with the linear map to decibels: db = digits * scale + offset.
+    """
+
+    digits: np.ndarray
+    minimum: int  # Smallest digit of the image, which maps to 0 dB
+
+    @property
+    def scale(self) -> float:
+        return 2500.0 / 255.0 / 25.4
+
+    @property
+    def offset(self) -> float:
+        return -self.minimum * self.scale
+
+    def to_db(self, out: Optional[np.ndarray] = None, dtype=np.float32) -> np.ndarray:
+        """Convert the digits to decibels, as ECallistoFitsFile.read_db does."""
+        return ECallistoFitsFile.digits_to_db(self.digits, out, dtype, self.minimum)
+
+
+class ECallistoFitsFile(FitsFile):
+    def __init__(self, filename, filepath="", catalog=None, cache=None):
+        FitsFile.__init__(self, filename, filepath, catalog, lazy=True)
+
+        # Decoded spectrogram stored by a pycallisto.fitscache.SpectrogramCache
+        # The file is hashed once, for both the lookup and the store
+        cache_key = cache.key(self.filepath) if cache is not None else None
+        cached = cache.get(self.filepath, cache_key) if cache is not None else None
+        if cached is not None:
+            self.hdul_dataset = ECallistoDataset(
+                cached.header, cached.time, cached.frequency, self.read_image
+            )
+            self.hdul_dataset["db"] = cached.db
+            return
+
+        # Extract the header and the (small) binary table from the FITS file
+        # Header Data Units. The image data is only read from the file if
+        # one of the dataset fields derived from it is requested.
+        with stage("header", self.filename) as measured:
+            hdul = self.hdul = self.open()
+            header = hdul[0].header  # Header of the primary HDU
+            data = hdul[1].data  # Data of the first extension HDU
+            self.hdul_dataset = ECallistoDataset(
+                header, data[0][0], data[0][1], self.read_image
+            )
+
+            # Close the FITS file, the image data is read separately if needed
+            hdul.close()
+            measured.read(os.path.getsize(self.filepath))
+
+        if cache is not None:
+            cache.put(
+                self.filepath,
+                header,
+                data[0][0],
+                data[0][1],
+                self.hdul_dataset["db"],
+                cache_key,
+            )
+
+    @classmethod
+    def from_decoded(cls, filename, filepath, header, time, frequency, db=None):
+        """Create an ECallistoFitsFile from data that was already read from
+        the FITS file (e.g., by another process), without opening it again.
+
+        :param filename: Name of the FITS file.
+        :param filepath: Path to the FITS file.
+        :param header: Header of the primary HDU.
+        :param time: Time column of the first extension HDU.
+        :param frequency: Frequency column of the first extension HDU.
+        :param db: Optional array of decibels decoded from the image data.
+        :returns: The ECallistoFitsFile instance.
+        """
+        fitsfile = cls.__new__(cls)
+        fitsfile.filename = filename
+        fitsfile.filepath = Path(filepath)
+        fitsfile.hdul = None
+        fitsfile.hdul_dataset = ECallistoDataset(
+            header, time, frequency, fitsfile.read_image
         )
-        hdul_dataset["rows"] = hdul_dataset["data"].shape[0]
-        hdul_dataset["columns"] = hdul_dataset["data"].shape[1]
-        hdul_dataset["dt"] = hdul_dataset["time"][1] - hdul_dataset["time"][0]
-        hdul_dataset["time_axis"] = (
-            hdul_dataset["start_time"]
-            + hdul_dataset["dt"] * np.arange(hdul_dataset["columns"])
-        ) / 3600
-        hdul_dataset["freq_axis"] = np.linspace(
-            hdul_dataset["frequency"][0], hdul_dataset["frequency"][-1], 3600
+        if db is not None:
+            fitsfile.hdul_dataset["db"] = db
+
+        return fitsfile
+
+    def read_image(self) -> np.ndarray:
+        """Read the image data (digits) of the FITS file's primary HDU.
+
+        :returns: Array of digits.
+        """
+        with stage("read_image", self.filename) as measured:
+            with self.open(memmap=False) as hdul:
+                image = hdul[0].data
+            # The file is read, and decompressed, as a whole
+            measured.read(os.path.getsize(self.filepath))
+            measured.allocated(image)
+
+        return image
+
+    def read_db(
+        self,
+        out: Optional[np.ndarray] = None,
+        dtype=np.float32,
+        rows: Union[slice, np.ndarray] = slice(None),
+        columns: slice = slice(None),
+    ) -> np.ndarray:
+        """Decode the image data into an array of decibels, without keeping
+        the intermediate float arrays (or the result) in hdul_dataset.
+
+        :param out: Optional array, shaped like the image (or the part of
+        it given by `rows` and `columns`), in which the result is written.
+        :param dtype: Data type of the result (e.g., np.float16 to halve its
+        size), if `out` is not given.
+        :param rows: Rows (frequency channels) of the image to decode, as a
+        slice or as a boolean mask (e.g., from pycallisto.fitsrfi), in
+        which case the other rows are never converted.
+        :param columns: Columns (time samples) of the image to decode.
+        :returns: Array of decibels.
+        """
+        dataset = self.hdul_dataset
+        if dataset.is_loaded("db"):
+            db = dataset["db"][rows, columns]
+            if out is None:
+                return db.astype(dtype, copy=False)
+            out[...] = db
+            return out
+
+        # The minimum is taken over the whole image, so that a part of it
+        # is decoded to the same values as the whole.
+        digits = self.read_image()
+        with stage("decode", self.filename) as measured:
+            db = self.digits_to_db(digits[rows, columns], out, dtype, digits.min())
+            if out is None:
+                measured.allocated(db)
+
+        return db
+
+    def spectrogram(
+        self,
+        rows: Union[slice, np.ndarray] = slice(None),
+        columns: slice = slice(None),
+        dtype=np.float32,
+    ) -> Spectrogram:
+        """Get the spectrogram of the FITS file, with the frequency of every
+        row of the image. If hdul_dataset["db"] is already decoded, the
+        spectrogram views it (and its time axis) instead of copying it.
+
+        :param rows: Rows (frequency channels) of the image, as in read_db.
+        :param columns: Columns (time samples) of the image.
+        :param dtype: Data type of the array of decibels, if decoded here.
+        :returns: The spectrogram.
+        """
+        dataset = self.hdul_dataset
+
+        return Spectrogram(
+            self.read_db(dtype=dtype, rows=rows, columns=columns),
+            dataset["time_axis"][columns],
+            dataset["f0"][rows],
         )
 
-        # Update the instance's dataset
-        self.hdul_dataset = hdul_dataset
+    def read_scaled(self) -> ScaledDigits:
+        """Read the image data without converting it to decibels, which
+        keeps it at one byte per value.
+
+        :returns: The digits along with their scale and offset to decibels.
+        """
+        digits = self.read_image()
+
+        return ScaledDigits(digits, int(digits.min()))
+
+    @staticmethod
+    def db_table(minimum: int, dtype=np.float32) -> np.ndarray:
+        """Get the decibels of every 8-bit digit, for an image whose smallest
+        digit is `minimum`. The values are computed with the same float32
+        operations as hdul_dataset["db"], so they are identical to it.
+
+        :param minimum: Smallest digit of the image.
+        :param dtype: Data type of the table.
+        :returns: Lookup table of 256 decibel values.
+        """
+        table = np.arange(256, dtype=np.float32) - np.float32(minimum)
+        table = ECallistoFitsFile.digit_to_voltage(table) / 25.4
+
+        return table.astype(dtype, copy=False)
+
+    @staticmethod
+    def digits_to_db(
+        digits: np.ndarray,
+        out: Optional[np.ndarray] = None,
+        dtype=np.float32,
+        minimum: Optional[int] = None,
+    ) -> np.ndarray:
+        """Convert an image of digits to decibels, in a single pass over the
+        image and without temporary arrays.
+
+        :param digits: Array of digits obtained from a FITS file primary HDU data.
+        :param out: Optional array, shaped like the image, in which the
+        result is written.
+        :param dtype: Data type of the result, if `out` is not given.
+        :param minimum: Smallest digit of the image, if already known.
+        :returns: Array of decibels.
+        """
+        if minimum is None:
+            minimum = digits.min()
+        if out is None:
+            out = np.empty(digits.shape, dtype=dtype)
+        if digits.dtype == np.uint8:
+            table = ECallistoFitsFile.db_table(minimum, out.dtype)
+            # np.take converts the digits to intp indices (8 bytes each), so
+            # it is given a few rows at a time. Every uint8 digit is a valid
+            # index, and "clip" avoids the temporary copy np.take makes of
+            # `out` with its default mode.
+            step = max(1, (1 << 16) // max(1, digits[0].size if len(digits) else 1))
+            for row in range(0, len(digits), step):
+                np.take(
+                    table,
+                    digits[row : row + step],
+                    out=out[row : row + step],
+                    mode="clip",
+                )
+            return out
+
+        # Digits wider than 8 bits are converted with the same operations as
+        # hdul_dataset["db"], but done in place
+        db = out if out.dtype == np.float32 else np.empty(digits.shape, np.float32)
+        np.subtract(digits, np.float32(minimum), out=db, dtype=np.float32)
+        np.divide(db, 255.0, out=db)
+        np.multiply(db, 2500.0, out=db)
+        np.divide(db, 25.4, out=db)
+        if db is not out:
+            out[...] = db
 
-        # Close the FITS file that was opened on the parent class
-        hdul.close()
+        return out
 
     @staticmethod
     def digit_to_voltage(digits: np.ndarray) -> np.ndarray:
@@ -19,11 +19,16 @@
 # along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
 
 
-from matplotlib.figure import Figure
+import itertools
+from datetime import timedelta
+from pathlib import PurePath
+from typing import List, Sequence, Tuple, Union
 
 
 def figure_config(**kwargs):
     """Get optional keyword arguments related to plt.figure."""
+    from matplotlib.figure import Figure
+
     return {
         "figsize": kwargs.pop("figsize", None),
         "dpi": kwargs.pop("dpi", None),
@@ -45,3 +50,100 @@ def imshow_config(**kwargs):
         "cmap": kwargs.pop("cmap", "magma"),
         "aspect": kwargs.pop("aspect", "auto"),
     }
+
+
+def time_ticks(
+    locs: Sequence[float], start_hour: float, end_hour: float
+) -> Tuple[Sequence[float], List[str]]:
+    """Turn the x-axis tick locations of a plot, in hours, into "HH:MM" labels.
+
+    :param locs: Tick locations picked by matplotlib for the time axis.
+    :param start_hour: First value of the time axis, in hours.
+    :param end_hour: Last value of the time axis, in hours.
+    :returns: Tick locations to keep and their labels.
+    """
+    hours_xticks = []
+    for loc in locs:
+        hour = str(int(loc)) + ":" + str(int((loc - int(loc)) * 60))
+        if hour.split(":")[-1] == "0":
+            hour += "0"
+        if len(hour.split(":")[-1]) == 1:
+            hour = hour.split(":")[0] + ":0" + hour.split(":")[-1]
+        hours_xticks.append(hour)
+
+    initial_hour = timedelta(hours=round(start_hour, 2))
+
+    initial_seconds = initial_hour.seconds
+    initial_xticks_seconds = int(hours_xticks[0].split(":")[0]) * 3600
+    initial_xticks_seconds += int(hours_xticks[0].split(":")[-1]) * 60
+
+    if initial_seconds != initial_xticks_seconds:
+        hours_xticks.pop(0)
+        locs = locs[1:]
+
+    for index, item in enumerate(hours_xticks):
+        if len(item.split(":")[0]) == 1:
+            hours_xticks[index] = "0" + item
+
+    final_hour = timedelta(hours=round(end_hour, 2))
+    final_seconds = final_hour.seconds
+    final_xticks_seconds = int(hours_xticks[-1].split(":")[0]) * 3600
+    final_xticks_seconds += int(hours_xticks[-1].split(":")[-1]) * 60
+
+    if final_seconds != final_xticks_seconds:
+        hours_xticks.pop()
+        locs = locs[:-1]
+
+    if initial_xticks_seconds != initial_seconds:
+        last_minutes = int(hours_xticks[-1].split(":")[0]) * 60
+        last_minutes += int(hours_xticks[-1].split(":")[-1])
+        first_minutes = int(hours_xticks[0].split(":")[0]) * 60
+        first_minutes += int(hours_xticks[0].split(":")[-1])
+        minutes_delta = last_minutes - first_minutes
+        ticks_interval = int(round(minutes_delta / (len(locs) - 1), 0))
+        final_xticks = []
+        hour = timedelta(minutes=first_minutes)
+        final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
+
+        for _ in itertools.repeat(None, len(locs) - 1):
+            hour = hour + timedelta(minutes=ticks_interval)
+            final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
+
+    else:
+        hours_delta = round(end_hour, 2)
+        hours_delta -= round(start_hour, 2)
+        minutes_delta = hours_delta * 60
+        ticks_interval = int(round(minutes_delta / (len(locs) - 1), 0))
+        final_xticks = []
+        hour = initial_hour
+        final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
+
+        for _ in itertools.repeat(None, len(locs) - 1):
+            hour = hour + timedelta(minutes=ticks_interval)
+            final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
+
+    return locs, final_xticks
+
+
+def plot_title(filenames: Sequence[Union[str, PurePath]], end_hour: float) -> str:
+    """Get the title of a plot of consecutive FITS files, which is also
+    used as the name of the saved image.
+
+    :param filenames: Names of the plotted FITS files, in time order.
+    :param end_hour: Last value of the time axis, in hours.
+    :returns: Title of the plot.
+    """
+    final_hour = timedelta(hours=round(end_hour, 2))
+    final_hour_str = final_hour.__str__()
+    if len(final_hour_str.split(":")[0]) == 1:
+        final_hour_str = "0" + final_hour_str
+
+    first_fname = str(filenames[0])
+    last_fname = str(filenames[-1])
+    title_start = "_".join(first_fname.split("_")[:-1])
+    freq_band = last_fname.split("_")[-1].split(".")[0]
+    title_end = "".join(final_hour_str.split(":"))
+    title_end = "_".join([title_end, freq_band])
+    title = "_".join([title_start, title_end])
+
+    return title
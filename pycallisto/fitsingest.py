@@ -0,0 +1,242 @@
+# FitsIngest: Pipelined reading, decompression and decoding of FITS files
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import queue
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from astropy.io import fits
+
+from .fitserror import FitsFileError
+from .fitsfile import ECallistoFitsFile, FitsFile
+from .fitsmetrics import stage
+from .fitsscan import FitsStream, data_size, read_header, table_column
+
+# Big-endian NumPy types of the FITS image BITPIX values
+BITPIX_DTYPES = {8: "u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+
+_DONE = object()  # Marks the end of the files put in the read queue
+
+
+def read_file(filepath: Union[str, PurePath]) -> bytes:
+    """Read a whole (compressed) FITS file.
+
+    :param filepath: Path to the FITS file.
+    :returns: Contents of the file.
+    """
+    with stage("read", Path(filepath).name) as measured:
+        with open(filepath, "rb") as file:
+            raw = file.read()
+        measured.read(len(raw))
+
+    return raw
+
+
+def inflate(raw: bytes, filename: Optional[str] = None) -> bytes:
+    """Decompress the contents of a gzipped FITS file, in a single call to
+    zlib, which releases the GIL while inflating. Contents that are not
+    gzipped are returned as they are.
+
+    :param raw: Contents of the FITS file.
+    :param filename: Name of the FITS file, for the error messages.
+    :returns: Contents of the uncompressed FITS file.
+    """
+    if raw[:2] != b"\x1f\x8b":
+        return raw
+
+    with stage("inflate", filename):
+        try:
+            # Concatenated gzip members are inflated one after the other
+            data = []
+            while raw:
+                decompressor = zlib.decompressobj(31)
+                data.append(decompressor.decompress(raw))
+                raw = decompressor.unused_data
+        except zlib.error as error:
+            error_message = f"{filename} could not be decompressed ({error})."
+            raise FitsFileError(error_message)
+
+    return data[0] if len(data) == 1 else b"".join(data)
+
+
+def parse(data: bytes) -> Tuple[fits.Header, np.ndarray, np.ndarray, np.ndarray]:
+    """Parse the primary HDU and the binary table of an uncompressed
+    e-Callisto FITS file held in memory.
+
+    :param data: Contents of the uncompressed FITS file.
+    :returns: Header of the primary HDU, its image data (a read-only view
+    of `data`), and the time and frequency columns of the binary table.
+    """
+    file = io.BytesIO(data)
+    stream = FitsStream(file)
+    try:
+        primary = read_header(stream)
+        header_size = file.tell()
+        shape = (primary["NAXIS2"], primary["NAXIS1"])
+        image = np.frombuffer(
+            data, BITPIX_DTYPES[primary["BITPIX"]], shape[0] * shape[1], header_size
+        ).reshape(shape)
+        if primary.get("BSCALE", 1) != 1 or primary.get("BZERO", 0) != 0:
+            image = image * primary.get("BSCALE", 1.0) + primary.get("BZERO", 0.0)
+
+        stream.skip(data_size(primary))
+        extension = read_header(stream)
+        table = stream.read(extension["NAXIS1"])
+        time = table_column(extension, table, "TIME")
+        frequency = table_column(extension, table, "FREQUENCY")
+    except (KeyError, ValueError) as error:
+        raise FitsFileError(f"Not a valid e-Callisto FITS file ({error!r}).")
+    header = fits.Header.fromstring(data[:header_size].decode("ascii"))
+
+    return header, image, time, frequency
+
+
+def decode(data: bytes, filename: str, filepath: Union[str, PurePath]):
+    """Turn the contents of an uncompressed FITS file into an
+    ECallistoFitsFile, with its array of decibels already decoded.
+
+    :param data: Contents of the uncompressed FITS file.
+    :param filename: Name of the FITS file.
+    :param filepath: Path to the FITS file.
+    :returns: The ECallistoFitsFile instance.
+    """
+    with stage("decode", filename) as measured:
+        try:
+            header, image, time, frequency = parse(data)
+        except FitsFileError as error:
+            raise FitsFileError(f"{filename}: {error}")
+        if image.dtype == np.uint8:
+            db = ECallistoFitsFile.digits_to_db(image)
+        else:
+            # Same conversion as the dataset's "dref" and "db" fields
+            dref = image.astype(np.float32) - np.min(image)
+            db = ECallistoFitsFile.digit_to_voltage(dref) / 25.4
+        measured.allocated(db)
+
+    return ECallistoFitsFile.from_decoded(
+        filename, filepath, header, time, frequency, db
+    )
+
+
+def _inflate_and_decode(raw: bytes, filepath: Path) -> ECallistoFitsFile:
+    return decode(inflate(raw, filepath.name), filepath.name, filepath)
+
+
+def _read_ahead(filepaths: List[Path], read_queue: queue.Queue, stop: threading.Event):
+    """Read the files, in order, into a bounded queue, until all files are
+    read or `stop` is set. Errors are put in the queue in place of the
+    contents of the file."""
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                read_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    for filepath in filepaths:
+        try:
+            raw = read_file(filepath)
+        except OSError as error:
+            raw = error
+        if not put((filepath, raw)):
+            return
+    put(_DONE)
+
+
+def ingest(
+    files: Iterable[Union[str, PurePath]],
+    workers: Optional[int] = None,
+    prefetch: int = 8,
+    catalog=None,
+) -> Iterator[ECallistoFitsFile]:
+    """Load many FITS files through a pipeline of stages running at the
+    same time: a thread reads the files ahead, into a bounded queue, while
+    a pool of threads inflates (zlib releases the GIL) and decodes the
+    files read so far. Reading and decompressing overlap, so the pipeline
+    is about as fast as the slower of the disk and the processors.
+
+    :param files: Paths to the FITS files, or names of FITS files to be
+    looked for as ECallistoFitsFile does.
+    :param workers: Number of decompressing and decoding threads. Defaults
+    to the number of processors on the machine.
+    :param prefetch: Number of files read ahead of the decoding threads.
+    :param catalog: Optional pycallisto.fitscatalog.FitsCatalog to look
+    the files given by name up in.
+    :returns: Iterator over the ECallistoFitsFile instances, with their
+    arrays of decibels decoded, in the order of `files`.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Names are looked up here, the catalog can't be used by the reader thread
+    filepaths = [
+        (
+            Path(fits)
+            if Path(fits).is_file()
+            else FitsFile(str(fits), catalog=catalog, lazy=True).filepath
+        )
+        for fits in files
+    ]
+
+    read_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_ahead, args=(filepaths, read_queue, stop), daemon=True
+    )
+    reader.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()  # Decoding files, in order
+            done = False
+            while not done or pending:
+                # Keep every worker busy, and the next files queued, without
+                # waiting for the reader while there are results to yield
+                while not done and len(pending) < 2 * workers:
+                    try:
+                        item = read_queue.get(block=not pending)
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    filepath, raw = item
+                    if isinstance(raw, BaseException):
+                        pending.append(raw)
+                    else:
+                        pending.append(
+                            executor.submit(_inflate_and_decode, raw, filepath)
+                        )
+                if pending:
+                    result = pending.popleft()
+                    if isinstance(result, BaseException):
+                        raise result
+                    yield result.result()
+    finally:
+        stop.set()
+        reader.join()
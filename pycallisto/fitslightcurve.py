@@ -0,0 +1,195 @@
+# FitsLightCurve: Band-integrated light curves of many FITS files
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .fitserror import FitsFileError
+from .fitsfile import ECallistoFitsFile, FitsFile
+from .fitsingest import inflate, parse, read_file
+from .fitsmetrics import stage
+from .fitsscan import obs_datetime
+
+LIGHT_CURVE_DTYPE = [("time", "M8[ms]"), ("flux", "f4")]
+
+
+class Band(NamedTuple):
+    """Frequency band of a light curve."""
+
+    name: str
+    low: float  # Lowest frequency, in MHz
+    high: float  # Highest frequency, in MHz
+
+
+def band_weights(
+    frequency: np.ndarray, bands: Sequence[Band], reduce: str = "mean"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the channels needed by the bands, and the weights that reduce
+    them to the flux of every band with a single matrix product.
+
+    :param frequency: Frequency of every channel, in MHz.
+    :param bands: The frequency bands.
+    :param reduce: Either "mean" or "sum" of the channels of every band.
+    :returns: Boolean mask of the channels in any of the bands, and the
+    (bands x channels in the mask) array of weights. Bands without any
+    channel have NaN weights.
+    """
+    in_band = np.array(
+        [(frequency >= band.low) & (frequency <= band.high) for band in bands]
+    ).reshape(len(bands), len(frequency))
+    needed = in_band.any(axis=0)
+    weights = in_band[:, needed].astype(np.float32)
+    channels = weights.sum(axis=1, keepdims=True)
+    if reduce == "mean":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights /= channels
+    weights[channels[:, 0] == 0] = np.nan
+
+    return needed, weights
+
+
+def _file_light_curves(
+    filepath: Path, bands: Sequence[Band], reduce: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the fluxes of the bands of a single FITS file.
+
+    Runs in the workers of light_curves. Only the channels in the bands
+    are converted to decibels.
+    """
+    filename = filepath.name
+    data = inflate(read_file(filepath), filename)
+    with stage("light_curve", filename) as measured:
+        try:
+            header, image, time, frequency = parse(data)
+            start = obs_datetime(header["DATE-OBS"], header["TIME-OBS"])
+        except (FitsFileError, KeyError, ValueError) as error:
+            raise FitsFileError(f"{filename}: {error}")
+        needed, weights = band_weights(frequency, bands, reduce)
+        # The minimum is taken over the whole image, as read_db does
+        db = ECallistoFitsFile.digits_to_db(image[needed], minimum=np.min(image))
+        fluxes = weights @ db
+        if not needed.any():
+            # The NaN weights of the empty bands have no channel to multiply
+            fluxes[...] = np.nan
+        measured.allocated(db, fluxes)
+
+    dt = time[1] - time[0] if time.size > 1 else header.get("CDELT1", 0.0)
+    offsets = np.rint(dt * 1000 * np.arange(image.shape[1])).astype("m8[ms]")
+
+    return start + offsets, fluxes
+
+
+def light_curves(
+    files: Iterable[Union[str, PurePath]],
+    bands: Sequence[Union[Band, Tuple[str, float, float]]],
+    reduce: str = "mean",
+    workers: Optional[int] = None,
+    processes: bool = False,
+    catalog=None,
+) -> Dict[str, np.ndarray]:
+    """Extract the light curves (flux against time) of frequency bands from
+    many FITS files, e.g., months of files of a station.
+
+    The files are processed in parallel, by a pool of threads (or of
+    processes), and only a few files are in flight at a time, so memory
+    use does not grow with the number of files, besides the light curves
+    themselves. Of every file, only the channels in the bands are
+    converted, and all bands are reduced at once. Samples of overlapping
+    files at or before the last time already taken are skipped.
+
+    :param files: Paths to the FITS files, in time order, or names of FITS
+    files to be looked for as ECallistoFitsFile does.
+    :param bands: Band (or (name, low, high) tuple) of every light curve.
+    :param reduce: Either "mean" or "sum" of the decibels of the channels
+    of every band.
+    :param workers: Number of workers. Defaults to the number of processors
+    on the machine.
+    :param processes: Use a pool of processes instead of threads.
+    :param catalog: Optional pycallisto.fitscatalog.FitsCatalog to look
+    the files given by name up in.
+    :returns: Structured array (with LIGHT_CURVE_DTYPE fields) of every
+    band, by name. The flux is NaN for files without channels in the band.
+    """
+    bands = [Band(*band) for band in bands]
+    if reduce not in ("mean", "sum"):
+        raise ValueError(f'reduce must be "mean" or "sum", not {reduce!r}.')
+    if len({band.name for band in bands}) != len(bands):
+        raise ValueError("Every band needs a name of its own.")
+    workers = workers or os.cpu_count() or 1
+    filepaths = (
+        (
+            Path(fits)
+            if Path(fits).is_file()
+            else FitsFile(str(fits), catalog=catalog, lazy=True).filepath
+        )
+        for fits in files
+    )
+
+    times, fluxes = [], []
+    last_time = None
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        pending = deque()
+        for filepath in filepaths:
+            pending.append(executor.submit(_file_light_curves, filepath, bands, reduce))
+            if len(pending) < 2 * workers:
+                continue
+            last_time = _take(pending.popleft().result(), times, fluxes, last_time)
+        while pending:
+            last_time = _take(pending.popleft().result(), times, fluxes, last_time)
+
+    time = np.concatenate(times) if times else np.empty(0, dtype="M8[ms]")
+    curves = {}
+    for index, band in enumerate(bands):
+        curve = np.empty(len(time), dtype=LIGHT_CURVE_DTYPE)
+        curve["time"] = time
+        start = 0
+        for file_fluxes in fluxes:
+            end = start + file_fluxes.shape[1]
+            curve["flux"][start:end] = file_fluxes[index]
+            start = end
+        curves[band.name] = curve
+
+    return curves
+
+
+def _take(
+    result: Tuple[np.ndarray, np.ndarray],
+    times: list,
+    fluxes: list,
+    last_time: Optional[np.datetime64],
+) -> Optional[np.datetime64]:
+    """Append the samples of a file after the last time already taken."""
+    time, file_fluxes = result
+    if last_time is not None:
+        first = np.searchsorted(time, last_time, side="right")
+        time, file_fluxes = time[first:], file_fluxes[:, first:]
+    if not time.size:
+        return last_time
+    times.append(time)
+    fluxes.append(file_fluxes)
+
+    return time[-1]
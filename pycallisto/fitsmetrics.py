@@ -0,0 +1,187 @@
+# FitsMetrics: Timing and memory instrumentation of the stages of PyCallisto
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class StageMetrics(NamedTuple):
+    """Measurements of one run of an instrumented stage (e.g., reading the
+    image data of a FITS file, or saving a plot)."""
+
+    stage: str
+    filename: Optional[str]  # FITS file the stage worked on, if any
+    seconds: float  # Wall time
+    bytes_read: int  # Bytes of files read from disk
+    bytes_allocated: int  # Bytes of the arrays allocated by the stage
+
+
+Sink = Callable[[StageMetrics], None]
+
+_sinks: List[Sink] = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink: Sink) -> Sink:
+    """Send the metrics of every instrumented stage to a callable. Stages are
+    only measured while at least one sink is registered.
+
+    :param sink: Callable taking a StageMetrics.
+    :returns: The sink, so this can be used as a decorator.
+    """
+    global _sinks
+    with _sinks_lock:
+        # The list is replaced rather than changed in place, so stages
+        # running in other threads can go through it without locking.
+        _sinks = _sinks + [sink]
+
+    return sink
+
+
+def remove_sink(sink: Sink):
+    """Stop sending metrics to a sink registered with add_sink."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = [registered for registered in _sinks if registered is not sink]
+
+
+class _Stage(object):
+    """Measures a stage, as a context manager."""
+
+    __slots__ = ("name", "filename", "bytes_read", "bytes_allocated", "start")
+
+    def __init__(self, name: str, filename: Optional[str]):
+        self.name = name
+        self.filename = filename
+        self.bytes_read = 0
+        self.bytes_allocated = 0
+
+    def read(self, nbytes: int):
+        """Count bytes read from disk."""
+        self.bytes_read += nbytes
+
+    def allocated(self, *arrays: np.ndarray):
+        """Count arrays allocated by the stage."""
+        self.bytes_allocated += sum(array.nbytes for array in arrays)
+
+    def __enter__(self) -> "_Stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        metrics = StageMetrics(
+            self.name,
+            self.filename,
+            time.perf_counter() - self.start,
+            self.bytes_read,
+            self.bytes_allocated,
+        )
+        for sink in _sinks:
+            sink(metrics)
+
+
+class _NullStage(object):
+    """Stands in for _Stage while no sink is registered."""
+
+    __slots__ = ()
+
+    def read(self, nbytes: int):
+        pass
+
+    def allocated(self, *arrays: np.ndarray):
+        pass
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str, filename: Optional[str] = None):
+    """Measure a stage, e.g.:
+
+        with stage("read_image", self.filename) as measured:
+            measured.read(os.path.getsize(self.filepath))
+            ...
+
+    The metrics are sent to the registered sinks when the stage ends (even
+    if it raised). With no sink registered, a shared no-op context manager
+    is returned, so instrumented code runs at nearly the same speed.
+
+    :param name: Name of the stage.
+    :param filename: Name of the FITS file the stage works on, if any.
+    :returns: Context manager measuring the stage.
+    """
+    if not _sinks:
+        return _NULL_STAGE
+
+    return _Stage(name, str(filename) if filename is not None else None)
+
+
+class MetricsRecorder(object):
+    """Sink keeping the metrics of every stage in memory, e.g.:
+
+    with MetricsRecorder() as recorder:
+        fitsplot(fits_file_list, show=False)
+    print(recorder.totals())
+    """
+
+    def __init__(self):
+        self.records: List[StageMetrics] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: StageMetrics):
+        with self._lock:
+            self.records.append(metrics)
+
+    def __enter__(self) -> "MetricsRecorder":
+        add_sink(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_sink(self)
+
+    def totals(self) -> Dict[str, StageMetrics]:
+        """Add up the metrics of every stage over all files.
+
+        :returns: Totals of every stage, in the order stages first ran.
+        """
+        totals = {}
+        with self._lock:
+            for metrics in self.records:
+                total = totals.get(metrics.stage)
+                if total is None:
+                    totals[metrics.stage] = metrics._replace(filename=None)
+                else:
+                    totals[metrics.stage] = total._replace(
+                        seconds=total.seconds + metrics.seconds,
+                        bytes_read=total.bytes_read + metrics.bytes_read,
+                        bytes_allocated=total.bytes_allocated + metrics.bytes_allocated,
+                    )
+
+        return totals
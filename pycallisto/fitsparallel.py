@@ -0,0 +1,134 @@
+# FitsParallel: Functions for decoding FITS files in parallel
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path, PurePath
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .fitsfile import ECallistoFitsFile, FitsFile
+
+
+def _decode(fits: Tuple[str, str], kwargs: dict) -> tuple:
+    """Decode a FITS file into a new block of shared memory.
+
+    Runs in the worker processes of load_many. Only the name of the block
+    and the small header and table data are sent back to the parent.
+    """
+    filename, filepath = fits
+    fitsfile = ECallistoFitsFile(filename, filepath, **kwargs)
+    dataset = fitsfile.hdul_dataset
+    shape = (dataset["rows"], dataset["columns"])
+
+    shm = SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 4))
+    try:
+        fitsfile.read_db(out=np.ndarray(shape, dtype=np.float32, buffer=shm.buf))
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    # The calling process takes over the block, so the resource tracker of
+    # this worker must not unlink it when the worker exits.
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+    return (
+        fitsfile.filename,
+        str(fitsfile.filepath),
+        dataset.header,
+        dataset["time"],
+        dataset["f0"],
+        shm.name,
+        shape,
+    )
+
+
+def _attach(shm_name: str, shape: Tuple[int, int]) -> np.ndarray:
+    """Map a block of shared memory created by _decode into an array.
+
+    The block is unlinked right away, so it is released as soon as the
+    returned array (and every view of it) is garbage collected.
+    """
+    shm = SharedMemory(name=shm_name)
+    shm.unlink()
+    db = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    weakref.finalize(db, shm.close)
+
+    return db
+
+
+def load_many(
+    files: Sequence[Union[str, PurePath]], workers: Optional[int] = None, **kwargs
+) -> List[ECallistoFitsFile]:
+    """Decode many e-Callisto FITS files in parallel, using a pool of
+    worker processes.
+
+    The decibel arrays are written by the workers straight into shared
+    memory, instead of being pickled back to the calling process.
+
+    :param files: Paths to the FITS files, or names of FITS files to be
+    looked for as ECallistoFitsFile does.
+    :param workers: Number of worker processes. Defaults to the number of
+    processors on the machine.
+    :param kwargs: Keyword arguments passed on to ECallistoFitsFile.
+    :returns: ECallistoFitsFile instances, in the same order as `files`,
+    whose hdul_dataset["db"] is already decoded.
+    """
+    catalog = kwargs.pop("catalog", None)
+    fits_list = []
+    for fits in files:
+        filepath = Path(fits)
+        if filepath.is_file():
+            fits_list.append((filepath.name, str(filepath)))
+        elif catalog is not None:
+            # Resolve names here, the catalog can't be shared with workers
+            fitsfile = FitsFile(str(fits), catalog=catalog, lazy=True)
+            fits_list.append((fitsfile.filename, str(fitsfile.filepath)))
+        else:
+            fits_list.append((str(fits), ""))
+
+    fitsfiles = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_decode, fits, kwargs) for fits in fits_list]
+        try:
+            for future in futures:
+                filename, filepath, header, time, frequency, shm_name, shape = (
+                    future.result()
+                )
+                db = _attach(shm_name, shape)
+                fitsfiles.append(
+                    ECallistoFitsFile.from_decoded(
+                        filename, filepath, header, time, frequency, db
+                    )
+                )
+        except BaseException:
+            # Release the shared memory of the files that were decoded by the
+            # workers, but not loaded here yet.
+            for future in futures[len(fitsfiles) + 1 :]:
+                if not future.cancel() and future.exception() is None:
+                    _attach(*future.result()[-2:])
+            raise
+
+    return fitsfiles
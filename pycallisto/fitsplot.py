@@ -20,18 +20,23 @@
 
 
 import collections.abc
-import itertools
-from datetime import timedelta
 from pathlib import Path, PurePath
-from typing import Sequence, Union
+from typing import Optional, Sequence, Tuple, Union
 
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
 
-from .fitsfile import ECallistoFitsFile
-from .fitshelpers import figure_config, imshow_config
-from .pycallistodata import LANGUAGES
+from .fitsbackground import remove_background
+from .fitscache import SpectrogramCache
+from .fitscatalog import FitsCatalog
+from .fitsfile import ECallistoDataset, ECallistoFitsFile, FitsFile
+from .fitshelpers import figure_config, imshow_config, plot_title, time_ticks
+from .fitsmetrics import stage
+from .fitsparallel import load_many
+from .fitspyramid import stitch_pyramids
+from .fitsrfi import ChannelMaskCache, channel_mask as derive_channel_mask
+from .fitsscale import AUTO_QUANTILES, QuantileSketch
+from .fitsstitch import stitch_background
+from .pycallistodata import get_labels
 
 
 def fitsplot(
@@ -43,57 +48,118 @@ def fitsplot(
     language: str = "en",
     labels_fontsize: int = 15,
     axis_params_labelsize: int = 14,
+    catalog: Optional[FitsCatalog] = None,
+    cache: Optional[SpectrogramCache] = None,
+    workers: Optional[int] = None,
+    background_window: Optional[int] = None,
+    pyramid: Optional[str] = None,
+    channel_mask: Optional[Union[bool, np.ndarray]] = None,
+    mask_cache: Optional[ChannelMaskCache] = None,
+    auto_scale: Union[bool, Tuple[float, float]] = False,
     **kwargs
 ):
-    extended_db = None
-    ext_time_axis = None
+    if pyramid is not None and channel_mask is not None:
+        raise ValueError("Channels can not be masked when plotting pyramids.")
+
+    # pyplot (and its backend) is only imported once something is plotted,
+    # so that importing pycallisto does not import matplotlib
+    from matplotlib import pyplot as plt
+
     plt.figure(1, **figure_config(**kwargs))
 
-    if isinstance(fits, collections.abc.Sequence):
+    if isinstance(fits, collections.abc.Sequence) and not isinstance(fits, str):
         filenames = sorted(fits)
     else:
         filenames = [fits]
-
-    for fname in filenames:
-        fitsfile = ECallistoFitsFile(fname)
-
-        if extended_db is None and ext_time_axis is None:
-            extended_db = fitsfile.hdul_dataset["db"]
-            ext_time_axis = fitsfile.hdul_dataset["time_axis"]
+    # Background-subtracted values, for the color limits of auto_scale
+    sketch = QuantileSketch() if auto_scale else None
+
+    if pyramid is not None:
+        # Draw the pyramid level ("mean" or "max") that matches the size of
+        # the axes, so the FITS files themselves are only decoded when their
+        # pyramids are missing or out of date.
+        fitsfiles = [FitsFile(fname, catalog=catalog, lazy=True) for fname in filenames]
+        fitsfile = fitsfiles[-1]
+        v_min, v_max = ECallistoDataset.V_MIN, ECallistoDataset.V_MAX
+        bbox = plt.gca().get_window_extent()
+        with stage("pyramid") as measured:
+            extended_db, ext_time_axis, frequency = stitch_pyramids(
+                fitsfiles, bbox.width, bbox.height, pyramid
+            )
+            measured.allocated(extended_db)
+        with stage("background") as measured:
+            extended_db = remove_background(extended_db, background_window)
+            measured.allocated(extended_db)
+        if sketch is not None:
+            # Pyramid levels are only about the size of the axes
+            with stage("auto_scale"):
+                sketch.add(extended_db)
+    else:
+        if workers is None:
+            fitsfiles = [
+                ECallistoFitsFile(fname, catalog=catalog, cache=cache)
+                for fname in filenames
+            ]
         else:
-            extended_db = np.hstack((extended_db, fitsfile.hdul_dataset["db"]))
-            ext_time_axis = np.hstack(
-                (ext_time_axis, fitsfile.hdul_dataset["time_axis"])
+            # Decode the files in parallel, on a pool of worker processes,
+            # whose own stages are not measured
+            with stage("load_many") as measured:
+                fitsfiles = load_many(filenames, workers, catalog=catalog, cache=cache)
+                for fits_file in fitsfiles:
+                    measured.allocated(fits_file.hdul_dataset["db"])
+        fitsfile = fitsfiles[-1]
+        v_min = fitsfile.hdul_dataset["v_min"]
+        v_max = fitsfile.hdul_dataset["v_max"]
+        if channel_mask is True:
+            # Mask the channels hit by interference at the station, as
+            # derived from these files (or found in the cache)
+            channel_mask = derive_channel_mask(fitsfiles, mask_cache)
+        elif channel_mask is False:
+            channel_mask = None
+        # The background is subtracted file by file, as the files are
+        # decoded into the stitched array, instead of from the whole array
+        with stage("stitch_background") as measured:
+            extended_db, ext_time_axis, _ = stitch_background(
+                fitsfiles, background_window, channel_mask, sketch
             )
-
-    extended_db_median = np.median(extended_db, axis=1, keepdims=True)
-    plt.imshow(
-        extended_db - extended_db_median,
-        **imshow_config(**kwargs),
-        norm=plt.Normalize(
-            fitsfile.hdul_dataset["v_min"], fitsfile.hdul_dataset["v_max"]
-        ),
-        extent=[
-            ext_time_axis[0],
-            ext_time_axis[-1],
-            fitsfile.hdul_dataset["frequency"][-1],
-            fitsfile.hdul_dataset["frequency"][0],
-        ],
-        **kwargs
-    )
+            measured.allocated(extended_db)
+        # The extent of the plot leaves out the lower 10 channels, as the
+        # dataset's "frequency" does
+        frequency = fitsfile.hdul_dataset["frequency"]
+
+    if auto_scale:
+        # Color limits from quantiles of the background-subtracted values
+        # (either the given ones, or the default ones)
+        quantiles = AUTO_QUANTILES if auto_scale is True else auto_scale
+        v_min, v_max = sketch.limits(quantiles)
+
+    if channel_mask is not None:
+        # Masked channels are left blank, at their place on the frequency axis
+        masked_db = np.full(
+            (len(channel_mask), extended_db.shape[1]), np.nan, dtype=np.float32
+        )
+        masked_db[channel_mask] = extended_db
+        extended_db = masked_db
+
+    with stage("imshow"):
+        plt.imshow(
+            extended_db,
+            **imshow_config(**kwargs),
+            norm=plt.Normalize(v_min, v_max),
+            extent=[
+                ext_time_axis[0],
+                ext_time_axis[-1],
+                frequency[-1],
+                frequency[0],
+            ],
+            **kwargs
+        )
 
     # Follow the convention of inverting the Frequency axis
     plt.gca().invert_yaxis()
 
     # Get the labels to use when plotting
-    try:
-        labels = LANGUAGES[language.lower()]
-    except KeyError:
-        # Defaults to English if an invalid or missing language is given.
-        # Check languages.json for the currently supported languages.
-        # Feel free to add a new language by adding it to languages.json
-        # and then sending a Pull Request.
-        labels = LANGUAGES["en"]
+    labels = get_labels(language)
 
     if show_colorbar:
         cb = plt.colorbar()
@@ -103,95 +169,25 @@ def fitsplot(
     plt.ylabel(labels["ylabel"], fontsize=labels_fontsize)
     plt.tick_params(labelsize=axis_params_labelsize)
 
-    hours_xticks = []
     locs, _ = plt.xticks()
-    for loc in locs:
-        hour = str(int(loc)) + ":" + str(int((loc - int(loc)) * 60))
-        if hour.split(":")[-1] == "0":
-            hour += "0"
-        if len(hour.split(":")[-1]) == 1:
-            hour = hour.split(":")[0] + ":0" + hour.split(":")[-1]
-        hours_xticks.append(hour)
-
-    initial_hour = timedelta(hours=round(ext_time_axis[0], 2))
-
-    initial_seconds = initial_hour.seconds
-    initial_xticks_seconds = int(hours_xticks[0].split(":")[0]) * 3600
-    initial_xticks_seconds += int(hours_xticks[0].split(":")[-1]) * 60
-
-    if initial_seconds != initial_xticks_seconds:
-        hours_xticks.pop(0)
-        locs = locs[1:]
-
-    for index, item in enumerate(hours_xticks):
-        if len(item.split(":")[0]) == 1:
-            hours_xticks[index] = "0" + item
-
-    final_hour = timedelta(hours=round(ext_time_axis[-1], 2))
-    final_seconds = final_hour.seconds
-    final_xticks_seconds = int(hours_xticks[-1].split(":")[0]) * 3600
-    final_xticks_seconds += int(hours_xticks[-1].split(":")[-1]) * 60
-
-    if final_seconds != final_xticks_seconds:
-        hours_xticks.pop()
-        locs = locs[:-1]
-
-    if initial_xticks_seconds != initial_seconds:
-        last_minutes = int(hours_xticks[-1].split(":")[0]) * 60
-        last_minutes += int(hours_xticks[-1].split(":")[-1])
-        first_minutes = int(hours_xticks[0].split(":")[0]) * 60
-        first_minutes += int(hours_xticks[0].split(":")[-1])
-        minutes_delta = last_minutes - first_minutes
-        ticks_interval = int(round(minutes_delta / (len(locs) - 1), 0))
-        final_xticks = []
-        hour = timedelta(minutes=first_minutes)
-        final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
-
-        for _ in itertools.repeat(None, len(locs) - 1):
-            hour = hour + timedelta(minutes=ticks_interval)
-            final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
-
-        plt.xticks(locs, final_xticks)
-
-    else:
-        hours_delta = round(ext_time_axis[-1], 2)
-        hours_delta -= round(ext_time_axis[0], 2)
-        minutes_delta = hours_delta * 60
-        ticks_interval = int(round(minutes_delta / (len(locs) - 1), 0))
-        final_xticks = []
-        hour = initial_hour
-        final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
-
-        for _ in itertools.repeat(None, len(locs) - 1):
-            hour = hour + timedelta(minutes=ticks_interval)
-            final_xticks.append(":".join(hour.__str__().split(":")[:-1]))
-
-        plt.xticks(locs, final_xticks)
-
-    final_hour_str = final_hour.__str__()
-    if len(final_hour_str.split(":")[0]) == 1:
-        final_hour_str = "0" + final_hour_str
+    plt.xticks(*time_ticks(locs, ext_time_axis[0], ext_time_axis[-1]))
 
     # Define plot's title
-    first_fname = str(filenames[0])
-    last_fname = str(filenames[-1])
-    title_start = "_".join(first_fname.split("_")[:-1])
-    freq_band = last_fname.split("_")[-1].split(".")[0]
-    title_end = "".join(final_hour_str.split(":"))
-    title_end = "_".join([title_end, freq_band])
-    title = "_".join([title_start, title_end])
+    title = plot_title(filenames, ext_time_axis[-1])
     plt.title(title, fontsize=16)
 
     # Get the current figure to save it after showing it
     fig = plt.gcf()
 
     if show:
-        plt.show()
+        with stage("show"):
+            plt.show()
 
     if save:
         fitspath = fitsfile.filepath
         img_filepath = str(fitspath).replace(fitspath.name, title + ext)
-        fig.savefig(img_filepath)
+        with stage("savefig"):
+            fig.savefig(img_filepath)
 
     plt.clf()
     plt.cla()
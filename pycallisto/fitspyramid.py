@@ -0,0 +1,259 @@
+# FitsPyramid: Multi-resolution pyramids of e-Callisto spectrograms
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .fitsfile import ECallistoFitsFile, FitsFile
+from .fitsstitch import stitch
+
+REDUCTIONS = ("mean", "max")
+
+
+def decimate(
+    array: np.ndarray, factor: int, axis: int = 1, reduction: str = "mean"
+) -> np.ndarray:
+    """Reduce every `factor` consecutive elements of an array, along `axis`,
+    to their mean or maximum. A trailing partial block is reduced as well.
+
+    :param array: Array to be decimated.
+    :param factor: Number of elements reduced into one.
+    :param axis: Axis along which the array is decimated.
+    :param reduction: Either "mean" or "max".
+    :returns: Decimated array.
+    """
+    if reduction not in REDUCTIONS:
+        raise ValueError(f"reduction must be one of {REDUCTIONS}, not {reduction}.")
+    if factor <= 1:
+        return array
+
+    starts = np.arange(0, array.shape[axis], factor)
+    if reduction == "max":
+        return np.maximum.reduceat(array, starts, axis=axis)
+
+    sums = np.add.reduceat(array, starts, axis=axis, dtype=np.float64)
+    counts = np.diff(np.append(starts, array.shape[axis]))
+    shape = [1] * array.ndim
+    shape[axis] = counts.size
+
+    return (sums / counts.reshape(shape)).astype(np.result_type(array, np.float32))
+
+
+class SpectrogramPyramid(object):
+    """Multi-resolution pyramid of the spectrogram of a FITS file.
+
+    Level k holds the spectrogram decimated by 2**k along time, both as
+    block means and block maxima, stored as float16. Level 0, the full
+    resolution spectrogram, is not stored. Decimation along frequency is
+    cheap once the time axis has been reduced, so it is done on the fly by
+    `level`. The pyramid also keeps the few values of the FITS file that
+    are needed to plot it (time span, frequency channels and number of
+    columns), so plotting from it never touches the FITS file.
+    """
+
+    def __init__(self, arrays: dict, path: Optional[Path] = None):
+        """
+        :param arrays: Arrays of the pyramid, as built by `build`, or only
+        its metadata, for a pyramid opened by `load`.
+        :param path: File saved by `save` that the levels missing from
+        `arrays` are read from.
+        """
+        self.arrays = arrays
+        self.path = path
+        if path is None:
+            self.levels = sum(1 for key in arrays if key.startswith("mean_"))
+        else:
+            self.levels = int(arrays["levels"])
+        self.columns = int(arrays["columns"])  # Columns at full resolution
+        self.rows = int(arrays["rows"])  # Frequency channels
+        self.time_span = arrays["time_span"]  # First and last times, in hours
+        self.frequency = arrays["frequency"]
+
+    @classmethod
+    def build(
+        cls, fitsfile: ECallistoFitsFile, min_columns: int = 1
+    ) -> "SpectrogramPyramid":
+        """Build the pyramid of a FITS file.
+
+        :param fitsfile: The ECallistoFitsFile.
+        :param min_columns: Levels are added until they would have fewer
+        columns than this.
+        :returns: The pyramid.
+        """
+        dataset = fitsfile.hdul_dataset
+        db = fitsfile.read_db()
+        arrays = {
+            "columns": np.array(dataset["columns"]),
+            "rows": np.array(db.shape[0]),
+            "time_span": dataset["time_axis"][[0, -1]],
+            "frequency": dataset["frequency"],
+        }
+        level = 1
+        while math.ceil(db.shape[1] / 2**level) >= max(1, min_columns):
+            factor = 2**level
+            mean = decimate(db, factor, reduction="mean")
+            arrays[f"mean_{level}"] = mean.astype(np.float16)
+            arrays[f"max_{level}"] = decimate(db, factor, reduction="max").astype(
+                np.float16
+            )
+            if mean.shape[1] == 1:
+                break
+            level += 1
+
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SpectrogramPyramid":
+        """Open a pyramid saved by `save`. Only its metadata is read right
+        away, and the file is closed: levels are read from it (opening it
+        again) when they are used, so that opening the pyramids of many
+        files does not keep them all open.
+        """
+        with np.load(path) as npz:
+            arrays = {key: npz[key] for key in ("columns", "time_span", "frequency")}
+            levels = [key for key in npz.files if key.startswith("mean_")]
+            arrays["levels"] = np.array(len(levels))
+            # Pyramids saved before the number of rows was stored
+            if "rows" in npz.files:
+                arrays["rows"] = npz["rows"]
+            else:
+                arrays["rows"] = np.array(npz["mean_1"].shape[0])
+
+        return cls(arrays, Path(path))
+
+    def save(self, path: Union[str, Path]):
+        """Save the pyramid as an uncompressed .npz file."""
+        if self.path is not None:
+            # Only the metadata of an opened pyramid is in memory
+            shutil.copyfile(self.path, path)
+            return
+        with open(path, "wb") as f:
+            np.savez(f, **self.arrays)
+
+    def level(
+        self, level: int, reduction: str = "mean", freq_factor: int = 1
+    ) -> np.ndarray:
+        """Get a level of the pyramid.
+
+        :param level: Level number, between 1 and `levels`.
+        :param reduction: Either "mean" or "max".
+        :param freq_factor: Factor by which the frequency axis is decimated.
+        :returns: Decimated array of decibels.
+        """
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"reduction must be one of {REDUCTIONS}, not {reduction}.")
+        key = f"{reduction}_{level}"
+        if key in self.arrays:
+            db = self.arrays[key]
+        else:
+            with np.load(self.path) as npz:
+                db = npz[key]
+        db = db.astype(np.float32)
+
+        return decimate(db, freq_factor, axis=0, reduction=reduction)
+
+
+def pyramid_path(fitsfile: FitsFile) -> Path:
+    """Get the path of the pyramid file stored next to a FITS file."""
+    return fitsfile.filepath.with_name(fitsfile.filepath.name + ".pyramid.npz")
+
+
+def load_pyramid(fitsfile: FitsFile, **kwargs) -> SpectrogramPyramid:
+    """Open the pyramid stored next to a FITS file, building (and saving) it
+    first if it is missing or older than the FITS file.
+
+    :param fitsfile: The FitsFile, which does not need to be open.
+    :param kwargs: Keyword arguments passed on to SpectrogramPyramid.build.
+    :returns: The pyramid.
+    """
+    path = pyramid_path(fitsfile)
+    try:
+        if path.stat().st_mtime_ns >= fitsfile.filepath.stat().st_mtime_ns:
+            return SpectrogramPyramid.load(path)
+    except FileNotFoundError:
+        pass
+
+    if not isinstance(fitsfile, ECallistoFitsFile):
+        fitsfile = ECallistoFitsFile(fitsfile.filename, fitsfile.filepath)
+    pyramid = SpectrogramPyramid.build(fitsfile, **kwargs)
+    # Save to a temporary file first, so that concurrent readers never
+    # open a partially written pyramid.
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    pyramid.save(tmp_path)
+    os.replace(tmp_path, path)
+
+    return pyramid
+
+
+def pyramid_level(columns: int, pixels: float) -> int:
+    """Get the coarsest pyramid level that still has at least one column
+    per pixel.
+
+    :param columns: Number of columns at full resolution.
+    :param pixels: Number of pixels the columns are drawn into.
+    :returns: Level number (0 is the full resolution).
+    """
+    if pixels <= 0 or columns <= pixels:
+        return 0
+
+    return int(math.floor(math.log2(columns / pixels)))
+
+
+def stitch_pyramids(
+    fitsfiles: Sequence[FitsFile],
+    width: float,
+    height: float,
+    reduction: str = "mean",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Join consecutive FITS files along time, at the pyramid level that
+    matches the size of the image they are drawn into.
+
+    :param fitsfiles: FitsFile instances (which do not need to be open),
+    in time order.
+    :param width: Width of the image, in pixels.
+    :param height: Height of the image, in pixels.
+    :param reduction: Either "mean" or "max".
+    :returns: Array of decibels, first and last times (in hours) and
+    frequency channels.
+    """
+    pyramids = [load_pyramid(fitsfile) for fitsfile in fitsfiles]
+    level = pyramid_level(sum(pyramid.columns for pyramid in pyramids), width)
+    time_span = np.array([pyramids[0].time_span[0], pyramids[-1].time_span[-1]])
+    if level == 0:
+        db, _, frequency = stitch(
+            [ECallistoFitsFile(fits.filename, fits.filepath) for fits in fitsfiles]
+        )
+        return db, time_span, frequency
+
+    freq_factor = 2 ** pyramid_level(pyramids[0].rows, height)
+    blocks = []
+    for pyramid in pyramids:
+        # Files with fewer levels are decimated further from their last one
+        file_level = min(level, pyramid.levels)
+        block = pyramid.level(file_level, reduction, freq_factor)
+        blocks.append(decimate(block, 2 ** (level - file_level), reduction=reduction))
+
+    return np.concatenate(blocks, axis=1), time_span, pyramids[0].frequency
@@ -0,0 +1,264 @@
+# FitsRegrid: Resampling of e-Callisto spectrograms onto a common grid
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import hashlib
+from collections import OrderedDict
+from pathlib import Path, PurePath
+from typing import Iterable, NamedTuple, Union
+
+import numpy as np
+
+from .fitsfile import ECallistoFitsFile
+
+
+class Grid(NamedTuple):
+    """Time and frequency axes that spectrograms are resampled onto."""
+
+    time: np.ndarray  # In hours, increasing
+    frequency: np.ndarray  # In MHz, in any monotonic order
+
+
+def regular_grid(
+    start: float,
+    end: float,
+    step: float,
+    freq_low: float,
+    freq_high: float,
+    channels: int,
+) -> Grid:
+    """Make a grid with evenly spaced times and frequency channels. As in
+    e-Callisto files, channels go from the highest frequency down.
+
+    :param start: First time, in hours.
+    :param end: Last time, in hours (included if it falls on a step).
+    :param step: Time step, in seconds.
+    :param freq_low: Lowest frequency, in MHz.
+    :param freq_high: Highest frequency, in MHz.
+    :param channels: Number of frequency channels.
+    :returns: The grid.
+    """
+    steps = int(np.floor((end - start) * 3600 / step + 1e-9)) + 1
+
+    return Grid(
+        start + step * np.arange(steps) / 3600,
+        np.linspace(freq_high, freq_low, channels),
+    )
+
+
+class InterpolationWeights(NamedTuple):
+    """Linear interpolation from a source axis onto the part of a target
+    axis the source covers. Each of the `stop - start` target points is a
+    two-term sparse combination of source points:
+    value = source[lower] * (1 - weight) + source[upper] * weight.
+    """
+
+    start: int  # First target index covered by the source
+    stop: int  # Last target index covered by the source, plus one
+    lower: np.ndarray
+    upper: np.ndarray
+    weight: np.ndarray
+
+    def apply(self, array: np.ndarray, axis: int) -> np.ndarray:
+        """Interpolate an array along `axis`.
+
+        :param array: Array sampled on the source axis along `axis`.
+        :param axis: Axis along which the array is interpolated.
+        :returns: Array sampled on target[start:stop] along `axis`.
+        """
+        shape = [1] * array.ndim
+        shape[axis] = self.weight.size
+        weight = self.weight.reshape(shape)
+        result = np.take(array, self.upper, axis=axis) * weight
+        result += np.take(array, self.lower, axis=axis) * (1 - weight)
+
+        return result
+
+
+def interpolation_weights(
+    source: np.ndarray, target: np.ndarray
+) -> InterpolationWeights:
+    """Compute the linear interpolation weights from a source axis onto the
+    points of a monotonic target axis that fall within the source's range.
+
+    :param source: Source axis, in any order (e.g., e-Callisto frequency
+    channels, which go from the highest frequency down and can repeat).
+    :param target: Target axis, either increasing or decreasing.
+    :returns: The interpolation weights.
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    order = np.argsort(source, kind="stable")
+    sorted_source = source[order]
+
+    descending = target.size > 1 and target[0] > target[-1]
+    increasing_target = target[::-1] if descending else target
+    start = np.searchsorted(increasing_target, sorted_source[0], side="left")
+    stop = np.searchsorted(increasing_target, sorted_source[-1], side="right")
+    points = increasing_target[start:stop]
+
+    upper = np.searchsorted(sorted_source, points, side="left")
+    upper = np.clip(upper, 1, max(1, sorted_source.size - 1))
+    lower = upper - 1
+    if sorted_source.size == 1:
+        upper = lower = np.zeros_like(upper)
+    span = sorted_source[upper] - sorted_source[lower]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(span > 0, (points - sorted_source[lower]) / span, 0.0)
+    weight = np.clip(weight, 0.0, 1.0).astype(np.float32)
+    lower, upper = order[lower], order[upper]
+
+    if descending:
+        start, stop = target.size - stop, target.size - start
+        lower, upper, weight = lower[::-1], upper[::-1], weight[::-1]
+
+    return InterpolationWeights(int(start), int(stop), lower, upper, weight)
+
+
+def _digest(axis: np.ndarray) -> bytes:
+    axis = np.ascontiguousarray(axis, dtype=np.float64)
+    return hashlib.blake2b(axis.tobytes(), digest_size=16).digest()
+
+
+class Regridder(object):
+    """Resamples spectrograms of any instrument onto a shared Grid.
+
+    Resampling is separable: the frequency channels are interpolated
+    first, then the times, each with precomputed InterpolationWeights.
+    Weights are kept in an LRU cache keyed by a digest of the source axis,
+    so spectrograms of an instrument setup already seen (same channels, or
+    same time of day for the time axis) are resampled without computing
+    any weights.
+    """
+
+    def __init__(self, grid: Grid, max_cached: int = 1024):
+        """
+        :param grid: The target grid.
+        :param max_cached: Largest number of cached weights.
+        """
+        self.grid = grid
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self.hits = self.misses = 0
+
+    def weights(self, source: np.ndarray, target: str) -> InterpolationWeights:
+        """Get the (cached) weights from a source axis onto an axis of the
+        grid.
+
+        :param source: Source axis.
+        :param target: Either "time" or "frequency".
+        :returns: The interpolation weights.
+        """
+        key = (target, _digest(source))
+        weights = self._cache.get(key)
+        if weights is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return weights
+
+        self.misses += 1
+        weights = interpolation_weights(source, getattr(self.grid, target))
+        self._cache[key] = weights
+        if len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+        return weights
+
+    def regrid(
+        self, db: np.ndarray, time_axis: np.ndarray, frequency: np.ndarray
+    ) -> np.ndarray:
+        """Resample a spectrogram onto the grid.
+
+        :param db: Array of decibels, with one row per frequency channel.
+        :param time_axis: Time of every column, in hours.
+        :param frequency: Frequency of every row, in MHz. Rows past its
+        length are dropped (e.g., with the `frequency` of an
+        ECallistoFitsFile dataset, which leaves the last channels out).
+        :returns: float32 array shaped like the grid, NaN where the grid is
+        not covered by the spectrogram.
+        """
+        result = np.full(
+            (len(self.grid.frequency), len(self.grid.time)), np.nan, dtype=np.float32
+        )
+        self.regrid_into(result, db, time_axis, frequency)
+
+        return result
+
+    def regrid_into(
+        self,
+        out: np.ndarray,
+        db: np.ndarray,
+        time_axis: np.ndarray,
+        frequency: np.ndarray,
+    ) -> slice:
+        """Resample a spectrogram onto the part of the grid it covers,
+        writing it into `out`.
+
+        :param out: Array shaped like the grid.
+        :param db: Array of decibels, with one row per frequency channel.
+        :param time_axis: Time of every column, in hours.
+        :param frequency: Frequency of every row, in MHz.
+        :returns: Slice of the grid's time axis that was written.
+        """
+        freq_weights = self.weights(frequency, "frequency")
+        time_weights = self.weights(time_axis, "time")
+        channels = freq_weights.apply(db[: len(frequency)], axis=0)
+        out[
+            freq_weights.start : freq_weights.stop,
+            time_weights.start : time_weights.stop,
+        ] = time_weights.apply(channels, axis=1)
+
+        return slice(time_weights.start, time_weights.stop)
+
+    def regrid_files(
+        self, files: Iterable[Union[str, PurePath, ECallistoFitsFile]]
+    ) -> np.ndarray:
+        """Resample many FITS files (e.g., consecutive files of a station,
+        or files of several stations) onto the grid, averaging the files
+        where they overlap. Only one file is decoded at a time.
+
+        :param files: ECallistoFitsFile instances, paths to FITS files or
+        names of FITS files.
+        :returns: float32 array shaped like the grid, NaN where the grid is
+        not covered by any file.
+        """
+        shape = (len(self.grid.frequency), len(self.grid.time))
+        total = np.zeros(shape, dtype=np.float32)
+        count = np.zeros(shape, dtype=np.uint16)
+        scratch = np.full(shape, np.nan, dtype=np.float32)
+        for fits in files:
+            if not isinstance(fits, ECallistoFitsFile):
+                filepath = Path(fits)
+                if filepath.is_file():
+                    fits = ECallistoFitsFile(filepath.name, filepath)
+                else:
+                    fits = ECallistoFitsFile(fits)
+            dataset = fits.hdul_dataset
+            columns = self.regrid_into(
+                scratch, fits.read_db(), dataset["time_axis"], dataset["frequency"]
+            )
+            written = scratch[:, columns]
+            covered = ~np.isnan(written)
+            total[:, columns] += np.where(covered, written, 0)
+            count[:, columns] += covered
+            written[...] = np.nan
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(count > 0, total / count, np.nan).astype(np.float32)
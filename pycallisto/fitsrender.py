@@ -0,0 +1,224 @@
+# FitsRender: Headless batch rendering of e-Callisto quicklook images
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePath
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from matplotlib.ticker import AutoLocator, ScalarFormatter
+
+from .fitscache import SpectrogramCache
+from .fitscatalog import FitsCatalog
+from .fitsfile import ECallistoFitsFile
+from .fitshelpers import figure_config, imshow_config, plot_title, time_ticks
+from .fitsscale import AUTO_QUANTILES, QuantileSketch
+from .fitsstitch import stitch_background
+from .pycallistodata import get_labels
+
+
+class QuicklookRenderer(object):
+    """Renders quicklook images of e-Callisto FITS files, like fitsplot does,
+    but without pyplot's global state.
+
+    A single Agg figure, with its axes and image, is created once and then
+    reused for every rendered image: only the image data, extent, ticks
+    and title are updated between images.
+    """
+
+    def __init__(
+        self,
+        ext: str = ".png",
+        show_colorbar: bool = False,
+        language: str = "en",
+        labels_fontsize: int = 15,
+        axis_params_labelsize: int = 14,
+        background_window: Optional[int] = None,
+        auto_scale: Union[bool, Tuple[float, float]] = False,
+        catalog: Optional[FitsCatalog] = None,
+        cache: Optional[SpectrogramCache] = None,
+        **kwargs
+    ):
+        """
+        :param auto_scale: Take the color limits of every image from
+        quantiles (AUTO_QUANTILES, or the given ones) of its
+        background-subtracted decibels, instead of the fixed v_min and v_max.
+        :param catalog: FitsCatalog to look the FITS files given by name up in.
+        :param cache: SpectrogramCache of the decoded FITS files.
+        :param kwargs: Figure keyword arguments (see fitshelpers), the other
+        ones are passed on to imshow, as fitsplot does.
+        """
+        self.ext = ext
+        self.show_colorbar = show_colorbar
+        self.labels = get_labels(language)
+        self.labels_fontsize = labels_fontsize
+        self.axis_params_labelsize = axis_params_labelsize
+        self.background_window = background_window
+        self.auto_scale = auto_scale
+        self.fits_kwargs = {"catalog": catalog, "cache": cache}
+
+        figure_kwargs = figure_config(**kwargs)
+        del figure_kwargs["FigureClass"], figure_kwargs["clear"]
+        self.imshow_kwargs = imshow_config(**kwargs)
+        self.imshow_kwargs.update(
+            (key, value) for key, value in kwargs.items() if key not in figure_kwargs
+        )
+
+        self.figure = Figure(**figure_kwargs)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.image = None
+
+    def render(
+        self,
+        files: Sequence[Union[str, PurePath]],
+        output_dir: Optional[Union[str, Path]] = None,
+    ) -> Path:
+        """Render and save the quicklook image of consecutive FITS files.
+
+        :param files: Paths to the FITS files, or names of FITS files to be
+        looked for as ECallistoFitsFile does.
+        :param output_dir: Directory where the image is saved. Defaults to
+        the directory of the last FITS file.
+        :returns: Path to the saved image.
+        """
+        fitsfiles = [self._open(fits) for fits in sorted(files)]
+        sketch = QuantileSketch() if self.auto_scale else None
+        db, time_axis, _ = stitch_background(
+            fitsfiles, self.background_window, sketch=sketch
+        )
+        # The extent leaves out the lower 10 channels, as stitch does
+        frequency = fitsfiles[0].hdul_dataset["frequency"]
+        extent = [time_axis[0], time_axis[-1], frequency[-1], frequency[0]]
+
+        axes = self.axes
+        if self.image is None:
+            dataset = fitsfiles[-1].hdul_dataset
+            self._create_image(db, extent, dataset["v_min"], dataset["v_max"])
+        else:
+            self.image.set_data(db)
+            self.image.set_extent(extent)
+            # Let matplotlib pick the ticks again for the new time range
+            axes.xaxis.set_major_locator(AutoLocator())
+            axes.xaxis.set_major_formatter(ScalarFormatter())
+        self._auto_scale(sketch)
+
+        axes.set_xlim(time_axis[0], time_axis[-1])
+        # Follow the convention of inverting the Frequency axis
+        axes.set_ylim(frequency[0], frequency[-1])
+
+        locs, labels = time_ticks(axes.get_xticks(), time_axis[0], time_axis[-1])
+        axes.set_xticks(locs)
+        axes.set_xticklabels(labels)
+
+        title = plot_title([fits.filename for fits in fitsfiles], time_axis[-1])
+        axes.set_title(title, fontsize=16)
+
+        if output_dir is None:
+            output_dir = fitsfiles[-1].filepath.parent
+        else:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+        img_filepath = Path(output_dir, title + self.ext)
+        self.figure.savefig(img_filepath)
+
+        return img_filepath
+
+    def _create_image(self, db: np.ndarray, extent: list, v_min: float, v_max: float):
+        axes = self.axes
+        self.image = axes.imshow(
+            db, norm=Normalize(v_min, v_max), extent=extent, **self.imshow_kwargs
+        )
+        if self.show_colorbar:
+            cb = self.figure.colorbar(self.image, ax=axes)
+            cb.set_label(label=self.labels["colorbar"], fontsize=self.labels_fontsize)
+        axes.set_xlabel(self.labels["xlabel"], fontsize=self.labels_fontsize)
+        axes.set_ylabel(self.labels["ylabel"], fontsize=self.labels_fontsize)
+        axes.tick_params(labelsize=self.axis_params_labelsize)
+
+    def _auto_scale(self, sketch: Optional[QuantileSketch]):
+        if not self.auto_scale:
+            return
+        # Images without any value yet (all NaN) keep their color limits
+        if sketch.count:
+            quantiles = AUTO_QUANTILES if self.auto_scale is True else self.auto_scale
+            self.image.set_clim(*sketch.limits(quantiles))
+
+    def _open(self, fits: Union[str, PurePath]) -> ECallistoFitsFile:
+        filepath = Path(fits)
+        if filepath.is_file():
+            return ECallistoFitsFile(filepath.name, filepath, **self.fits_kwargs)
+
+        return ECallistoFitsFile(fits, **self.fits_kwargs)
+
+
+class BatchReport(NamedTuple):
+    """Outcome of a render_batch run."""
+
+    images: List[Path]
+    seconds: float
+    images_per_second: float
+
+
+_renderer = None  # QuicklookRenderer of a render_batch worker process
+
+
+def _init_worker(kwargs: dict):
+    global _renderer
+    _renderer = QuicklookRenderer(**kwargs)
+
+
+def _render(task: tuple) -> Path:
+    files, output_dir = task
+    return _renderer.render(files, output_dir)
+
+
+def render_batch(
+    manifest: Sequence[Sequence[Union[str, PurePath]]],
+    output_dir: Optional[Union[str, Path]] = None,
+    workers: Optional[int] = None,
+    **kwargs
+) -> BatchReport:
+    """Render the quicklook images of many groups of FITS files, on a pool
+    of worker processes that each reuse a single QuicklookRenderer.
+
+    :param manifest: Groups of consecutive FITS files, one per image.
+    :param output_dir: Directory where the images are saved. Defaults to
+    the directory of the last FITS file of each group.
+    :param workers: Number of worker processes. Defaults to the number of
+    processors on the machine.
+    :param kwargs: Keyword arguments passed on to QuicklookRenderer.
+    :returns: Paths to the saved images, in manifest order, along with the
+    elapsed time and the throughput.
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(kwargs,)
+    ) as executor:
+        images = list(
+            executor.map(_render, [(files, output_dir) for files in manifest])
+        )
+    seconds = time.perf_counter() - start
+
+    return BatchReport(images, seconds, len(images) / seconds)
@@ -0,0 +1,373 @@
+# FitsRfi: Per-station masks of the channels hit by radio interference
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import inspect
+import json
+import os
+import re
+from pathlib import Path
+from typing import NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .fitsbackground import DB_PER_DIGIT, ChannelHistogram
+from .fitsfile import ECallistoFitsFile
+from .fitsmetrics import stage
+
+# Scale of the median absolute deviation to the standard deviation of a
+# normal distribution
+MAD_TO_SIGMA = 1.4826
+
+
+class ChannelStatistics(NamedTuple):
+    """Robust statistics of the frequency channels of one or more FITS
+    files, computed from the histograms of their decibels. Every field is
+    shaped (files x channels), or (channels) for a single histogram."""
+
+    samples: np.ndarray  # Number of values
+    median: np.ndarray
+    sigma: np.ndarray  # Standard deviation estimated from the MAD
+    variance: np.ndarray
+    kurtosis: np.ndarray  # Excess kurtosis, 0 for normally distributed values
+    occupancy: np.ndarray  # Fraction of values far above the median
+
+
+class ChannelMask(NamedTuple):
+    """Mask of the channels of a station and frequency program, along with
+    how often every channel was flagged."""
+
+    station: str
+    frqfile: str
+    frequency: np.ndarray  # Frequency of every channel, in MHz
+    mask: np.ndarray  # False for the flagged channels
+    flagged: np.ndarray  # Fraction of the files every channel was flagged in
+    files: int  # Number of files the mask was derived from
+
+
+def channel_counts(fitsfile: ECallistoFitsFile) -> np.ndarray:
+    """Bin the values of every channel of a FITS file in steps of one
+    digit (as ChannelHistogram does by default), straight from its 8-bit
+    digits, without converting the image to decibels.
+
+    :param fitsfile: The FITS file.
+    :returns: Array of counts, with one row per channel.
+    """
+    scaled = fitsfile.read_scaled()
+    digits = scaled.digits
+    histogram = ChannelHistogram(digits.shape[0])
+    with stage("rfi_histogram", fitsfile.filename):
+        if digits.dtype != np.uint8:
+            return histogram.add(scaled.to_db())
+
+        # The digits above the image's minimum are the bins of its decibels
+        rows, levels = histogram.counts.shape
+        bins = digits.astype(np.intp)
+        bins -= scaled.minimum
+        bins += (np.arange(rows) * levels)[:, np.newaxis]
+        counts = np.bincount(bins.ravel(), minlength=rows * levels)
+
+    return counts.reshape(rows, levels)
+
+
+def channel_statistics(
+    counts: np.ndarray, step: float = DB_PER_DIGIT, occupancy_sigmas: float = 5.0
+) -> ChannelStatistics:
+    """Compute the statistics of every channel of many files at once from
+    their histograms.
+
+    :param counts: Histograms of the channels, shaped (channels x bins),
+    or (files x channels x bins).
+    :param step: Width of the bins, in dB.
+    :param occupancy_sigmas: Number of (robust) standard deviations above
+    the median from which a value counts towards the occupancy.
+    :returns: The statistics of every channel (of every file).
+    """
+    shape = counts.shape[:-1]
+    histogram = ChannelHistogram(0, step, counts.shape[-1])
+    histogram.counts = counts = counts.reshape(-1, counts.shape[-1])
+    values = np.arange(counts.shape[1]) * step
+    samples = counts.sum(axis=1)
+    weights = counts / np.maximum(samples, 1)[:, np.newaxis]
+
+    mean = weights @ values
+    deviations = values - mean[:, np.newaxis]
+    variance = np.sum(weights * deviations**2, axis=1)
+    fourth_moment = np.sum(weights * deviations**4, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kurtosis = np.where(variance > 0, fourth_moment / variance**2 - 3, 0.0)
+
+    # Median absolute deviation: the weighted median of the distances of
+    # the bins to the median of their channel
+    median = histogram.median()[:, 0]
+    distances = np.abs(values - median[:, np.newaxis])
+    order = np.argsort(distances, axis=1, kind="stable")
+    cumulative = np.cumsum(np.take_along_axis(counts, order, axis=1), axis=1)
+    middle = np.sum(cumulative < (samples[:, np.newaxis] + 1) / 2, axis=1)
+    middle = np.minimum(middle, counts.shape[1] - 1)
+    mad = np.take_along_axis(distances, order, axis=1)[np.arange(len(counts)), middle]
+    # Values are binned, so the spread is never taken below one bin
+    sigma = np.maximum(MAD_TO_SIGMA * mad, step)
+
+    high = values > (median + occupancy_sigmas * sigma)[:, np.newaxis]
+    occupancy = np.sum(weights * high, axis=1)
+
+    return ChannelStatistics(
+        *(
+            field.reshape(shape)
+            for field in (samples, median, sigma, variance, kurtosis, occupancy)
+        )
+    )
+
+
+def _robust_z(values: np.ndarray) -> np.ndarray:
+    """Robust z-scores along the last axis (the channels)."""
+    median = np.median(values, axis=-1, keepdims=True)
+    spread = MAD_TO_SIGMA * np.median(np.abs(values - median), axis=-1, keepdims=True)
+    spread = np.where(spread > 0, spread, np.std(values, axis=-1, keepdims=True))
+
+    return (values - median) / np.where(spread > 0, spread, 1.0)
+
+
+def flag_channels(
+    statistics: ChannelStatistics, threshold: float = 5.0, max_occupancy: float = 0.1
+) -> np.ndarray:
+    """Flag the channels whose variance or kurtosis stands out from the
+    ones of the other channels of the same file, or which are often far
+    above their median.
+
+    :param statistics: Statistics of every channel (of every file).
+    :param threshold: Number of (robust) standard deviations, over the
+    channels, above which a channel's variance or kurtosis is flagged.
+    :param max_occupancy: Largest fraction of values far above the median
+    of a channel that is not flagged.
+    :returns: Boolean array, True for the flagged channels.
+    """
+    # The variance is compared in log scale, with the quantization noise of
+    # the 8-bit digits added so that flat channels stay finite
+    variance = np.log(statistics.variance + DB_PER_DIGIT**2 / 12)
+    flagged = _robust_z(variance) > threshold
+    flagged |= _robust_z(statistics.kurtosis) > threshold
+    flagged |= statistics.occupancy > max_occupancy
+    flagged |= statistics.samples == 0
+
+    return flagged
+
+
+def derive_mask(
+    fitsfiles: Sequence[ECallistoFitsFile],
+    persistence: float = 0.5,
+    batch_size: int = 64,
+    **kwargs
+) -> ChannelMask:
+    """Derive the mask of the channels hit by interference from FITS files
+    of a station, with a frequency program.
+
+    Channels are flagged file by file, and only the ones flagged in at
+    least a `persistence` fraction of the files are masked, so that solar
+    bursts, which only stand out in a few files, are not mistaken for
+    interference.
+
+    :param fitsfiles: FITS files of a single station and frequency program.
+    :param persistence: Fraction of the files a channel has to be flagged
+    in to be masked.
+    :param batch_size: Number of files whose histograms are kept in memory
+    (and whose statistics are computed) at once.
+    :param kwargs: Keyword arguments passed on to flag_channels (threshold,
+    max_occupancy) and channel_statistics (occupancy_sigmas).
+    :returns: The channel mask.
+    """
+    if not fitsfiles:
+        raise ValueError("At least one FITS file is needed to mask channels.")
+    header = fitsfiles[0].hdul_dataset.header
+    station = header.get("INSTRUME", "")
+    frqfile = header.get("FRQFILE", "")
+    frequency = fitsfiles[0].hdul_dataset["f0"]
+    for fitsfile in fitsfiles[1:]:
+        file_header = fitsfile.hdul_dataset.header
+        if file_header.get("INSTRUME", "") != station or (
+            file_header.get("FRQFILE", "") != frqfile
+        ):
+            error_message = f"{fitsfile.filename} is not from {station} with "
+            error_message += f"the {frqfile} frequency program."
+            raise ValueError(error_message)
+        if not np.array_equal(fitsfile.hdul_dataset["f0"], frequency):
+            error_message = f"{fitsfile.filename} does not have the frequency "
+            error_message += f"channels of {fitsfiles[0].filename}."
+            raise ValueError(error_message)
+
+    occupancy_sigmas = kwargs.pop("occupancy_sigmas", 5.0)
+    times_flagged = np.zeros(len(frequency), dtype=np.int64)
+    for start in range(0, len(fitsfiles), batch_size):
+        batch = fitsfiles[start : start + batch_size]
+        counts = np.stack([channel_counts(fitsfile) for fitsfile in batch])
+        statistics = channel_statistics(counts, occupancy_sigmas=occupancy_sigmas)
+        times_flagged += flag_channels(statistics, **kwargs).sum(axis=0)
+
+    flagged = times_flagged / len(fitsfiles)
+
+    return ChannelMask(
+        station, frqfile, frequency, flagged < persistence, flagged, len(fitsfiles)
+    )
+
+
+class ChannelMaskCache(object):
+    """On-disk cache of the channel masks of every station and frequency
+    program (FRQFILE), so they are derived once and reused across runs.
+
+    Every entry is a single .npz file. A cached mask is only used for files
+    whose frequency channels are the ones it was derived from, and with the
+    derive_mask keyword arguments it was derived with (given explicitly or
+    left to their defaults).
+    """
+
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)  # Directory holding the entries
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, station: str, frqfile: str) -> Path:
+        """Get the path of the entry of a station and frequency program."""
+        name = re.sub(r"[^\w.-]", "_", f"{station}_{frqfile}")
+
+        return self.cache_dir / f"{name}.npz"
+
+    def get(
+        self,
+        station: str,
+        frqfile: str,
+        frequency: Optional[np.ndarray] = None,
+        parameters: Optional[dict] = None,
+    ) -> Optional[ChannelMask]:
+        """Look up the mask of a station and frequency program.
+
+        :param station: Name of the station (INSTRUME).
+        :param frqfile: Name of the frequency program (FRQFILE).
+        :param frequency: Frequency channels the mask has to match, if given.
+        :param parameters: Keyword arguments of derive_mask the mask has to
+        have been derived with, if given.
+        :returns: The cached mask, or None on a cache miss.
+        """
+        try:
+            with np.load(self.path(station, frqfile)) as entry:
+                # Entries stored without parameters used the defaults
+                stored = str(entry["parameters"]) if "parameters" in entry else "{}"
+                cached = ChannelMask(
+                    station,
+                    frqfile,
+                    entry["frequency"],
+                    entry["mask"],
+                    entry["flagged"],
+                    int(entry["files"]),
+                )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+        if frequency is not None and not np.array_equal(cached.frequency, frequency):
+            return None
+        if parameters is not None and (
+            _parameters(json.loads(stored)) != _parameters(parameters)
+        ):
+            return None
+
+        return cached
+
+    def put(self, channel_mask: ChannelMask, parameters: Optional[dict] = None):
+        """Store the mask of a station and frequency program, replacing the
+        one stored before, if any.
+
+        :param channel_mask: The mask.
+        :param parameters: Keyword arguments of derive_mask the mask was
+        derived with.
+        """
+        entry = self.path(channel_mask.station, channel_mask.frqfile)
+        # Write to a temporary file first, so that concurrent readers never
+        # see a partially written entry.
+        tmp_entry = entry.with_name(f".{entry.stem}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_entry,
+            frequency=channel_mask.frequency,
+            mask=channel_mask.mask,
+            flagged=channel_mask.flagged,
+            files=channel_mask.files,
+            parameters=json.dumps(_parameters(parameters or {}), sort_keys=True),
+        )
+        os.replace(tmp_entry, entry)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        for entry in self.cache_dir.glob("*.npz"):
+            entry.unlink()
+
+
+def _parameters(parameters: dict) -> dict:
+    """Keyword arguments of derive_mask, along with the defaults of the ones
+    not given, so that masks derived with the same settings are equal
+    whether they were given or not.
+    """
+    defaults = {}
+    for function, names in (
+        (derive_mask, ("persistence",)),
+        (flag_channels, ("threshold", "max_occupancy")),
+        (channel_statistics, ("occupancy_sigmas",)),
+    ):
+        signature = inspect.signature(function)
+        defaults.update((name, signature.parameters[name].default) for name in names)
+    # batch_size only changes how many files are processed at once
+    parameters = {
+        key: value for key, value in parameters.items() if key != "batch_size"
+    }
+
+    return {**defaults, **parameters}
+
+
+def channel_mask(
+    fitsfiles: Sequence[ECallistoFitsFile],
+    cache: Optional[ChannelMaskCache] = None,
+    **kwargs
+) -> np.ndarray:
+    """Get the mask of the channels hit by interference of FITS files of a
+    station, with a frequency program. It is taken from the cache if it
+    was already derived, else it is derived from the files and stored in
+    the cache, along with the keyword arguments it was derived with (a
+    mask derived with other arguments is derived again).
+
+    The mask can be given to ECallistoFitsFile.read_db (as `rows`), stitch
+    or fitsplot, so the flagged channels are never converted to decibels.
+
+    :param fitsfiles: FITS files of a single station and frequency program.
+    :param cache: Optional ChannelMaskCache to look the mask up in.
+    :param kwargs: Keyword arguments passed on to derive_mask.
+    :returns: Boolean mask of the channels to keep (False for flagged ones).
+    """
+    if cache is not None and fitsfiles:
+        header = fitsfiles[0].hdul_dataset.header
+        cached = cache.get(
+            header.get("INSTRUME", ""),
+            header.get("FRQFILE", ""),
+            fitsfiles[0].hdul_dataset["f0"],
+            kwargs,
+        )
+        if cached is not None:
+            return cached.mask
+
+    derived = derive_mask(fitsfiles, **kwargs)
+    if cache is not None:
+        cache.put(derived, kwargs)
+
+    return derived.mask
@@ -0,0 +1,146 @@
+# FitsScale: Automatic color limits of spectrogram plots
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+from typing import Iterable, Tuple, Union
+
+import numpy as np
+
+from .fitsbackground import DB_PER_DIGIT
+
+# Quantiles of the background-subtracted decibels used as color limits
+AUTO_QUANTILES = (0.05, 0.995)
+
+
+class QuantileSketch(object):
+    """Fixed-bin histogram of decibel values, from which quantiles are read
+    in a single pass over the data and with bounded memory.
+
+    Bins are half a digit wide by default, the resolution of decibels
+    decoded from 8-bit digits once a median has been subtracted, so the
+    quantiles are off by at most half a bin. Values out of the range of
+    the bins are counted in the first or last bin, and NaNs (e.g., of
+    masked channels) are left out. Sketches built from different parts of
+    the data (e.g., by different workers) are merged by adding them up.
+    """
+
+    BLOCK_SIZE = 1 << 16
+
+    def __init__(
+        self, low: float = -100.0, high: float = 100.0, step: float = DB_PER_DIGIT / 2
+    ):
+        """
+        :param low: Lower edge of the first bin, in dB.
+        :param high: Upper edge of the last bin, in dB.
+        :param step: Width of the bins, in dB.
+        """
+        self.low = low
+        self.step = step
+        self.counts = np.zeros(int(np.ceil((high - low) / step)), dtype=np.int64)
+
+    @property
+    def count(self) -> int:
+        """Number of values added to the sketch."""
+        return int(self.counts.sum())
+
+    def add(self, values: np.ndarray) -> "QuantileSketch":
+        """Add an array of decibels (of any shape) to the sketch.
+
+        :param values: Array of decibels.
+        :returns: The sketch itself.
+        """
+        values = np.asarray(values).reshape(-1)
+        # A block of values at a time, so the temporary arrays stay small
+        for start in range(0, values.size, self.BLOCK_SIZE):
+            bins = values[start : start + self.BLOCK_SIZE] - np.float32(self.low)
+            bins /= np.float32(self.step)
+            np.floor(bins, out=bins)
+            nan = np.isnan(bins)
+            if nan.any():
+                bins = bins[~nan]
+            np.clip(bins, 0, self.counts.size - 1, out=bins)
+            self.counts += np.bincount(bins.astype(np.intp), minlength=self.counts.size)
+
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add the counts of another sketch, with the same bins, to this one.
+
+        :param other: The other sketch.
+        :returns: The sketch itself.
+        """
+        if (other.low, other.step, other.counts.size) != (
+            self.low,
+            self.step,
+            self.counts.size,
+        ):
+            raise ValueError("Only sketches with the same bins can be merged.")
+        self.counts += other.counts
+
+        return self
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Get quantiles of the values added so far.
+
+        :param q: Quantile, or array of quantiles, between 0 and 1.
+        :returns: Center of the bin holding every quantile.
+        """
+        count = self.count
+        if not count:
+            raise ValueError("Quantiles of an empty sketch are undefined.")
+        ranks = np.asarray(q, dtype=np.float64) * (count - 1)
+        bins = np.searchsorted(np.cumsum(self.counts), ranks, side="right")
+
+        return self.low + (bins + 0.5) * self.step
+
+    def limits(
+        self, quantiles: Tuple[float, float] = AUTO_QUANTILES
+    ) -> Tuple[float, float]:
+        """Get color limits from the quantiles of the values added so far.
+
+        :param quantiles: Quantiles used as the lower and upper limits.
+        :returns: Lower and upper color limits, in dB.
+        """
+        v_min, v_max = self.quantile(quantiles)
+
+        return float(v_min), float(v_max)
+
+
+def auto_limits(
+    chunks: Iterable[np.ndarray],
+    quantiles: Tuple[float, float] = AUTO_QUANTILES,
+    **kwargs
+) -> Tuple[float, float]:
+    """Get color limits from the quantiles of background-subtracted
+    decibels, without sorting (or copying) them.
+
+    :param chunks: Arrays of background-subtracted decibels, e.g., a whole
+    spectrogram or the chunks of subtract_background.
+    :param quantiles: Quantiles used as the lower and upper limits.
+    :param kwargs: Keyword arguments passed on to QuantileSketch.
+    :returns: Lower and upper color limits, in dB.
+    """
+    if isinstance(chunks, np.ndarray):
+        chunks = [chunks]
+    sketch = QuantileSketch(**kwargs)
+    for chunk in chunks:
+        sketch.add(chunk)
+
+    return sketch.limits(quantiles)
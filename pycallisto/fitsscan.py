@@ -0,0 +1,311 @@
+# FitsScan: Fast header-only scans of many e-Callisto FITS files
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path, PurePath
+from typing import BinaryIO, Iterable, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .fitserror import FitsFileError
+
+BLOCK_SIZE = 2880  # Size of the FITS header and data blocks
+CARD_SIZE = 80
+STRING_VALUE = re.compile(r"'((?:[^']|'')*)'")
+TFORM = re.compile(r"^\s*(\d*)([LXBIJKAEDCMPQ])")
+# Big-endian NumPy types of the numeric binary table formats
+TFORM_DTYPES = {"B": "u1", "I": ">i2", "J": ">i4", "K": ">i8", "E": ">f4", "D": ">f8"}
+# Bytes per element of every binary table format (bits for X)
+TFORM_SIZES = {"L": 1, "A": 1, "C": 8, "M": 16, "P": 8, "Q": 16, "X": 1 / 8}
+TFORM_SIZES.update(
+    {code: np.dtype(dtype).itemsize for code, dtype in TFORM_DTYPES.items()}
+)
+
+SCAN_DTYPE = [
+    ("instrument", "U16"),  # INSTRUME, the station
+    ("frqfile", "U16"),  # FRQFILE, the frequency program
+    ("start", "M8[ms]"),  # DATE-OBS and TIME-OBS
+    ("end", "M8[ms]"),  # DATE-END and TIME-END
+    ("rows", "i4"),  # Frequency channels
+    ("columns", "i4"),  # Time samples
+    ("dt", "f4"),  # Time step, in seconds
+    ("freq_low", "f4"),  # Lowest frequency, in MHz
+    ("freq_high", "f4"),  # Highest frequency, in MHz
+    ("size", "i8"),  # Size of the file, in bytes
+]
+
+
+class HeaderSummary(NamedTuple):
+    """Inventory fields of an e-Callisto FITS file, as read by scan_header."""
+
+    path: str
+    instrument: str
+    frqfile: str
+    start: np.datetime64
+    end: np.datetime64
+    rows: int
+    columns: int
+    dt: float
+    freq_low: float
+    freq_high: float
+    size: int
+
+
+class FitsStream(object):
+    """Reads a FITS file, gzipped or not, from the start, skipping over the
+    data that is not needed.
+
+    Gzipped data has to be decompressed to be skipped, but it is done in
+    chunks that are thrown away right away, so that no array (or bytes
+    object) the size of the image is ever allocated.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        self._buffer = bytearray()  # Decompressed bytes not read yet
+        gzipped = file.read(2) == b"\x1f\x8b"
+        file.seek(0)
+        self._decompressor = zlib.decompressobj(31) if gzipped else None
+
+    def read(self, size: int) -> bytes:
+        """Read the next `size` bytes (decompressed) of the FITS file."""
+        if self._decompressor is None:
+            data = self._file.read(size)
+        else:
+            self._fill(size)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        if len(data) < size:
+            raise FitsFileError("Unexpected end of the FITS file.")
+
+        return data
+
+    def skip(self, size: int):
+        """Skip over the next `size` bytes (decompressed) of the FITS file."""
+        if self._decompressor is None:
+            self._file.seek(size, os.SEEK_CUR)
+            return
+
+        while len(self._buffer) < size:
+            size -= len(self._buffer)
+            self._buffer.clear()
+            if not self._decompress_chunk():
+                raise FitsFileError("Unexpected end of the FITS file.")
+        del self._buffer[:size]
+
+    def _fill(self, size: int):
+        while len(self._buffer) < size and self._decompress_chunk():
+            pass
+
+    def _decompress_chunk(self) -> bool:
+        chunk = self._file.read(self.CHUNK_SIZE)
+        if not chunk:
+            return False
+        self._buffer += self._decompressor.decompress(chunk)
+        if self._decompressor.eof and self._decompressor.unused_data:
+            # Next member of a multi-member gzip file
+            unused_data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(31)
+            self._buffer += self._decompressor.decompress(unused_data)
+
+        return True
+
+
+def _parse_value(value: str):
+    if value.startswith("'"):
+        match = STRING_VALUE.match(value)
+        if match is None:
+            raise FitsFileError(f"Invalid string value in a FITS card: {value}")
+        return match.group(1).replace("''", "'").rstrip()
+
+    value = value.split("/", 1)[0].strip()
+    if value in ("T", "F"):
+        return value == "T"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.replace("D", "E"))
+    except ValueError:
+        return value
+
+
+def read_header(stream: FitsStream) -> dict:
+    """Read a FITS header, block by block, up to its END card.
+
+    Only the cards with a value are kept, without their comments.
+
+    :param stream: Stream positioned at the start of the header.
+    :returns: Values of the header cards, by keyword.
+    """
+    cards = {}
+    while True:
+        block = stream.read(BLOCK_SIZE).decode("ascii", "replace")
+        for offset in range(0, BLOCK_SIZE, CARD_SIZE):
+            card = block[offset : offset + CARD_SIZE]
+            keyword = card[:8].rstrip()
+            if keyword == "END":
+                return cards
+            if card[8:10] == "= ":
+                cards[keyword] = _parse_value(card[10:].strip())
+
+
+def data_size(header: dict) -> int:
+    """Size of the data following a header, padded to whole blocks."""
+    size = abs(header["BITPIX"]) // 8
+    for axis in range(1, header["NAXIS"] + 1):
+        size *= header[f"NAXIS{axis}"]
+    if header["NAXIS"] == 0:
+        size = 0
+    size += header.get("PCOUNT", 0)
+
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def table_column(header: dict, data: bytes, name: str) -> np.ndarray:
+    """Get the first row of a column of binary table data."""
+    offset = 0
+    for field in range(1, header["TFIELDS"] + 1):
+        match = TFORM.match(header[f"TFORM{field}"])
+        count = int(match.group(1) or 1)
+        code = match.group(2)
+        if header.get(f"TTYPE{field}", "").upper() == name:
+            if code not in TFORM_DTYPES:
+                error_message = f"Unsupported format of the {name} column: "
+                error_message += header[f"TFORM{field}"]
+                raise FitsFileError(error_message)
+            column = np.frombuffer(data, TFORM_DTYPES[code], count, offset)
+            column = column.astype(np.float64)
+            column *= header.get(f"TSCAL{field}", 1.0)
+            column += header.get(f"TZERO{field}", 0.0)
+            return column
+        offset += int(np.ceil(count * TFORM_SIZES[code]))
+
+    raise FitsFileError(f"The binary table has no {name} column.")
+
+
+def obs_datetime(date: str, time: str) -> np.datetime64:
+    """Turn a FITS date (e.g., DATE-OBS) and time (e.g., TIME-OBS) into a
+    datetime64, in milliseconds."""
+    hours, minutes, seconds = time.split(":")
+    milliseconds = (int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 1000
+
+    return np.datetime64(date.replace("/", "-"), "ms") + np.timedelta64(
+        int(round(milliseconds)), "ms"
+    )
+
+
+def scan_header(filepath: Union[str, PurePath]) -> HeaderSummary:
+    """Read the inventory fields of an e-Callisto FITS file from its primary
+    header and its binary table, skipping over the image data without
+    converting it (or, if the file is not gzipped, without reading it).
+
+    :param filepath: Path to the FITS file.
+    :returns: The inventory fields.
+    """
+    with open(filepath, "rb") as file:
+        stream = FitsStream(file)
+        try:
+            primary = read_header(stream)
+            stream.skip(data_size(primary))
+            extension = read_header(stream)
+            table = stream.read(extension["NAXIS1"])
+            time = table_column(extension, table, "TIME")
+            frequency = table_column(extension, table, "FREQUENCY")
+            start = obs_datetime(primary["DATE-OBS"], primary["TIME-OBS"])
+        except (KeyError, ValueError, zlib.error) as error:
+            error_message = f"{Path(filepath).name} is not a valid e-Callisto "
+            error_message += f"FITS file ({error!r})."
+            raise FitsFileError(error_message)
+        size = os.fstat(file.fileno()).st_size
+
+    dt = time[1] - time[0] if time.size > 1 else primary.get("CDELT1", 0.0)
+    try:
+        end = obs_datetime(primary["DATE-END"], primary["TIME-END"])
+    except (KeyError, ValueError):
+        end = start + np.timedelta64(int(round(dt * time.size * 1000)), "ms")
+
+    return HeaderSummary(
+        str(filepath),
+        primary.get("INSTRUME", ""),
+        primary.get("FRQFILE", ""),
+        start,
+        end,
+        primary["NAXIS2"],
+        primary["NAXIS1"],
+        dt,
+        frequency.min(),
+        frequency.max(),
+        size,
+    )
+
+
+def _scan(filepath: str, skip_errors: bool) -> Optional[HeaderSummary]:
+    try:
+        return scan_header(filepath)
+    except (FitsFileError, OSError):
+        if skip_errors:
+            return None
+        raise
+
+
+def scan_headers(
+    files: Iterable[Union[str, PurePath]],
+    workers: Optional[int] = None,
+    processes: bool = False,
+    errors: str = "raise",
+) -> np.ndarray:
+    """Scan the headers of many FITS files on a pool of threads (which run
+    in parallel while decompressing) or of processes.
+
+    :param files: Paths to the FITS files.
+    :param workers: Number of workers. Defaults to the pool's default.
+    :param processes: Use a pool of processes instead of threads.
+    :param errors: Either "raise" to stop at the first invalid file, or
+    "skip" to leave invalid files out of the result.
+    :returns: Structured array with a "path" field and the SCAN_DTYPE
+    fields, one element per (valid) file, in the order of `files`.
+    """
+    if errors not in ("raise", "skip"):
+        raise ValueError(f'errors must be "raise" or "skip", not {errors!r}.')
+    filepaths = [str(filepath) for filepath in files]
+    skip_errors = [errors == "skip"] * len(filepaths)
+
+    if processes:
+        # Send the files to the worker processes in batches
+        chunksize = max(1, len(filepaths) // (8 * (workers or os.cpu_count() or 1)))
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        chunksize = 1
+        executor = ThreadPoolExecutor(max_workers=workers)
+    with executor:
+        summaries = executor.map(_scan, filepaths, skip_errors, chunksize=chunksize)
+        summaries = [summary for summary in summaries if summary is not None]
+
+    width = max((len(summary.path) for summary in summaries), default=1)
+
+    return np.array(summaries, dtype=[("path", f"U{width}")] + SCAN_DTYPE)
@@ -0,0 +1,227 @@
+# FitsSpectrogram: Compact spectrograms with zero-copy slicing
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import weakref
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SharedSpectrogram(NamedTuple):
+    """Handle of a spectrogram whose array of decibels was copied into a
+    block of shared memory by Spectrogram.share. Only the (small) axes are
+    pickled along with it."""
+
+    name: str  # Name of the block of shared memory
+    shape: Tuple[int, int]
+    dtype: str  # Type of the array of decibels, e.g., "<f4"
+    time_axis: np.ndarray
+    frequency: np.ndarray
+
+
+class Spectrogram(object):
+    """Array of decibels (channels x time) of one or more e-Callisto FITS
+    files, along with its time axis (in hours) and the frequency of every
+    channel (in MHz).
+
+    Indexing it with slices, e.g., spectrogram[10:50, 1000:2000], or
+    slicing it by time or frequency returns a Spectrogram whose arrays are
+    views of the original ones, not copies. It can be unpacked as the
+    (db, time_axis, frequency) tuple returned by stitch.
+    """
+
+    __slots__ = ("db", "time_axis", "frequency")
+
+    def __init__(self, db: np.ndarray, time_axis: np.ndarray, frequency: np.ndarray):
+        """
+        :param db: Array of decibels, with one row per channel.
+        :param time_axis: Time of every column, in hours.
+        :param frequency: Frequency of every row, in MHz.
+        """
+        if db.ndim != 2 or db.shape != (len(frequency), len(time_axis)):
+            error_message = f"An array of decibels shaped {db.shape} does not "
+            error_message += f"match {len(frequency)} frequency channels and "
+            error_message += f"{len(time_axis)} time samples."
+            raise ValueError(error_message)
+        self.db = db
+        self.time_axis = time_axis
+        self.frequency = frequency
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.db.shape
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes taken by the arrays (or the parts of them it views)."""
+        return self.db.nbytes + self.time_axis.nbytes + self.frequency.nbytes
+
+    def __repr__(self):
+        rows, columns = self.shape
+        if not columns:
+            return f"Spectrogram({rows} channels x 0 samples)"
+
+        return (
+            f"Spectrogram({rows} channels x {columns} samples, "
+            f"{self.time_axis[0]:.4f} h - {self.time_axis[-1]:.4f} h)"
+        )
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        yield self.db
+        yield self.time_axis
+        yield self.frequency
+
+    def __getitem__(self, key) -> "Spectrogram":
+        """Select channels (rows) and time samples (columns). Slices give
+        views, while boolean or integer arrays give copies, as in NumPy.
+        """
+        rows, columns = key if isinstance(key, tuple) else (key, slice(None))
+        # Integers select a single row or column, without dropping the axis
+        if isinstance(rows, (int, np.integer)):
+            rows = slice(rows, rows + 1 or None)
+        if isinstance(columns, (int, np.integer)):
+            columns = slice(columns, columns + 1 or None)
+        if isinstance(rows, slice) or isinstance(columns, slice):
+            db = self.db[rows, columns]
+        else:
+            db = self.db[np.ix_(rows, columns)]
+
+        return Spectrogram(db, self.time_axis[columns], self.frequency[rows])
+
+    def __reduce__(self):
+        # Only the parts of the arrays the spectrogram views are pickled
+        return Spectrogram, (self.db, self.time_axis, self.frequency)
+
+    def time_slice(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> "Spectrogram":
+        """Get the time samples between two times (both included), as views.
+
+        :param start: Start time, in hours. Unbounded if not given.
+        :param end: End time, in hours. Unbounded if not given.
+        :returns: Spectrogram viewing the samples.
+        """
+        first = 0 if start is None else np.searchsorted(self.time_axis, start)
+        last = (
+            len(self.time_axis)
+            if end is None
+            else np.searchsorted(self.time_axis, end, side="right")
+        )
+
+        return self[:, first:last]
+
+    def frequency_slice(
+        self, low: Optional[float] = None, high: Optional[float] = None
+    ) -> "Spectrogram":
+        """Get the channels between two frequencies (both included), as
+        views. The channels of e-Callisto files are sorted by decreasing
+        frequency, so this is the range of rows from the first to the last
+        channel in the band.
+
+        :param low: Lowest frequency, in MHz. Unbounded if not given.
+        :param high: Highest frequency, in MHz. Unbounded if not given.
+        :returns: Spectrogram viewing the channels.
+        """
+        in_band = np.ones(len(self.frequency), dtype=bool)
+        if low is not None:
+            in_band &= self.frequency >= low
+        if high is not None:
+            in_band &= self.frequency <= high
+        channels = np.flatnonzero(in_band)
+        if not channels.size:
+            return self[0:0, :]
+
+        return self[channels[0] : channels[-1] + 1, :]
+
+    def copy(self) -> "Spectrogram":
+        """Copy the arrays (e.g., to release the larger arrays a slice of
+        the spectrogram is a view of)."""
+        return Spectrogram(self.db.copy(), self.time_axis.copy(), self.frequency.copy())
+
+    @classmethod
+    def concatenate(cls, spectrograms: Sequence["Spectrogram"]) -> "Spectrogram":
+        """Join spectrograms with the same channels along time, allocating
+        the result once.
+
+        :param spectrograms: Spectrograms, in time order.
+        :returns: The joined spectrogram.
+        """
+        if not spectrograms:
+            raise ValueError("At least one spectrogram is needed to concatenate.")
+        frequency = spectrograms[0].frequency
+        for spectrogram in spectrograms[1:]:
+            if not np.array_equal(spectrogram.frequency, frequency):
+                error_message = "Only spectrograms with the same frequency "
+                error_message += "channels can be concatenated."
+                raise ValueError(error_message)
+
+        db = np.concatenate([spectrogram.db for spectrogram in spectrograms], axis=1)
+        time_axis = np.concatenate(
+            [spectrogram.time_axis for spectrogram in spectrograms]
+        )
+
+        return cls(db, time_axis, frequency)
+
+    def share(self) -> SharedSpectrogram:
+        """Copy the array of decibels into a new block of shared memory, to
+        be sent to another process (e.g., a worker of a process pool), which
+        maps it back with Spectrogram.attach.
+
+        The block is owned by the process that attaches it, which releases
+        it once the attached array is garbage collected.
+
+        :returns: Handle of the shared spectrogram.
+        """
+        shm = SharedMemory(create=True, size=max(1, self.db.nbytes))
+        try:
+            np.ndarray(self.shape, dtype=self.db.dtype, buffer=shm.buf)[...] = self.db
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        shm.close()
+        # The attaching process unlinks the block, not the resource tracker
+        # of this one when it exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+        return SharedSpectrogram(
+            shm.name, self.shape, self.db.dtype.str, self.time_axis, self.frequency
+        )
+
+    @classmethod
+    def attach(cls, shared: SharedSpectrogram) -> "Spectrogram":
+        """Map a spectrogram shared by Spectrogram.share, without copying it.
+
+        The block of shared memory is unlinked right away, so it is
+        released as soon as the spectrogram's array of decibels (and every
+        view of it) is garbage collected.
+
+        :param shared: Handle of the shared spectrogram.
+        :returns: The spectrogram.
+        """
+        shm = SharedMemory(name=shared.name)
+        shm.unlink()
+        db = np.ndarray(shared.shape, dtype=shared.dtype, buffer=shm.buf)
+        weakref.finalize(db, shm.close)
+
+        return cls(db, shared.time_axis, shared.frequency)
@@ -0,0 +1,319 @@
+# FitsStitch: Functions for joining FITS files along the time axis
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+from collections import deque
+from datetime import datetime, time, timedelta
+from pathlib import PurePath
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .fitsbackground import ChannelHistogram, RunningBackground
+from .fitscatalog import FitsCatalog
+from .fitsfile import ECallistoFitsFile
+from .fitsscale import QuantileSketch
+from .fitsspectrogram import Spectrogram
+
+
+def stitch_spectrogram(
+    files: Sequence[Union[str, PurePath, ECallistoFitsFile]],
+    channel_mask: Optional[np.ndarray] = None,
+    **kwargs
+) -> Spectrogram:
+    """Join the spectrograms of consecutive e-Callisto FITS files.
+
+    The shapes of all files are read from their headers first, so that the
+    result is allocated once and every file is decoded straight into its
+    own slice of it.
+
+    :param files: FITS files (or their names), in time order.
+    :param channel_mask: Optional boolean mask of the frequency channels to
+    keep (e.g., from pycallisto.fitsrfi.channel_mask). The other channels
+    are neither converted nor included in the result.
+    :param kwargs: Keyword arguments passed on to ECallistoFitsFile
+    (e.g., catalog or cache) for the files given by name.
+    :returns: The joined spectrogram.
+    """
+    spectrogram, blocks = _stitch_blocks(files, channel_mask, **kwargs)
+    for _ in blocks:
+        pass
+
+    return spectrogram
+
+
+def _stitch_blocks(
+    files: Sequence[Union[str, PurePath, ECallistoFitsFile]],
+    channel_mask: Optional[np.ndarray] = None,
+    **kwargs
+) -> Tuple[Spectrogram, Iterator[Tuple[ECallistoFitsFile, np.ndarray]]]:
+    """Allocate the joined spectrogram of consecutive FITS files, and get
+    an iterator that decodes every file into its own block of columns of
+    it, yielding the file and its block once decoded."""
+    fitsfiles = [
+        (
+            fits
+            if isinstance(fits, ECallistoFitsFile)
+            else ECallistoFitsFile(fits, **kwargs)
+        )
+        for fits in files
+    ]
+    if not fitsfiles:
+        raise ValueError("At least one FITS file is needed for stitching.")
+
+    rows = fitsfiles[0].hdul_dataset["rows"]
+    for fitsfile in fitsfiles:
+        if fitsfile.hdul_dataset["rows"] != rows:
+            error_message = f"{fitsfile.filename} has "
+            error_message += f"{fitsfile.hdul_dataset['rows']} frequency channels, "
+            error_message += f"but {fitsfiles[0].filename} has {rows}."
+            raise ValueError(error_message)
+    columns = sum(fitsfile.hdul_dataset["columns"] for fitsfile in fitsfiles)
+    kept = slice(None)
+    if channel_mask is not None:
+        if len(channel_mask) != rows:
+            error_message = f"The channel mask has {len(channel_mask)} channels, "
+            error_message += f"but {fitsfiles[0].filename} has {rows}."
+            raise ValueError(error_message)
+        kept = np.asarray(channel_mask, dtype=bool)
+        rows = np.count_nonzero(kept)
+
+    db = np.empty((rows, columns), dtype=np.float32)
+    time_axis = np.empty(columns)
+    start = 0
+    for fitsfile in fitsfiles:
+        end = start + fitsfile.hdul_dataset["columns"]
+        time_axis[start:end] = fitsfile.hdul_dataset["time_axis"]
+        start = end
+
+    def decode() -> Iterator[Tuple[ECallistoFitsFile, np.ndarray]]:
+        start = 0
+        for fitsfile in fitsfiles:
+            end = start + fitsfile.hdul_dataset["columns"]
+            block = fitsfile.read_db(out=db[:, start:end], rows=kept)
+            yield fitsfile, block
+            start = end
+
+    spectrogram = Spectrogram(db, time_axis, fitsfiles[0].hdul_dataset["f0"][kept])
+
+    return spectrogram, decode()
+
+
+def stitch_background(
+    files: Sequence[Union[str, PurePath, ECallistoFitsFile]],
+    window: Optional[int] = None,
+    channel_mask: Optional[np.ndarray] = None,
+    sketch: Optional[QuantileSketch] = None,
+    **kwargs
+) -> Spectrogram:
+    """Join the spectrograms of consecutive e-Callisto FITS files, as
+    stitch_spectrogram does, with their per-channel background subtracted,
+    as pycallisto.fitsbackground.remove_background does.
+
+    The background is estimated from the blocks of every file as they are
+    decoded, while they are still in the processor's caches, and then
+    subtracted in place, so no array the size of the result is allocated
+    besides the result itself.
+
+    :param files: FITS files (or their names), in time order.
+    :param window: Width, in columns, of the running median to subtract.
+    If not given, the median of every whole channel is subtracted (from the
+    binned values, see ChannelHistogram, except for a single file whose
+    dataset's "db_median" was already computed).
+    :param channel_mask: See stitch_spectrogram.
+    :param sketch: Optional QuantileSketch (e.g., for color limits) to which
+    the background-subtracted values of every block are added right after
+    it is subtracted, so the result is not read once more.
+    :param kwargs: Keyword arguments passed on to ECallistoFitsFile
+    (e.g., catalog or cache) for the files given by name.
+    :returns: The joined, background-subtracted spectrogram.
+    """
+    spectrogram, blocks = _stitch_blocks(files, channel_mask, **kwargs)
+    db = spectrogram.db
+
+    if window is None:
+        histogram = ChannelHistogram(db.shape[0])
+        decoded = []
+        for fitsfile, block in blocks:
+            decoded.append(block)
+            histogram.add(block)
+        dataset = fitsfile.hdul_dataset
+        if (
+            len(decoded) == 1
+            and channel_mask is None
+            and dataset.is_loaded("db_median")
+        ):
+            # The median the file was already decoded with
+            median = dataset["db_median"]
+        else:
+            median = histogram.median()
+        for block in decoded:
+            block -= median
+            if sketch is not None:
+                sketch.add(block)
+
+        return spectrogram
+
+    # Blocks a fraction of the window wide, so that the background follows
+    # the window closely, written back over the blocks they were taken from
+    running = RunningBackground(window)
+    pending = deque()
+    for _, block in blocks:
+        for part in np.array_split(block, max(1, 8 * block.shape[1] // window), axis=1):
+            pending.append(part)
+            for subtracted in running.push(part):
+                pending.popleft()[...] = subtracted
+                if sketch is not None:
+                    sketch.add(subtracted)
+    for subtracted in running.flush():
+        pending.popleft()[...] = subtracted
+        if sketch is not None:
+            sketch.add(subtracted)
+
+    return spectrogram
+
+
+def stitch(
+    files: Sequence[Union[str, PurePath, ECallistoFitsFile]],
+    channel_mask: Optional[np.ndarray] = None,
+    **kwargs
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Join the spectrograms of consecutive e-Callisto FITS files, as
+    stitch_spectrogram does.
+
+    :param files: FITS files (or their names), in time order.
+    :param channel_mask: See stitch_spectrogram.
+    :param kwargs: Keyword arguments passed on to ECallistoFitsFile
+    (e.g., catalog or cache) for the files given by name.
+    :returns: Array of decibels, time axis (in hours) and frequency channels
+    (with a mask, the frequency of every row of the array).
+    """
+    fitsfiles = [
+        (
+            fits
+            if isinstance(fits, ECallistoFitsFile)
+            else ECallistoFitsFile(fits, **kwargs)
+        )
+        for fits in files
+    ]
+    spectrogram = stitch_spectrogram(fitsfiles, channel_mask)
+    if channel_mask is not None:
+        return tuple(spectrogram)
+
+    # Without a mask, the frequency channels are the ones of the dataset,
+    # which leaves out the lower 10 channels
+    return (
+        spectrogram.db,
+        spectrogram.time_axis,
+        fitsfiles[0].hdul_dataset["frequency"],
+    )
+
+
+def load_range(
+    station: str,
+    start: datetime,
+    end: datetime,
+    freq_low: Optional[float] = None,
+    freq_high: Optional[float] = None,
+    catalog: Optional[FitsCatalog] = None,
+    focus_code: Optional[str] = None,
+    lookback: timedelta = timedelta(hours=1),
+    **kwargs,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Load the spectrogram of a station over a time and frequency window.
+
+    Candidate files are picked from the catalog by the start times in
+    their names, and their actual time axes are then read from their
+    headers, so only the files (and the columns and rows of them) that
+    overlap the window are decoded. Columns of overlapping files that
+    repeat times already loaded are skipped, and gaps between files are
+    left as they are in the time axis.
+
+    :param station: Name of the station (e.g., BLEN7M).
+    :param start: Start of the window.
+    :param end: End of the window (included).
+    :param freq_low: Lowest frequency, in MHz. Unbounded if not given.
+    :param freq_high: Highest frequency, in MHz. Unbounded if not given.
+    :param catalog: FitsCatalog to look the files up in, kept up to date
+    with FitsCatalog.update (which only rescans the directories that
+    changed). It is required, so the files are never looked for by walking
+    a whole directory tree on every call.
+    :param focus_code: Only use files with this focus code.
+    :param lookback: Longest duration of a file, i.e., how long before the
+    window a file overlapping it may start.
+    :param kwargs: Keyword arguments passed on to ECallistoFitsFile
+    (e.g., cache).
+    :returns: Array of decibels, time axis (in hours since the midnight
+    before `start`) and frequency channels of the window.
+    """
+    if catalog is None:
+        error_message = "load_range needs a FitsCatalog to look the files up "
+        error_message += "in (e.g., kept up to date with FitsCatalog.update)."
+        raise ValueError(error_message)
+
+    midnight = datetime.combine(start.date(), time())
+    first_hour = (start - midnight).total_seconds() / 3600
+    last_hour = (end - midnight).total_seconds() / 3600
+
+    # Columns of every file that fall within the window, after the ones
+    # already taken from the previous files
+    parts = []
+    last_taken = -np.inf
+    for entry in catalog.query(station, start - lookback, end, focus_code):
+        fitsfile = ECallistoFitsFile(entry.path.name, entry.path, **kwargs)
+        day = datetime.combine(entry.start.date(), time())
+        time_axis = fitsfile.hdul_dataset["time_axis"]
+        time_axis = time_axis + (day - midnight).days * 24
+        first = max(
+            np.searchsorted(time_axis, first_hour, side="left"),
+            np.searchsorted(time_axis, last_taken, side="right"),
+        )
+        last = np.searchsorted(time_axis, last_hour, side="right")
+        if last > first:
+            parts.append((fitsfile, time_axis, slice(first, last)))
+            last_taken = time_axis[last - 1]
+    if not parts:
+        error_message = f"No {station} files overlap {start} - {end}."
+        raise ValueError(error_message)
+
+    frequency = parts[0][0].hdul_dataset["frequency"]
+    in_band = np.ones(len(frequency), dtype=bool)
+    if freq_low is not None:
+        in_band &= frequency >= freq_low
+    if freq_high is not None:
+        in_band &= frequency <= freq_high
+    channels = np.flatnonzero(in_band)
+    rows = slice(channels[0], channels[-1] + 1) if channels.size else slice(0, 0)
+
+    columns = sum(part.stop - part.start for _, _, part in parts)
+    db = np.empty((rows.stop - rows.start, columns), dtype=np.float32)
+    time_axis = np.empty(columns)
+    column = 0
+    for fitsfile, file_time_axis, part in parts:
+        if fitsfile.hdul_dataset["rows"] != parts[0][0].hdul_dataset["rows"]:
+            error_message = f"{fitsfile.filename} does not have the frequency "
+            error_message += f"channels of {parts[0][0].filename}."
+            raise ValueError(error_message)
+        end_column = column + part.stop - part.start
+        fitsfile.read_db(out=db[:, column:end_column], rows=rows, columns=part)
+        time_axis[column:end_column] = file_time_axis[part]
+        column = end_column
+
+    return db, time_axis, frequency[rows]
@@ -0,0 +1,389 @@
+# FitsStore: Chunked, compressed storage of e-Callisto spectrograms
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import json
+import math
+import zlib
+from pathlib import Path, PurePath
+from typing import Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+from .fitsfile import ECallistoFitsFile
+
+# Dimensions of the arrays of a store, as xarray expects to find them
+DIMENSIONS = {
+    "db": ["frequency", "time"],
+    "time": ["time"],
+    "frequency": ["frequency"],
+}
+UNITS = {"db": "dB", "time": "hours", "frequency": "MHz"}
+
+
+def _write_json(path: Path, obj: dict):
+    path.write_text(json.dumps(obj, indent=4))
+
+
+class SpectrogramWriter(object):
+    """Writes spectrograms, in time order, to a chunked store.
+
+    The store is a Zarr (version 2) group, written with numpy and zlib
+    only: a "db" array of (frequency x time) decibels, split into chunks
+    of `chunks` rows and columns, along with "time" (hours since the
+    midnight of the store's epoch, in the units xarray decodes to dates)
+    and "frequency" (MHz) coordinate arrays. Any Zarr reader (e.g., zarr or
+    xarray) can open it, and SpectrogramStore reads slices of it.
+
+    Appended columns are buffered until they fill a chunk. An existing
+    store is appended to, starting with its last (partial) chunk. Times
+    only ever increase, so that the store can be searched by time.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        frequency: np.ndarray,
+        chunks: Tuple[int, int] = (64, 3600),
+        level: int = 1,
+        epoch: Optional[np.datetime64] = None,
+    ):
+        """
+        :param path: Directory of the store.
+        :param frequency: Frequency of every row, in MHz.
+        :param chunks: Rows and columns of every chunk of decibels.
+        :param level: zlib compression level.
+        :param epoch: Day whose midnight the times are counted from, in
+        hours. Defaults to the epoch of an existing store. Without an epoch,
+        the times are stored as they are appended.
+        """
+        self.path = Path(path)
+        self.frequency = np.asarray(frequency, dtype=np.float32)
+        self.rows = len(self.frequency)
+        self.level = level
+        self.columns = 0  # Columns written to full chunks
+        self._filled = 0  # Columns of the buffered chunk
+        self.last_time = -np.inf  # Time of the last column appended
+
+        store = None
+        if (self.path / "db" / ".zarray").is_file():
+            store = SpectrogramStore(self.path)
+            if not np.array_equal(store.frequency, self.frequency):
+                error_message = f"{self.path} holds spectrograms with other "
+                error_message += "frequency channels."
+                raise ValueError(error_message)
+            chunks = store.chunks
+            epoch = store.epoch
+        self.chunks = tuple(chunks)
+        self.epoch = None if epoch is None else np.datetime64(epoch, "D")
+        self._db = np.full((self.rows, self.chunks[1]), np.nan, dtype=np.float32)
+        self._time = np.full(self.chunks[1], np.nan)
+
+        if store is not None:
+            # Load the last, partial chunk back into the buffer
+            self._filled = store.shape[1] % self.chunks[1]
+            self.columns = store.shape[1] - self._filled
+            if self._filled:
+                db, time_axis, _ = store.read_columns(self.columns, store.shape[1])
+                self._db[:, : self._filled] = db
+                self._time[: self._filled] = time_axis
+            if store.shape[1]:
+                self.last_time = store.time(store.shape[1] - 1)
+            return
+
+        for name in DIMENSIONS:
+            (self.path / name).mkdir(parents=True, exist_ok=True)
+        _write_json(self.path / ".zgroup", {"zarr_format": 2})
+        for name, dimensions in DIMENSIONS.items():
+            attrs = {"_ARRAY_DIMENSIONS": dimensions, "units": UNITS[name]}
+            if name == "time" and self.epoch is not None:
+                # CF convention, so that xarray decodes the times to dates
+                attrs["units"] = f"hours since {self.epoch} 00:00:00"
+                attrs["epoch"] = str(self.epoch)
+            _write_json(self.path / name / ".zattrs", attrs)
+        self._write_chunk("frequency", "0", self.frequency)
+        self._write_metadata()
+
+    def __enter__(self) -> "SpectrogramWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, db: np.ndarray, time_axis: np.ndarray):
+        """Append columns to the store.
+
+        :param db: Array of decibels, with one row per frequency channel.
+        Rows past the number of channels are dropped.
+        :param time_axis: Time of every column, in hours since the midnight
+        of the epoch, increasing and after the last time already appended.
+        """
+        if len(time_axis) == 0:
+            return
+        if time_axis[0] <= self.last_time or np.any(np.diff(time_axis) <= 0):
+            error_message = "Appended times must increase, after the last "
+            error_message += f"time of the store ({self.last_time} hours)."
+            raise ValueError(error_message)
+        self.last_time = float(time_axis[-1])
+
+        start = 0
+        while start < len(time_axis):
+            columns = min(len(time_axis) - start, self.chunks[1] - self._filled)
+            end = self._filled + columns
+            self._db[:, self._filled : end] = db[: self.rows, start : start + columns]
+            self._time[self._filled : end] = time_axis[start : start + columns]
+            self._filled = end
+            start += columns
+            if self._filled == self.chunks[1]:
+                self._flush()
+                self.columns += self.chunks[1]
+                self._db.fill(np.nan)
+                self._time.fill(np.nan)
+                self._filled = 0
+
+    def close(self):
+        """Write the buffered columns and the metadata of the store."""
+        if self._filled:
+            self._flush()
+        self._write_metadata()
+
+    def _flush(self):
+        column = self.columns // self.chunks[1]
+        for row in range(math.ceil(self.rows / self.chunks[0])):
+            block = np.full(self.chunks, np.nan, dtype=np.float32)
+            rows = self._db[row * self.chunks[0] : (row + 1) * self.chunks[0]]
+            block[: len(rows)] = rows
+            self._write_chunk("db", f"{row}.{column}", block)
+        self._write_chunk("time", str(column), self._time)
+
+    def _write_chunk(self, name: str, key: str, block: np.ndarray):
+        path = self.path / name / key
+        tmp_path = path.with_name(key + ".tmp")
+        tmp_path.write_bytes(zlib.compress(block.tobytes(), self.level))
+        tmp_path.replace(path)
+
+    def _write_metadata(self):
+        shapes = {
+            "db": ([self.rows, self.columns + self._filled], list(self.chunks), "<f4"),
+            "time": ([self.columns + self._filled], [self.chunks[1]], "<f8"),
+            "frequency": ([self.rows], [self.rows], "<f4"),
+        }
+        for name, (shape, chunks, dtype) in shapes.items():
+            _write_json(
+                self.path / name / ".zarray",
+                {
+                    "zarr_format": 2,
+                    "shape": shape,
+                    "chunks": chunks,
+                    "dtype": dtype,
+                    "compressor": {"id": "zlib", "level": self.level},
+                    "fill_value": "NaN",
+                    "order": "C",
+                    "filters": None,
+                    "dimension_separator": ".",
+                },
+            )
+
+
+class SpectrogramStore(object):
+    """Reads time and frequency ranges of a store written by
+    SpectrogramWriter, decompressing only the chunks that overlap them.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        metadata = json.loads((self.path / "db" / ".zarray").read_text())
+        self.shape = tuple(metadata["shape"])  # Rows and columns
+        self.chunks = tuple(metadata["chunks"])  # Rows and columns per chunk
+        self.frequency = self._read_chunk("frequency", "0", np.float32)
+        self.frequency = self.frequency[: self.shape[0]]
+        attrs = json.loads((self.path / "time" / ".zattrs").read_text())
+        # Day whose midnight the times are counted from, if any
+        self.epoch = np.datetime64(attrs["epoch"], "D") if "epoch" in attrs else None
+        self.chunks_read = 0  # Chunks of decibels decompressed so far
+        self._time_chunks = {}
+
+    def __len__(self) -> int:
+        return self.shape[1]
+
+    def time(self, column: int) -> float:
+        """Get the time of a column, in hours since the midnight of the
+        epoch."""
+        chunk, offset = divmod(column, self.chunks[1])
+        return float(self._time_chunk(chunk)[offset])
+
+    def find_column(self, time: float, side: str = "left") -> int:
+        """Find where a time falls in the store, as np.searchsorted does,
+        with a binary search that only decompresses a few time chunks.
+
+        :param time: Time, in hours since the midnight of the epoch.
+        :param side: "left" or "right", as in np.searchsorted.
+        :returns: Column index.
+        """
+        lo, hi = 0, math.ceil(self.shape[1] / self.chunks[1])
+        # Find the last chunk starting before (or at) the time
+        while hi - lo > 1:
+            middle = (lo + hi) // 2
+            first = self._time_chunk(middle)[0]
+            if first < time or (side == "right" and first == time):
+                lo = middle
+            else:
+                hi = middle
+        times = self._time_chunk(lo)
+        times = times[: min(self.chunks[1], self.shape[1] - lo * self.chunks[1])]
+
+        return lo * self.chunks[1] + int(np.searchsorted(times, time, side=side))
+
+    def read(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        freq_low: Optional[float] = None,
+        freq_high: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Read a time and frequency range of the store.
+
+        :param start: First time, in hours since the midnight of the epoch.
+        Defaults to the first column.
+        :param end: Last time, in hours since the midnight of the epoch
+        (included). Defaults to the last column.
+        :param freq_low: Lowest frequency, in MHz.
+        :param freq_high: Highest frequency, in MHz.
+        :returns: Array of decibels, times (in hours) and frequencies
+        (in MHz) of the range.
+        """
+        first = 0 if start is None else self.find_column(start, "left")
+        last = self.shape[1] if end is None else self.find_column(end, "right")
+        in_band = np.ones(self.shape[0], dtype=bool)
+        if freq_low is not None:
+            in_band &= self.frequency >= freq_low
+        if freq_high is not None:
+            in_band &= self.frequency <= freq_high
+        rows = np.flatnonzero(in_band)
+        if rows.size == 0:
+            first_row = last_row = 0
+        else:
+            first_row, last_row = rows[0], rows[-1] + 1
+
+        db, time_axis, _ = self.read_columns(first, last, first_row, last_row)
+
+        return db, time_axis, self.frequency[first_row:last_row]
+
+    def read_columns(
+        self,
+        first: int,
+        last: int,
+        first_row: int = 0,
+        last_row: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Read a range of columns (and rows) of the store.
+
+        :param first: First column.
+        :param last: Last column, plus one.
+        :param first_row: First row.
+        :param last_row: Last row, plus one. Defaults to the last row.
+        :returns: Array of decibels, times (in hours) and frequencies
+        (in MHz) of the range.
+        """
+        if last_row is None:
+            last_row = self.shape[0]
+        last = max(first, last)
+        last_row = max(first_row, last_row)
+        rows, columns = self.chunks
+        db = np.empty((last_row - first_row, last - first), dtype=np.float32)
+        time_axis = np.empty(last - first)
+        for column in range(first // columns, math.ceil(last / columns)):
+            c0 = max(first, column * columns)
+            c1 = min(last, (column + 1) * columns)
+            chunk_time = self._time_chunk(column)
+            time_axis[c0 - first : c1 - first] = chunk_time[
+                c0 - column * columns : c1 - column * columns
+            ]
+            for row in range(first_row // rows, math.ceil(last_row / rows)):
+                r0 = max(first_row, row * rows)
+                r1 = min(last_row, (row + 1) * rows)
+                block = self._read_chunk("db", f"{row}.{column}", np.float32)
+                self.chunks_read += 1
+                db[
+                    r0 - first_row : r1 - first_row, c0 - first : c1 - first
+                ] = block.reshape(self.chunks)[
+                    r0 - row * rows : r1 - row * rows,
+                    c0 - column * columns : c1 - column * columns,
+                ]
+
+        return db, time_axis, self.frequency[first_row:last_row]
+
+    def _time_chunk(self, column: int) -> np.ndarray:
+        times = self._time_chunks.get(column)
+        if times is None:
+            times = self._time_chunks[column] = self._read_chunk(
+                "time", str(column), np.float64
+            )
+        return times
+
+    def _read_chunk(self, name: str, key: str, dtype) -> np.ndarray:
+        return np.frombuffer(
+            zlib.decompress((self.path / name / key).read_bytes()), dtype=dtype
+        )
+
+
+def export(
+    files: Iterable[Union[str, PurePath, ECallistoFitsFile]],
+    path: Union[str, Path],
+    **kwargs,
+) -> SpectrogramStore:
+    """Export consecutive FITS files (e.g., a day of a station) to a
+    chunked store, decoding a single file at a time.
+
+    Times are stored in hours since the midnight of the day of the first
+    file (or of the epoch of an existing store), so that files of the next
+    days follow on. Columns at or before the last time already stored
+    (e.g., of overlapping files) are skipped.
+
+    :param files: ECallistoFitsFile instances, paths to FITS files or names
+    of FITS files, in time order.
+    :param path: Directory of the store. An existing store is appended to.
+    :param kwargs: Keyword arguments passed on to SpectrogramWriter.
+    :returns: The store.
+    """
+    writer = None
+    for fits in files:
+        if not isinstance(fits, ECallistoFitsFile):
+            filepath = Path(fits)
+            if filepath.is_file():
+                fits = ECallistoFitsFile(filepath.name, filepath)
+            else:
+                fits = ECallistoFitsFile(fits)
+        dataset = fits.hdul_dataset
+        day = np.datetime64(dataset.header["DATE-OBS"].replace("/", "-"), "D")
+        if writer is None:
+            kwargs.setdefault("epoch", day)
+            writer = SpectrogramWriter(path, dataset["frequency"], **kwargs)
+        time_axis = dataset["time_axis"]
+        if writer.epoch is not None:
+            time_axis = time_axis + (day - writer.epoch).astype(int) * 24
+        first = np.searchsorted(time_axis, writer.last_time, side="right")
+        if first < time_axis.size:
+            db = fits.read_db(columns=slice(first, None))
+            writer.append(db, time_axis[first:])
+    if writer is not None:
+        writer.close()
+
+    return SpectrogramStore(path)
@@ -0,0 +1,322 @@
+# FitsWatch: Live quicklook images of FITS files as they arrive in a directory
+# Copyright (C) 2020 Andre Rossi Korol
+#
+# This file is part of PyCallisto.
+# PyCallisto: Python tools for analyzing data from the e-Callisto International
+# Network of Solar Radio Spectrometers
+#
+# PyCallisto is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyCallisto is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with PyCallisto. If not, see <https://www.gnu.org/licenses/>.
+
+
+import fnmatch
+import os
+import time
+from collections import deque
+from pathlib import Path, PurePath
+from typing import Iterator, Optional, Union
+
+import numpy as np
+from matplotlib.ticker import FuncFormatter
+
+from .fitsbackground import ChannelHistogram
+from .fitscatalog import parse_filename
+from .fitsfile import ECallistoDataset, ECallistoFitsFile
+from .fitshelpers import plot_title
+from .fitsrender import QuicklookRenderer
+from .fitsscale import QuantileSketch
+from .fitsspectrogram import Spectrogram
+
+
+class LiveSpectrogram(object):
+    """Follows the spectrogram of a station as its FITS files arrive,
+    decoding only the columns of every new file that come after the ones
+    already appended.
+
+    Only the time of the last column appended is kept, not the columns
+    themselves, so its memory use stays the same through the day.
+    """
+
+    def __init__(self):
+        self.filenames = []  # Names of the appended files, in time order
+        self.frequency = None  # Frequency channels of the first file
+        self.rows = None  # Number of rows of the first file
+        self.columns = 0  # Number of columns appended
+        self.last_time = -np.inf  # Time of the last column appended, in hours
+
+    def append(self, fitsfile: ECallistoFitsFile) -> Spectrogram:
+        """Decode the columns of a new FITS file. Columns at or before the
+        last time already appended (e.g., of overlapping files) are skipped.
+
+        :param fitsfile: The new FITS file.
+        :returns: Spectrogram of the columns that were appended.
+        """
+        dataset = fitsfile.hdul_dataset
+        if self.rows is None:
+            self.rows = dataset["rows"]
+            self.frequency = dataset["frequency"]
+        elif dataset["rows"] != self.rows:
+            error_message = f"{fitsfile.filename} has {dataset['rows']} "
+            error_message += f"frequency channels, but {self.filenames[0]} has "
+            error_message += f"{self.rows}."
+            raise ValueError(error_message)
+
+        time_axis = dataset["time_axis"]
+        first = np.searchsorted(time_axis, self.last_time, side="right")
+        columns = slice(first, None)
+        db = fitsfile.read_db(columns=columns)
+        if first < time_axis.size:
+            self.columns += time_axis.size - first
+            self.last_time = time_axis[-1]
+            self.filenames.append(fitsfile.filename)
+
+        return Spectrogram(db, time_axis[columns], dataset["f0"])
+
+
+def _format_hour(hour: float, _) -> str:
+    minutes = int(round(hour * 60))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class LiveRenderer(QuicklookRenderer):
+    """Keeps the quicklook image of a station's day up to date as its FITS
+    files arrive.
+
+    The image covers a fixed time span with a fixed number of columns, so
+    every new file only changes the image columns it falls on: its columns
+    are averaged into them and the image data is updated in place. With
+    the running per-channel background updated from the new columns only,
+    an update takes the same time early and late in the day.
+
+    The background is the median of every channel over all the columns
+    seen so far (as fitsplot subtracts by default), or, with a
+    `background_window`, over the last `background_window` columns at the
+    time a file arrived.
+    """
+
+    def __init__(
+        self,
+        width: int = 1440,
+        start_hour: Optional[float] = None,
+        end_hour: Optional[float] = None,
+        filename: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        :param width: Number of columns of the image.
+        :param start_hour: Start of the time span, in hours. Defaults to the
+        hour the first file starts in.
+        :param end_hour: End of the time span, in hours. Defaults to the end
+        of the day.
+        :param filename: Name of the saved image, which is then replaced
+        atomically on every update. Defaults to the title of the plot, as
+        fitsplot names its images.
+        :param kwargs: Keyword arguments passed on to QuicklookRenderer.
+        """
+        super().__init__(**kwargs)
+        self.width = width
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.filename = filename
+        self.spectrogram = LiveSpectrogram()
+
+        self._sums = None  # Sum of the columns averaged into every image column
+        self._counts = np.zeros(width, dtype=np.int64)
+        self._histogram = None
+        self._blocks = deque()  # (columns, counts) of the background window
+        self._display = None  # Image data, updated in place
+        # Background-subtracted values of the files so far, for auto_scale
+        self._sketch = QuantileSketch()
+
+    def update(
+        self,
+        fits: Union[str, PurePath, ECallistoFitsFile],
+        output_dir: Optional[Union[str, Path]] = None,
+    ) -> Path:
+        """Append a new FITS file and save the updated image.
+
+        :param fits: The new FITS file, its path or its name.
+        :param output_dir: Directory where the image is saved. Defaults to
+        the directory of the FITS file.
+        :returns: Path to the saved image.
+        """
+        if not isinstance(fits, ECallistoFitsFile):
+            fits = self._open(fits)
+        spectrogram = self.spectrogram
+        db, time_axis, _ = spectrogram.append(fits)
+
+        if self._sums is None:
+            self._start(db.shape[0], time_axis[0])
+        self._update_background(db)
+        if self.background_window is not None and db.size:
+            db = db - self._histogram.median()
+        self._add_columns(db, time_axis)
+        if self.auto_scale and db.size:
+            # The new columns are added with the background as it is now,
+            # so the image itself is never scanned for its color limits
+            if self.background_window is None:
+                db = db - self._histogram.median()
+            self._sketch.add(db)
+
+        # The image keeps its size, only its data is replaced
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(self._sums, self._counts, out=self._display)
+        if self.background_window is None:
+            self._display -= self._histogram.median()
+        self.image.set_data(self._display)
+        self._auto_scale(self._sketch)
+
+        title = plot_title(spectrogram.filenames, spectrogram.last_time)
+        self.axes.set_title(title, fontsize=16)
+
+        if output_dir is None:
+            output_dir = fits.filepath.parent
+        else:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+        img_filepath = Path(output_dir, self.filename or title + self.ext)
+        tmp_filepath = img_filepath.with_name(f".{img_filepath.name}.{os.getpid()}.tmp")
+        self.figure.savefig(tmp_filepath, format=img_filepath.suffix[1:] or None)
+        os.replace(tmp_filepath, img_filepath)
+
+        return img_filepath
+
+    def _start(self, rows: int, first_time: float):
+        if self.start_hour is None:
+            self.start_hour = float(np.floor(first_time))
+        if self.end_hour is None:
+            self.end_hour = 24 * (np.floor(first_time / 24) + 1)
+        self._sums = np.zeros((rows, self.width), dtype=np.float32)
+        self._display = np.full((rows, self.width), np.nan, dtype=np.float32)
+        self._histogram = ChannelHistogram(rows)
+
+        frequency = self.spectrogram.frequency
+        extent = [self.start_hour, self.end_hour, frequency[-1], frequency[0]]
+        self._create_image(
+            self._display, extent, ECallistoDataset.V_MIN, ECallistoDataset.V_MAX
+        )
+        self.axes.set_xlim(self.start_hour, self.end_hour)
+        # Follow the convention of inverting the Frequency axis
+        self.axes.set_ylim(frequency[0], frequency[-1])
+        self.axes.xaxis.set_major_formatter(FuncFormatter(_format_hour))
+
+    def _update_background(self, db: np.ndarray):
+        if self.background_window is None:
+            self._histogram.add(db)
+            return
+
+        self._blocks.append((db.shape[1], self._histogram.add(db)))
+        columns = sum(block_columns for block_columns, _ in self._blocks)
+        while columns - self._blocks[0][0] >= self.background_window:
+            block_columns, counts = self._blocks.popleft()
+            self._histogram.remove(counts)
+            columns -= block_columns
+
+    def _add_columns(self, db: np.ndarray, time_axis: np.ndarray):
+        span = self.end_hour - self.start_hour
+        index = np.floor((time_axis - self.start_hour) / span * self.width)
+        index = index.astype(np.intp)
+        inside = np.flatnonzero((index >= 0) & (index < self.width))
+        if not inside.size:
+            return
+        db = db[:, inside[0] : inside[-1] + 1]
+        index = index[inside[0] : inside[-1] + 1]
+
+        # Sum the runs of columns that fall on the same image column
+        starts = np.flatnonzero(np.diff(index, prepend=-1))
+        self._sums[:, index[starts]] += np.add.reduceat(db, starts, axis=1)
+        self._counts[index[starts]] += np.diff(starts, append=index.size)
+
+
+def watch(
+    directory: Union[str, Path],
+    output_dir: Optional[Union[str, Path]] = None,
+    pattern: str = "*.fit*",
+    poll_interval: float = 5.0,
+    idle_timeout: Optional[float] = None,
+    existing: bool = True,
+    **kwargs
+) -> Iterator[Path]:
+    """Watch a directory for new e-Callisto FITS files and keep a live
+    quicklook image of every station (and focus code) up to date, starting
+    a new image every day.
+
+    A new file is taken once its size stayed the same between two polls,
+    so files still being written are left for later (files already in the
+    directory when watching starts are taken right away).
+
+    :param directory: Directory where the FITS files arrive.
+    :param output_dir: Directory where the images are saved. Defaults to
+    `directory`.
+    :param pattern: Shell-style pattern of the watched filenames.
+    :param poll_interval: Seconds between two scans of the directory.
+    :param idle_timeout: Stop after this many seconds without new files.
+    Watch forever if not given.
+    :param existing: Also add the files already in the directory, for the
+    days they belong to.
+    :param kwargs: Keyword arguments passed on to LiveRenderer.
+    :returns: Iterator over the paths of the updated images, one per file.
+    """
+    directory = Path(directory)
+    renderers = {}  # (station, focus_code) -> (day, LiveRenderer)
+    sizes = {}  # Sizes of the files seen at the last poll
+    done = set()  # Files taken (or skipped) for the days being rendered
+
+    def is_stale(name: str) -> bool:
+        # Files of the days before the one rendered for their station
+        info = parse_filename(name)
+        if info is None:
+            return False
+        day, _ = renderers.get((info.station, info.focus_code), (None, None))
+        return day is not None and info.start.date() < day
+
+    first_scan = True
+    last_file = time.monotonic()
+    while True:
+        ready = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name in done or not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                if is_stale(entry.name):
+                    sizes.pop(entry.name, None)
+                    continue
+                size = entry.stat().st_size
+                if sizes.get(entry.name) == size or (first_scan and existing):
+                    ready.append(entry.name)
+                else:
+                    sizes[entry.name] = size
+        if first_scan and not existing:
+            done.update(sizes)
+            sizes.clear()
+        first_scan = False
+
+        for name in sorted(ready):
+            done.add(name)
+            sizes.pop(name, None)
+            info = parse_filename(name)
+            if info is None:
+                continue
+            key = (info.station, info.focus_code)
+            day, renderer = renderers.get(key, (None, None))
+            if day != info.start.date():
+                renderer = LiveRenderer(**kwargs)
+                renderers[key] = (info.start.date(), renderer)
+                done.difference_update([seen for seen in done if is_stale(seen)])
+            yield renderer.update(directory / name, output_dir or directory)
+
+        if ready:
+            last_file = time.monotonic()
+        elif idle_timeout is not None and time.monotonic() - last_file > idle_timeout:
+            return
+        else:
+            time.sleep(poll_interval)
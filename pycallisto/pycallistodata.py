@@ -1,5 +1,34 @@
 import json
+from functools import lru_cache
 from importlib.resources import open_text
 
-with open_text("pycallisto", "languages.json") as languages_JSON_file:
-    LANGUAGES = json.load(languages_JSON_file)
+
+@lru_cache(maxsize=None)
+def _languages() -> dict:
+    # languages.json is read the first time labels are needed, not when
+    # pycallisto is imported
+    with open_text("pycallisto", "languages.json") as languages_JSON_file:
+        return json.load(languages_JSON_file)
+
+
+def __getattr__(name: str):
+    if name == "LANGUAGES":
+        return _languages()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_labels(language: str) -> dict:
+    """Get the plot labels of a given language.
+
+    :param language: Language code (e.g., en, pt-br).
+    :returns: Dict of labels.
+    """
+    languages = _languages()
+    try:
+        return languages[language.lower()]
+    except KeyError:
+        # Defaults to English if an invalid or missing language is given.
+        # Check languages.json for the currently supported languages.
+        # Feel free to add a new language by adding it to languages.json
+        # and then sending a Pull Request.
+        return languages["en"]
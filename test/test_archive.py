@@ -0,0 +1,233 @@
+import hashlib
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+from pycallisto.archive import archive_url, crawl, download, parse_listing
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    """Serves files from `server.files` with ETag and Range support, and
+    fails the way `server.failures` tells it to.
+    """
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, dict(self.headers)))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            failure = server.failures.pop(self.path, None)
+        try:
+            time.sleep(server.delay)
+            content = server.files.get(self.path)
+            if content is None:
+                self.send_error(404)
+                return
+            if failure == "unavailable":
+                self.send_error(503)
+                return
+
+            etag = '"' + hashlib.md5(content).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            start = 0
+            range_header = self.headers.get("Range")
+            if range_header and self.headers.get("If-Range", etag) == etag:
+                start = int(range_header[len("bytes=") : -1])
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+                )
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(content) - start))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            if head:
+                return
+            if failure == "truncated":
+                # Send half of the body, then drop the connection
+                self.wfile.write(content[start : (start + len(content)) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(content[start:])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArchiveDownloaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp_dir.name)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveRequestHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = self.server.max_active = 0
+        self.server.failures = {}
+        self.server.delay = 0.0
+        self.server.files = {}
+        for fits_path in sorted(Path("assets/test/list").iterdir()):
+            self.server.files[f"/2011/02/16/{fits_path.name}"] = fits_path.read_bytes()
+        self.archive = "http://127.0.0.1:%d/" % self.server.server_address[1]
+        self.urls = [self.archive + path[1:] for path in self.server.files]
+        # Apache-like index page of the day's directory
+        listing = '<a href="?C=N;O=D">Name</a> <a href="/2011/02/">Parent</a>'
+        for url in self.urls:
+            listing += f'<a href="{Path(url).name}">{Path(url).name}</a>'
+        self.server.files["/2011/02/16/"] = listing.encode()
+
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        return super().setUp()
+
+    def content(self, url):
+        return self.server.files[urlparse(url).path]
+
+    def assertDownloaded(self, url):
+        path = self.folder / Path(url).name
+        self.assertEqual(self.content(url), path.read_bytes())
+        self.assertFalse(path.with_name(path.name + ".part").exists())
+
+    def test_archive_url(self):
+        self.assertEqual(
+            self.urls[0],
+            archive_url(Path(self.urls[0]).name, self.archive),
+        )
+        with self.assertRaises(ValueError):
+            archive_url("not_a_fits_file.txt")
+
+    def test_download(self):
+        self.server.delay = 0.05
+        results = download(self.urls, self.folder, max_connections=8, per_host=3)
+
+        self.assertEqual(self.urls, [result.url for result in results])
+        self.assertEqual(["downloaded"] * len(self.urls), [r.status for r in results])
+        for url in self.urls:
+            self.assertDownloaded(url)
+        self.assertLessEqual(self.server.max_active, 3)
+
+        # Files that did not change on the server are skipped
+        results = download(self.urls, self.folder)
+        self.assertEqual(["skipped"] * len(self.urls), [r.status for r in results])
+
+    def test_skip_by_size(self):
+        url = self.urls[0]
+        path = self.folder / Path(url).name
+        path.write_bytes(self.content(url))
+
+        (result,) = download([url], self.folder)
+        self.assertEqual("skipped", result.status)
+        self.assertEqual("HEAD", self.server.requests[-1][0])
+
+    def test_resume(self):
+        url = self.urls[0]
+        content = self.content(url)
+        part_path = self.folder / (Path(url).name + ".part")
+        part_path.write_bytes(content[:1000])
+
+        (result,) = download([url], self.folder)
+        self.assertEqual("resumed", result.status)
+        self.assertEqual(len(content) - 1000, result.received)
+        self.assertEqual("bytes=1000-", self.server.requests[-1][2]["Range"])
+        self.assertDownloaded(url)
+
+    def test_interrupted_update(self):
+        url = self.urls[0]
+        download([url], self.folder)
+
+        # The file changes on the server, and its update is interrupted
+        self.server.files[urlparse(url).path] = self.content(self.urls[1])
+        self.server.failures[urlparse(url).path] = "truncated"
+        (result,) = download([url], self.folder, retries=0)
+        self.assertEqual("failed", result.status)
+
+        # The old file is not taken for the new one, the update is resumed
+        (result,) = download([url], self.folder)
+        self.assertEqual("resumed", result.status)
+        self.assertDownloaded(url)
+        (result,) = download([url], self.folder)
+        self.assertEqual("skipped", result.status)
+
+    def test_retries(self):
+        self.server.failures[urlparse(self.urls[0]).path] = "truncated"
+        self.server.failures[urlparse(self.urls[1]).path] = "unavailable"
+
+        results = download(self.urls[:2], self.folder, backoff=0.01)
+        # The truncated download is resumed where the connection dropped
+        self.assertEqual(["resumed", "downloaded"], [r.status for r in results])
+        self.assertDownloaded(self.urls[0])
+        self.assertDownloaded(self.urls[1])
+
+    def test_failure(self):
+        url = self.archive + "2011/02/16/BLEN7M_20110216_000000_24.fit.gz"
+        (result,) = download([url], self.folder, backoff=0.01)
+
+        self.assertEqual("failed", result.status)
+        self.assertIn("404", result.error)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_rate_limit(self):
+        start = time.perf_counter()
+        download(self.urls[:4], self.folder, rate=20)
+
+        # 4 requests at 20 requests per second take at least 3 intervals
+        self.assertGreaterEqual(time.perf_counter() - start, 0.15)
+
+    def test_parse_listing(self):
+        url = self.archive + "2011/02/16/"
+        files = parse_listing(self.server.files["/2011/02/16/"].decode(), url)
+
+        self.assertEqual(self.urls, [fits.url for fits in files])
+        self.assertEqual("BLEN7M", files[0].station)
+        self.assertEqual(datetime(2011, 2, 16, 13, 30, 9), files[0].start)
+        self.assertEqual("24", files[0].focus_code)
+
+    def test_crawl(self):
+        days = [date(2011, 2, 16), date(2011, 2, 17)]
+        cache_dir = self.folder / "listings"
+        listings = crawl(days, archive=self.archive, cache_dir=cache_dir)
+
+        self.assertEqual(days, list(listings))
+        self.assertEqual(self.urls, [fits.url for fits in listings[days[0]]])
+        self.assertEqual([], listings[days[1]])
+
+        # The cached listing is revalidated instead of downloaded again
+        self.server.requests.clear()
+        self.assertEqual(
+            listings, crawl(days, archive=self.archive, cache_dir=cache_dir)
+        )
+        headers = [h for _, path, h in self.server.requests if path == "/2011/02/16/"]
+        self.assertIn("If-None-Match", headers[0])
+
+        # Recent enough listings are not revalidated at all
+        self.server.requests.clear()
+        listings = crawl(
+            days[:1], archive=self.archive, cache_dir=cache_dir, max_age=60
+        )
+        self.assertEqual(self.urls, [fits.url for fits in listings[days[0]]])
+        self.assertEqual([], self.server.requests)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
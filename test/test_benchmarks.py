@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.run import BENCHMARKS, compare, measure, measure_import
+from benchmarks.synthetic import synthetic_station
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsstitch import stitch
+
+
+class BenchmarksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = synthetic_station(
+            self.tmp_dir.name, 2, datetime(2011, 8, 9, 8), rows=50, columns=400
+        )
+
+        return super().setUp()
+
+    def test_synthetic_station(self):
+        self.assertEqual("SYNTH_20110809_080140_01.fit.gz", self.paths[1].name)
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.paths]
+        dataset = fitsfiles[1].hdul_dataset
+        self.assertEqual((50, 400), dataset["db"].shape)
+        self.assertEqual(0.25, dataset["dt"])
+        self.assertTrue(np.all(np.diff(dataset["f0"]) < 0))
+        # The files of a station share its frequency channels
+        np.testing.assert_array_equal(fitsfiles[0].hdul_dataset["f0"], dataset["f0"])
+
+        # The files follow each other without gaps
+        _, time_axis, _ = stitch(fitsfiles)
+        np.testing.assert_allclose(0.25 / 3600, np.diff(time_axis), rtol=1e-6)
+        self.assertEqual(8, time_axis[0])
+
+    def test_measure(self):
+        results = [measure(benchmark, self.paths, 1) for benchmark in BENCHMARKS]
+        self.assertEqual(
+            [b.name for b in BENCHMARKS], [r["benchmark"] for r in results]
+        )
+        self.assertTrue(all(result["best"] > 0 for result in results))
+        self.assertGreater(results[0]["peak_bytes"], 2 * 50 * 400 * 4)
+
+        old = {"results": results}
+        self.assertEqual([], compare(old, old))
+        slower = dict(results[0], best=results[0]["best"] * 2)
+        self.assertEqual(1, len(compare(old, {"results": [slower]})))
+
+    def test_measure_import(self):
+        result = measure_import(1)
+        self.assertEqual(("import", 0), (result["benchmark"], result["files"]))
+        self.assertGreater(result["best"], 0)
+        # The FITS core is imported without matplotlib
+        self.assertFalse(result["matplotlib"])
+
+        old = {"results": [result]}
+        self.assertEqual([], compare(old, old))
+        plotting = dict(result, matplotlib=True)
+        self.assertEqual(1, len(compare(old, {"results": [plotting]})))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
@@ -0,0 +1,58 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsbackground import (
+    ChannelHistogram,
+    channel_median,
+    subtract_background,
+)
+from pycallisto.fitsfile import ECallistoFitsFile
+
+
+class FitsBackgroundTestCase(unittest.TestCase):
+    def setUp(self):
+        list_dir = Path("assets/test/list")
+        self.chunks = [
+            ECallistoFitsFile(path.name, path).read_db()
+            for path in sorted(list_dir.iterdir())[:3]
+        ]
+        self.db = np.hstack(self.chunks)
+
+        return super().setUp()
+
+    def test_channel_median(self):
+        np.testing.assert_allclose(
+            np.median(self.db, axis=1, keepdims=True),
+            channel_median(self.chunks),
+            atol=1e-4,
+        )
+
+        first, second = ChannelHistogram(200), ChannelHistogram(200)
+        first.add(self.chunks[0])
+        second.add(self.chunks[1])
+        first.merge(second)
+        np.testing.assert_allclose(
+            np.median(self.db[:, :7200], axis=1, keepdims=True),
+            first.median(),
+            atol=1e-4,
+        )
+
+    def test_subtract_background(self):
+        blocks = np.array_split(self.db, 30, axis=1)
+        whole = np.hstack(list(subtract_background(blocks, 10 * self.db.shape[1])))
+        np.testing.assert_allclose(
+            self.db - np.median(self.db, axis=1, keepdims=True), whole, atol=1e-4
+        )
+
+        running = list(subtract_background(blocks, 1800))
+        self.assertEqual([block.shape for block in blocks], [r.shape for r in running])
+        # The window of the first block spans the 360-column blocks up to
+        # half a window (900 columns) after it.
+        first_window = np.hstack(blocks[:4])
+        np.testing.assert_allclose(
+            blocks[0] - np.median(first_window, axis=1, keepdims=True),
+            running[0],
+            atol=1e-4,
+        )
@@ -0,0 +1,104 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsbursts import (
+    BurstDetector,
+    detect_bursts,
+    find_bursts,
+    label_runs,
+)
+from pycallisto.fitsfile import ECallistoFitsFile
+
+
+class LabelRunsTestCase(unittest.TestCase):
+    def test_label_runs(self):
+        mask = np.random.default_rng(0).random((60, 80)) > 0.6
+        rows, columns, labels = label_runs(mask)
+        label_image = np.full(mask.shape, -1)
+        label_image[rows, columns] = labels
+
+        # Flood fill the same mask, with 8-connectivity
+        expected = np.full(mask.shape, -1)
+        components = 0
+        for pixel in zip(*np.nonzero(mask)):
+            if expected[pixel] >= 0:
+                continue
+            expected[pixel] = components
+            stack = [pixel]
+            while stack:
+                row, column = stack.pop()
+                for r in range(max(0, row - 1), min(row + 2, mask.shape[0])):
+                    for c in range(max(0, column - 1), min(column + 2, mask.shape[1])):
+                        if mask[r, c] and expected[r, c] < 0:
+                            expected[r, c] = components
+                            stack.append((r, c))
+            components += 1
+
+        self.assertEqual(components, labels.max() + 1)
+        pairs = set(zip(label_image[mask], expected[mask]))
+        self.assertEqual(components, len(pairs))
+
+    def test_empty_mask(self):
+        rows, columns, labels = label_runs(np.zeros((10, 10), dtype=bool))
+        self.assertEqual(0, labels.size)
+
+
+class BurstDetectionTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.db = rng.normal(0, 0.5, (200, 3600)).astype(np.float32)
+        self.time_axis = (8 * 3600 + 0.25 * np.arange(3600)) / 3600
+        self.frequency = np.linspace(870, 45, 200)
+        # Type III-like burst, drifting one channel every 1/16 s
+        for row in range(200):
+            self.db[row, 1000 + row // 4 : 1006 + row // 4] += 10
+        self.db[120:130, 2000:2040] += 6
+        # Burst still going on at the end of the spectrogram
+        self.db[50:70, 3590:] += 8
+
+        return super().setUp()
+
+    def test_find_bursts(self):
+        events = find_bursts(self.db, self.time_axis, self.frequency)
+
+        self.assertEqual(3, len(events))
+        type_iii = events[0]
+        self.assertEqual(self.time_axis[1000], type_iii.start)
+        self.assertEqual((45, 870), (type_iii.freq_low, type_iii.freq_high))
+        self.assertEqual(1200, type_iii.pixels)
+        drift = (self.frequency[1] - self.frequency[0]) / (0.25 / 4)
+        self.assertAlmostEqual(drift, type_iii.drift, delta=abs(drift) * 0.01)
+        self.assertEqual(self.time_axis[-1], events[-1].end)
+
+    def test_burst_detector(self):
+        events = find_bursts(self.db, self.time_axis, self.frequency)
+
+        # Chunk boundaries cut through the first burst
+        detector = BurstDetector(self.frequency)
+        streamed = []
+        for start in range(0, 3600, 1010):
+            end = start + 1010
+            streamed += detector.push(self.db[:, start:end], self.time_axis[start:end])
+        self.assertEqual(2, len(streamed))
+        streamed += detector.flush()
+        np.testing.assert_allclose(np.array(events), np.array(streamed), rtol=1e-9)
+
+    def test_detect_bursts(self):
+        fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+        events = detect_bursts(fits_paths)
+
+        chunks, time_axes = [], []
+        for fits_path in fits_paths:
+            fitsfile = ECallistoFitsFile(fits_path.name, fits_path)
+            db = fitsfile.read_db()
+            chunks.append(db - np.median(db, axis=1, keepdims=True))
+            time_axes.append(fitsfile.hdul_dataset["time_axis"])
+        frequency = fitsfile.hdul_dataset["f0"]
+        expected = find_bursts(
+            np.concatenate(chunks, axis=1), np.concatenate(time_axes), frequency
+        )
+
+        self.assertTrue(events)
+        np.testing.assert_allclose(np.array(expected), np.array(events), rtol=1e-9)
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitscache import SpectrogramCache
+from pycallisto.fitsfile import ECallistoFitsFile
+
+
+class SpectrogramCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fits_path = Path("assets/test/BLEN7M_20110809_080004_25.fit.gz")
+        self.cache = SpectrogramCache(Path(self.tmp_dir.name, "cache"))
+
+        return super().setUp()
+
+    def test_cache_hit(self):
+        self.assertIsNone(self.cache.get(self.fits_path))
+
+        decoded = ECallistoFitsFile(
+            self.fits_path.name, self.fits_path, cache=self.cache
+        )
+        cached = ECallistoFitsFile(
+            self.fits_path.name, self.fits_path, cache=self.cache
+        )
+        self.assertIsNone(cached.hdul)
+
+        db = cached.hdul_dataset["db"]
+        self.assertIsInstance(db, np.memmap)
+        np.testing.assert_array_equal(decoded.hdul_dataset["db"], db)
+        for key in ("time", "f0", "start_time", "rows", "columns", "time_axis"):
+            np.testing.assert_array_equal(
+                decoded.hdul_dataset[key], cached.hdul_dataset[key]
+            )
+
+    def test_cache_key(self):
+        fits_copy = Path(self.tmp_dir.name, self.fits_path.name)
+        shutil.copy(self.fits_path, fits_copy)
+        key = self.cache.key(fits_copy)
+
+        os.utime(fits_copy, ns=(0, 0))
+        self.assertNotEqual(key, self.cache.key(fits_copy))
+
+    def test_cache_miss_hashes_once(self):
+        keys = []
+
+        class CountingCache(SpectrogramCache):
+            def key(self, filepath, block_size=1 << 20):
+                keys.append(filepath)
+                return super().key(filepath, block_size)
+
+        cache = CountingCache(self.cache.cache_dir)
+        ECallistoFitsFile(self.fits_path.name, self.fits_path, cache=cache)
+        self.assertEqual(1, len(keys))
+        self.assertIsNotNone(self.cache.get(self.fits_path))
+
+    def test_lru_eviction(self):
+        list_dir = Path("assets/test/list")
+        fits_paths = sorted(list_dir.iterdir())[:3]
+        for fits_path in fits_paths:
+            ECallistoFitsFile(fits_path.name, fits_path, cache=self.cache)
+        entry_size = self.cache.size() // 3
+
+        # Use the first entry, so that the second one is the least recent
+        self.assertIsNotNone(self.cache.get(fits_paths[0]))
+        self.cache.max_bytes = 2 * entry_size
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.get(fits_paths[0]))
+        self.assertIsNone(self.cache.get(fits_paths[1]))
+        self.assertIsNotNone(self.cache.get(fits_paths[2]))
+
+        self.cache.clear()
+        self.assertEqual(0, self.cache.size())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
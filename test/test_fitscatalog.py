@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from pycallisto import fitsfile
+from pycallisto.fitscatalog import FitsCatalog, parse_filename
+
+
+class FitsCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.archive = Path(self.tmp_dir.name, "archive")
+        shutil.copytree("assets/test", self.archive)
+        self.catalog = FitsCatalog(Path(self.tmp_dir.name, "catalog.sqlite"))
+        self.catalog.update(self.archive)
+
+        return super().setUp()
+
+    def test_parse_filename(self):
+        info = parse_filename("BLEN7M_20110809_080004_25.fit.gz")
+        self.assertEqual("BLEN7M", info.station)
+        self.assertEqual(datetime(2011, 8, 9, 8, 0, 4), info.start)
+        self.assertEqual("25", info.focus_code)
+
+        self.assertIsNone(parse_filename("BLEN7M_20110809_080004_25.png"))
+
+    def test_resolve(self):
+        fitsname = "BLEN7M_20110216_140011_24.fit.gz"
+        expected = (self.archive / "list" / fitsname).resolve()
+        self.assertEqual(expected, self.catalog.resolve(fitsname))
+        self.assertIsNone(self.catalog.resolve("NOT_HERE.fit.gz"))
+
+        fits = fitsfile.FitsFile(fitsname, catalog=self.catalog)
+        self.assertEqual(expected, fits.filepath)
+        fits.hdul.close()
+
+        with self.assertRaises(FileNotFoundError):
+            fitsfile.FitsFile("NOT_HERE.fit.gz", catalog=self.catalog)
+
+    def test_query(self):
+        entries = self.catalog.query(
+            "BLEN7M", datetime(2011, 2, 16, 13, 40), datetime(2011, 2, 16, 14, 31)
+        )
+        self.assertEqual(
+            [
+                "BLEN7M_20110216_134510_24.fit.gz",
+                "BLEN7M_20110216_140011_24.fit.gz",
+                "BLEN7M_20110216_141512_24.fit.gz",
+                "BLEN7M_20110216_143014_24.fit.gz",
+            ],
+            [entry.path.name for entry in entries],
+        )
+        self.assertEqual(1, len(self.catalog.query("BLEN7M", focus_code="25")))
+
+    def test_incremental_update(self):
+        self.assertEqual(10, len(self.catalog))
+
+        new_dir = self.archive / "2011" / "08" / "09"
+        new_dir.mkdir(parents=True)
+        shutil.copy(
+            self.archive / "BLEN7M_20110809_080004_25.fit.gz",
+            new_dir / "BLEN7M_20110809_081504_25.fit.gz",
+        )
+        (self.archive / "list" / "BLEN7M_20110216_153019_24.fit.gz").unlink()
+        self.catalog.update(self.archive)
+
+        self.assertEqual(10, len(self.catalog))
+        self.assertIsNotNone(self.catalog.resolve("BLEN7M_20110809_081504_25.fit.gz"))
+        self.assertEqual(
+            2,
+            len(
+                self.catalog.query(
+                    "BLEN7M", datetime(2011, 2, 16, 15), datetime(2011, 2, 16, 16)
+                )
+            ),
+        )
+
+        shutil.rmtree(self.archive / "list")
+        self.catalog.update(self.archive)
+        self.assertEqual(2, len(self.catalog))
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
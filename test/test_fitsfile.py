@@ -2,6 +2,8 @@ import json
 import unittest
 from pathlib import Path
 
+import numpy as np
+
 from pycallisto import fitsfile
 from pycallisto.fitserror import FitsFileError
 
@@ -48,3 +50,50 @@ class FitsFileTestCase(unittest.TestCase):
         self.test_hdul_dataset.unlink(missing_ok=True)
 
         return super().tearDown()
+
+
+class ECallistoDatasetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_path = Path("assets/test/BLEN7M_20110809_080004_25.fit.gz")
+
+        return super().setUp()
+
+    def test_lazy_dataset(self):
+        ecallisto_fits = fitsfile.ECallistoFitsFile(self.fits_path.name, self.fits_path)
+        dataset = ecallisto_fits.hdul_dataset
+
+        self.assertEqual(list(fitsfile.ECallistoDataset.FIELDS), list(dataset))
+        self.assertFalse(dataset.is_loaded("data"))
+        self.assertEqual(8.0, dataset["hh"])
+        self.assertEqual((200, 3600), (dataset["rows"], dataset["columns"]))
+        self.assertFalse(dataset.is_loaded("db"))
+
+        db = dataset["db"]
+        self.assertIs(db, dataset["db"])
+        self.assertEqual((200, 3600), db.shape)
+        self.assertEqual(0.0, db.min())
+        self.assertEqual(len(dataset["time_axis"]), dataset["columns"])
+
+        with self.assertRaises(KeyError):
+            dataset["not_a_field"]
+
+    def test_digits_to_db(self):
+        ecallisto_fits = fitsfile.ECallistoFitsFile(self.fits_path.name, self.fits_path)
+        dataset = ecallisto_fits.hdul_dataset
+        db = ecallisto_fits.read_db()
+
+        # Same values as the original digit->voltage->db conversion
+        expected = fitsfile.ECallistoFitsFile.digit_to_voltage(dataset["dref"]) / 25.4
+        self.assertTrue(np.array_equal(expected, db))
+        self.assertTrue(np.array_equal(expected, dataset["db"]))
+
+        db_float16 = ecallisto_fits.read_db(dtype=np.float16)
+        self.assertEqual(np.float16, db_float16.dtype)
+        self.assertTrue(np.allclose(db, db_float16, rtol=1e-3))
+
+        scaled = ecallisto_fits.read_scaled()
+        self.assertEqual(np.uint8, scaled.digits.dtype)
+        self.assertTrue(np.array_equal(db, scaled.to_db()))
+        self.assertTrue(
+            np.allclose(db, scaled.digits * scaled.scale + scaled.offset, atol=1e-4)
+        )
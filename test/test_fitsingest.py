@@ -0,0 +1,83 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitscatalog import FitsCatalog
+from pycallisto.fitserror import FitsFileError
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsingest import ingest
+
+
+class FitsIngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:4]
+
+        return super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
+
+    def assertSameFits(self, expected: ECallistoFitsFile, fitsfile: ECallistoFitsFile):
+        self.assertEqual(expected.filename, fitsfile.filename)
+        expected, dataset = expected.hdul_dataset, fitsfile.hdul_dataset
+        self.assertEqual(expected.header["TIME-OBS"], dataset.header["TIME-OBS"])
+        np.testing.assert_array_equal(expected["db"], dataset["db"])
+        np.testing.assert_array_equal(expected["time_axis"], dataset["time_axis"])
+        np.testing.assert_array_equal(expected["frequency"], dataset["frequency"])
+
+    def test_ingest(self):
+        # Files come out in order, whatever worker decoded them first
+        files = self.fits_paths * 3
+        fitsfiles = list(ingest(files, workers=3, prefetch=2))
+
+        self.assertEqual(len(files), len(fitsfiles))
+        for path, fitsfile in zip(files, fitsfiles):
+            self.assertSameFits(ECallistoFitsFile(path.name, path), fitsfile)
+
+    def test_catalog(self):
+        with FitsCatalog(":memory:") as catalog:
+            catalog.update(self.fits_paths[0].parent)
+            names = [path.name for path in self.fits_paths]
+            fitsfiles = list(ingest(names, workers=2, catalog=catalog))
+
+        self.assertEqual(names, [fitsfile.filename for fitsfile in fitsfiles])
+        for path, fitsfile in zip(self.fits_paths, fitsfiles):
+            self.assertEqual(path.resolve(), fitsfile.filepath.resolve())
+
+    def test_uncompressed(self):
+        uncompressed = Path(self.tmp_dir.name, self.fits_paths[0].stem)
+        with gzip.open(self.fits_paths[0]) as file:
+            uncompressed.write_bytes(file.read())
+
+        (fitsfile,) = ingest([uncompressed])
+        expected = ECallistoFitsFile(self.fits_paths[0].name, self.fits_paths[0])
+        self.assertEqual(uncompressed, fitsfile.filepath)
+        np.testing.assert_array_equal(
+            expected.hdul_dataset["db"], fitsfile.hdul_dataset["db"]
+        )
+
+    def test_errors(self):
+        truncated = Path(self.tmp_dir.name, self.fits_paths[1].name)
+        truncated.write_bytes(self.fits_paths[1].read_bytes()[:5000])
+
+        # Files before the invalid one are still yielded
+        fitsfiles = ingest([self.fits_paths[0], truncated, self.fits_paths[2]])
+        self.assertEqual(self.fits_paths[0].name, next(fitsfiles).filename)
+        with self.assertRaises(FitsFileError):
+            next(fitsfiles)
+
+        missing = Path(self.tmp_dir.name, "missing.fit.gz")
+        with self.assertRaises(FileNotFoundError):
+            list(ingest([self.fits_paths[0], missing]))
+
+    def test_close(self):
+        # Closing the iterator early stops the reader
+        fitsfiles = ingest(self.fits_paths * 10, workers=1, prefetch=1)
+        next(fitsfiles)
+        fitsfiles.close()
@@ -0,0 +1,59 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitslightcurve import Band, band_weights, light_curves
+
+
+class LightCurveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        self.db = np.hstack([fitsfile.read_db() for fitsfile in fitsfiles])
+        self.frequency = fitsfiles[0].hdul_dataset["f0"]
+        self.bands = [Band("low", 180, 250), ("high", 600, 700)]
+
+        return super().setUp()
+
+    def test_band_weights(self):
+        frequency = np.array([400.0, 300.0, 200.0, 100.0])
+        needed, weights = band_weights(
+            frequency, [Band("a", 250, 450), Band("b", 150, 350), Band("c", 0, 1)]
+        )
+
+        np.testing.assert_array_equal([True, True, True, False], needed)
+        np.testing.assert_array_equal([[0.5, 0.5, 0], [0, 0.5, 0.5]], weights[:2])
+        self.assertTrue(np.isnan(weights[2]).all())
+
+    def test_light_curves(self):
+        curves = light_curves(self.fits_paths, self.bands, workers=2)
+
+        self.assertEqual(["low", "high"], list(curves))
+        low = (self.frequency >= 180) & (self.frequency <= 250)
+        np.testing.assert_allclose(
+            self.db[low].mean(axis=0), curves["low"]["flux"], rtol=1e-6
+        )
+        self.assertEqual(np.datetime64("2011-02-16T13:30:09.282"), curves["low"][0][0])
+        self.assertTrue(np.all(np.diff(curves["high"]["time"]) > np.timedelta64(0)))
+
+        sums = light_curves(self.fits_paths, self.bands, "sum", processes=True)
+        high = (self.frequency >= 600) & (self.frequency <= 700)
+        np.testing.assert_allclose(
+            self.db[high].sum(axis=0), sums["high"]["flux"], rtol=1e-6
+        )
+
+    def test_overlap_and_missing_band(self):
+        # The samples of a file already taken are skipped
+        files = [self.fits_paths[0], self.fits_paths[0], self.fits_paths[1]]
+        curves = light_curves(files, [("none", 2000, 3000)], workers=1)
+
+        self.assertEqual(2 * 3600, len(curves["none"]))
+        self.assertTrue(np.isnan(curves["none"]["flux"]).all())
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            light_curves(self.fits_paths, self.bands, reduce="median")
+        with self.assertRaises(ValueError):
+            light_curves(self.fits_paths, [("a", 0, 1), ("a", 1, 2)])
@@ -0,0 +1,62 @@
+import os
+import unittest
+from pathlib import Path
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsmetrics import MetricsRecorder, add_sink, remove_sink, stage
+from pycallisto.fitsstitch import stitch
+
+
+class FitsMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:2]
+
+        return super().setUp()
+
+    def test_disabled(self):
+        # Without sinks, stages share a no-op context manager
+        self.assertIs(stage("decode"), stage("read_image", "file.fit.gz"))
+
+    def test_recorder(self):
+        with MetricsRecorder() as recorder:
+            fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+            db, _, _ = stitch(fitsfiles)
+            fitsfiles[0].hdul_dataset["db_median"]
+            self.assertIsNot(stage("decode"), stage("decode"))
+
+        self.assertEqual(
+            ["header", "header", "read_image", "decode", "read_image", "decode"],
+            [metrics.stage for metrics in recorder.records[:6]],
+        )
+        self.assertEqual(self.fits_paths[0].name, recorder.records[2].filename)
+        self.assertEqual(
+            os.path.getsize(self.fits_paths[0]), recorder.records[2].bytes_read
+        )
+
+        totals = recorder.totals()
+        self.assertEqual(["header", "read_image", "decode", "median"], list(totals))
+        # read_db decodes into the stitched array, only the dataset's "db" of
+        # the first file (needed for its median) is allocated, after reading
+        # its image data once more.
+        self.assertEqual(db.nbytes / 2, totals["decode"].bytes_allocated)
+        self.assertEqual(3 * db.size / 2, totals["read_image"].bytes_allocated)
+        sizes = [os.path.getsize(path) for path in self.fits_paths]
+        self.assertEqual(
+            3 * sizes[0] + 2 * sizes[1],
+            sum(metrics.bytes_read for metrics in totals.values()),
+        )
+        self.assertTrue(all(metrics.seconds > 0 for metrics in totals.values()))
+
+    def test_sink(self):
+        received = []
+        sink = add_sink(received.append)
+        try:
+            with self.assertRaises(ValueError):
+                with stage("failing"):
+                    raise ValueError
+        finally:
+            remove_sink(sink)
+        with stage("ignored"):
+            pass
+
+        self.assertEqual(["failing"], [metrics.stage for metrics in received])
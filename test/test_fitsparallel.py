@@ -0,0 +1,34 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsparallel import load_many
+
+
+class LoadManyTestCase(unittest.TestCase):
+    def setUp(self):
+        list_dir = Path("assets/test/list")
+        self.fits_paths = sorted(list_dir.iterdir(), reverse=True)
+
+        return super().setUp()
+
+    def test_load_many(self):
+        fitsfiles = load_many(self.fits_paths, workers=2)
+
+        self.assertEqual(
+            [path.name for path in self.fits_paths],
+            [fits.filename for fits in fitsfiles],
+        )
+        for path, fits in zip(self.fits_paths, fitsfiles):
+            self.assertTrue(fits.hdul_dataset.is_loaded("db"))
+            expected = ECallistoFitsFile(path.name, path).hdul_dataset
+            np.testing.assert_array_equal(expected["db"], fits.hdul_dataset["db"])
+            np.testing.assert_array_equal(
+                expected["time_axis"], fits.hdul_dataset["time_axis"]
+            )
+
+    def test_load_many_missing_file(self):
+        with self.assertRaises(FileNotFoundError):
+            load_many(["NOT_HERE_BLEN7M_20110809_080004_25.fit.gz"], workers=1)
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile, FitsFile
+from pycallisto.fitspyramid import (
+    SpectrogramPyramid,
+    decimate,
+    load_pyramid,
+    pyramid_level,
+    pyramid_path,
+    stitch_pyramids,
+)
+
+
+class DecimateTestCase(unittest.TestCase):
+    def test_decimate(self):
+        array = np.arange(24, dtype=np.float32).reshape(2, 12)
+
+        np.testing.assert_array_equal(
+            array.reshape(2, 3, 4).mean(axis=2), decimate(array, 4)
+        )
+        np.testing.assert_array_equal(
+            array.reshape(2, 3, 4).max(axis=2), decimate(array, 4, reduction="max")
+        )
+        np.testing.assert_array_equal(
+            array.mean(axis=0, keepdims=True), decimate(array, 2, axis=0)
+        )
+
+        # The trailing partial block is reduced on its own
+        np.testing.assert_array_equal(
+            [[7, 10.5], [19, 22.5]], decimate(array, 5)[:, 1:]
+        )
+
+    def test_pyramid_level(self):
+        self.assertEqual(0, pyramid_level(3600, 4000))
+        self.assertEqual(2, pyramid_level(3600, 640))
+        self.assertEqual(0, pyramid_level(1000, 0))
+        self.assertEqual(2, pyramid_level(3600, 800))
+        self.assertEqual(8, pyramid_level(96 * 3600, 1280))
+
+
+class SpectrogramPyramidTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        list_dir = Path("assets/test/list")
+        self.fits_paths = []
+        for fits_path in sorted(list_dir.iterdir())[:3]:
+            self.fits_paths.append(Path(self.tmp_dir.name, fits_path.name))
+            shutil.copy(fits_path, self.fits_paths[-1])
+
+        return super().setUp()
+
+    def test_build(self):
+        fitsfile = ECallistoFitsFile(self.fits_paths[0].name, self.fits_paths[0])
+        pyramid = SpectrogramPyramid.build(fitsfile)
+        db = fitsfile.read_db()
+
+        self.assertEqual(12, pyramid.levels)
+        self.assertEqual(3600, pyramid.columns)
+        self.assertEqual((200, 1), pyramid.level(12).shape)
+        np.testing.assert_allclose(
+            decimate(db, 8), pyramid.level(3), rtol=1e-3, atol=1e-2
+        )
+        np.testing.assert_allclose(
+            decimate(decimate(db, 8, reduction="max"), 4, axis=0, reduction="max"),
+            pyramid.level(3, "max", 4),
+            rtol=1e-3,
+        )
+
+    def test_load_pyramid(self):
+        fitsfile = FitsFile(self.fits_paths[0].name, self.fits_paths[0], lazy=True)
+        path = pyramid_path(fitsfile)
+        self.assertFalse(path.exists())
+
+        built = load_pyramid(fitsfile)
+        self.assertTrue(path.exists())
+        mtime_ns = path.stat().st_mtime_ns
+
+        loaded = load_pyramid(fitsfile)
+        self.assertEqual(mtime_ns, path.stat().st_mtime_ns)
+        np.testing.assert_array_equal(built.level(5, "max"), loaded.level(5, "max"))
+        np.testing.assert_array_equal(built.time_span, loaded.time_span)
+
+        # A FITS file newer than its pyramid gets the pyramid rebuilt
+        os.utime(path, ns=(0, 0))
+        load_pyramid(fitsfile)
+        self.assertNotEqual(0, path.stat().st_mtime_ns)
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Needs /proc/self/fd")
+    def test_load_closes_file(self):
+        fitsfiles = [FitsFile(path.name, path, lazy=True) for path in self.fits_paths]
+        for fitsfile in fitsfiles:
+            load_pyramid(fitsfile)
+        open_files = len(os.listdir("/proc/self/fd"))
+
+        pyramids = [load_pyramid(fitsfile) for fitsfile in fitsfiles]
+        self.assertEqual(open_files, len(os.listdir("/proc/self/fd")))
+        self.assertEqual((200, 225), pyramids[0].level(4).shape)
+        self.assertEqual(open_files, len(os.listdir("/proc/self/fd")))
+
+    def test_stitch_pyramids(self):
+        fitsfiles = [FitsFile(path.name, path, lazy=True) for path in self.fits_paths]
+        db, time_span, frequency = stitch_pyramids(fitsfiles, 640, 480)
+
+        # 3 * 3600 columns drawn into 640 pixels
+        self.assertEqual((200, 3 * 3600 // 2**4), db.shape)
+        self.assertEqual(2, len(time_span))
+        self.assertEqual(190, len(frequency))
+
+        db, time_span, _ = stitch_pyramids(fitsfiles[:1], 4000, 100)
+        full = ECallistoFitsFile(self.fits_paths[0].name, self.fits_paths[0])
+        np.testing.assert_array_equal(full.read_db(), db)
+        self.assertEqual(full.hdul_dataset["time_axis"][-1], time_span[-1])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
@@ -0,0 +1,94 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsregrid import (
+    Grid,
+    Regridder,
+    interpolation_weights,
+    regular_grid,
+)
+
+
+class InterpolationWeightsTestCase(unittest.TestCase):
+    def test_interpolation_weights(self):
+        rng = np.random.default_rng(0)
+        # Decreasing source axis, like e-Callisto frequency channels
+        source = np.sort(rng.uniform(0, 100, 50))[::-1]
+        values = rng.normal(size=50)
+
+        for target in (np.linspace(-5, 105, 300), np.linspace(105, -5, 300)):
+            weights = interpolation_weights(source, target)
+            covered = target[weights.start : weights.stop]
+            self.assertTrue(np.all((covered >= source[-1]) & (covered <= source[0])))
+            self.assertEqual(
+                np.count_nonzero((target >= source[-1]) & (target <= source[0])),
+                weights.stop - weights.start,
+            )
+            np.testing.assert_allclose(
+                np.interp(covered, source[::-1], values[::-1]),
+                weights.apply(values, axis=0),
+                atol=1e-6,
+            )
+
+
+class RegridderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:2]
+        self.fitsfile = ECallistoFitsFile(self.fits_paths[0].name, self.fits_paths[0])
+
+        return super().setUp()
+
+    def test_regrid(self):
+        dataset = self.fitsfile.hdul_dataset
+        db = self.fitsfile.read_db()
+        frequency = dataset["frequency"]
+
+        # Resampling onto the file's own axes gives its data back
+        regridder = Regridder(Grid(dataset["time_axis"], frequency))
+        np.testing.assert_allclose(
+            db[: len(frequency)],
+            regridder.regrid(db, dataset["time_axis"], frequency),
+            atol=1e-4,
+        )
+
+        grid = regular_grid(13.4, 13.8, 1.0, 45, 870, 100)
+        regridder = Regridder(grid)
+        result = regridder.regrid(db, dataset["time_axis"], frequency)
+        self.assertEqual((100, len(grid.time)), result.shape)
+        covered = (grid.time >= dataset["time_axis"][0]) & (
+            grid.time <= dataset["time_axis"][-1]
+        )
+        channels = (grid.frequency >= frequency.min()) & (
+            grid.frequency <= frequency.max()
+        )
+        self.assertFalse(np.isnan(result[np.ix_(channels, covered)]).any())
+        self.assertTrue(np.isnan(result[:, ~covered]).all())
+        self.assertTrue(np.isnan(result[~channels]).all())
+
+        # The weights of an instrument setup already seen are reused
+        self.assertEqual((0, 2), (regridder.hits, regridder.misses))
+        regridder.regrid(db, dataset["time_axis"], frequency)
+        self.assertEqual((2, 2), (regridder.hits, regridder.misses))
+
+    def test_regrid_files(self):
+        grid = regular_grid(13.5, 13.8, 1.0, 45, 870, 100)
+        regridder = Regridder(grid)
+        mosaic = regridder.regrid_files(self.fits_paths)
+
+        first = regridder.regrid(
+            self.fitsfile.read_db(),
+            self.fitsfile.hdul_dataset["time_axis"],
+            self.fitsfile.hdul_dataset["frequency"],
+        )
+        covered = ~np.isnan(first)
+        np.testing.assert_allclose(first[covered], mosaic[covered], rtol=1e-6)
+        self.assertGreater(
+            np.count_nonzero(~np.isnan(mosaic)), np.count_nonzero(covered)
+        )
+
+        # Overlapping files are averaged
+        twice = regridder.regrid_files(self.fits_paths[:1] * 2)
+        np.testing.assert_allclose(first, twice, rtol=1e-6)
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from pycallisto.fitsrender import QuicklookRenderer, render_batch
+
+from .tools import sha3_512
+
+
+class QuicklookRendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+        list_dir = Path("assets/test/list")
+        self.fits_paths = sorted(list_dir.iterdir())
+
+        return super().setUp()
+
+    def test_reused_figure(self):
+        renderer = QuicklookRenderer()
+        renderer.render(self.fits_paths[:2], self.output_dir / "first")
+        image = renderer.render(self.fits_paths[4:], self.output_dir)
+
+        fresh_image = QuicklookRenderer().render(
+            self.fits_paths[4:], self.output_dir / "fresh"
+        )
+        self.assertEqual("BLEN7M_20110216_143014_154536_24.png", image.name)
+        self.assertEqual(sha3_512(fresh_image), sha3_512(image))
+
+    def test_auto_scale(self):
+        renderer = QuicklookRenderer(auto_scale=(0.01, 0.99))
+        renderer.render(self.fits_paths[:2], self.output_dir)
+        first_limits = renderer.image.get_clim()
+        renderer.render(self.fits_paths[4:], self.output_dir)
+
+        self.assertLess(first_limits[0], 0)
+        self.assertGreater(first_limits[1], 0)
+        self.assertNotEqual(first_limits, renderer.image.get_clim())
+
+    def test_imshow_kwargs(self):
+        renderer = QuicklookRenderer(interpolation="nearest", figsize=(8, 6))
+        renderer.render(self.fits_paths[:2], self.output_dir)
+
+        self.assertEqual("nearest", renderer.image.get_interpolation())
+        self.assertEqual((8, 6), tuple(renderer.figure.get_size_inches()))
+
+    def test_render_batch(self):
+        manifest = [self.fits_paths[:4], self.fits_paths[4:]]
+        report = render_batch(manifest, self.output_dir, workers=1)
+
+        self.assertEqual(
+            [
+                "BLEN7M_20110216_133009_143000_24.png",
+                "BLEN7M_20110216_143014_154536_24.png",
+            ],
+            [image.name for image in report.images],
+        )
+        for image in report.images:
+            self.assertTrue(image.is_file())
+        self.assertGreater(report.images_per_second, 0)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
@@ -0,0 +1,115 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsbackground import ChannelHistogram
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsrfi import (
+    ChannelMaskCache,
+    channel_counts,
+    channel_mask,
+    channel_statistics,
+    derive_mask,
+    flag_channels,
+)
+
+
+class FitsRfiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fitsfiles = [
+            ECallistoFitsFile(path.name, path)
+            for path in sorted(Path("assets/test/list").iterdir())
+        ]
+
+        return super().setUp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
+
+    def test_channel_counts(self):
+        # Binning the digits gives the histogram of the decibels
+        fitsfile = self.fitsfiles[0]
+        histogram = ChannelHistogram(fitsfile.hdul_dataset["rows"])
+        histogram.add(fitsfile.read_db())
+
+        np.testing.assert_array_equal(histogram.counts, channel_counts(fitsfile))
+
+    def test_channel_statistics(self):
+        db = self.fitsfiles[0].read_db().astype(np.float64)
+        counts = channel_counts(self.fitsfiles[0])
+        statistics = channel_statistics(counts)
+
+        np.testing.assert_array_equal(db.shape[1], statistics.samples)
+        np.testing.assert_allclose(np.var(db, axis=1), statistics.variance, atol=1e-4)
+        np.testing.assert_allclose(np.median(db, axis=1), statistics.median, atol=1e-5)
+        deviations = db - db.mean(axis=1, keepdims=True)
+        varying = np.var(db, axis=1) > 0
+        kurtosis = np.mean(deviations[varying] ** 4, axis=1)
+        kurtosis /= np.var(db[varying], axis=1) ** 2
+        np.testing.assert_allclose(
+            kurtosis - 3, statistics.kurtosis[varying], rtol=1e-3
+        )
+
+        # The statistics of many files are computed at once
+        stacked = channel_statistics(np.stack([counts, counts]))
+        self.assertEqual((2, len(counts)), stacked.variance.shape)
+        np.testing.assert_array_equal(statistics.occupancy, stacked.occupancy[1])
+
+    def test_flag_channels(self):
+        rng = np.random.default_rng(0)
+        db = rng.normal(30.0, 0.5, (20, 3000))
+        db[3, rng.random(3000) < 0.2] += 10  # Often far above its median
+        db[7, rng.random(3000) < 0.005] += 30  # Rare strong spikes
+        histogram = ChannelHistogram(20)
+        histogram.add(db)
+
+        flagged = flag_channels(channel_statistics(histogram.counts))
+        self.assertEqual([3, 7], np.flatnonzero(flagged).tolist())
+
+    def test_derive_mask(self):
+        channel_mask = derive_mask(self.fitsfiles)
+
+        self.assertEqual("BLEN7M", channel_mask.station)
+        self.assertEqual(len(self.fitsfiles), channel_mask.files)
+        np.testing.assert_array_equal(channel_mask.flagged < 0.5, channel_mask.mask)
+        # A few persistent interference channels, but not the ones of the
+        # solar burst of the last files
+        self.assertTrue(0 < np.count_nonzero(~channel_mask.mask) < 20)
+
+        with self.assertRaises(ValueError):
+            derive_mask([])
+
+    def test_cache(self):
+        cache = ChannelMaskCache(self.tmp_dir.name)
+        mask = channel_mask(self.fitsfiles[:3], cache)
+        cached = cache.get("BLEN7M", "FRQ00806.CFG")
+        np.testing.assert_array_equal(mask, cached.mask)
+        self.assertEqual(3, cached.files)
+
+        # The cached mask is used instead of the one of other files
+        np.testing.assert_array_equal(mask, channel_mask(self.fitsfiles[3:], cache))
+        self.assertIsNone(cache.get("BLEN7M", "FRQ00806.CFG", cached.frequency[1:]))
+
+        # Giving the default parameters explicitly is the same entry
+        defaults = {"persistence": 0.5, "threshold": 5, "batch_size": 8}
+        self.assertIsNotNone(cache.get("BLEN7M", "FRQ00806.CFG", parameters=defaults))
+        channel_mask(self.fitsfiles[3:], cache, **defaults)
+        self.assertEqual(3, cache.get("BLEN7M", "FRQ00806.CFG").files)
+
+        # A mask derived with other parameters is derived again
+        self.assertIsNone(
+            cache.get("BLEN7M", "FRQ00806.CFG", parameters={"threshold": 3})
+        )
+        strict = channel_mask(self.fitsfiles[:3], cache, persistence=0.2)
+        self.assertGreaterEqual(np.count_nonzero(~strict), np.count_nonzero(~mask))
+        self.assertIsNotNone(
+            cache.get("BLEN7M", "FRQ00806.CFG", parameters={"persistence": 0.2})
+        )
+
+        cache.clear()
+        self.assertIsNone(cache.get("BLEN7M", "FRQ00806.CFG"))
@@ -0,0 +1,61 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from pycallisto.fitsbackground import DB_PER_DIGIT
+from pycallisto.fitsscale import QuantileSketch, auto_limits
+
+
+class QuantileSketchTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.db = rng.normal(0.0, 3.0, (200, 3000)).astype(np.float32)
+        self.db[:, 1000:1100] += 40.0  # A burst
+
+        return super().setUp()
+
+    def test_quantile(self):
+        sketch = QuantileSketch().add(self.db)
+        quantiles = [0.0, 0.01, 0.5, 0.95, 0.995, 1.0]
+
+        self.assertEqual(self.db.size, sketch.count)
+        np.testing.assert_allclose(
+            np.quantile(self.db, quantiles),
+            sketch.quantile(quantiles),
+            atol=DB_PER_DIGIT,
+        )
+
+    def test_merge(self):
+        # Sketches of parts of the data, e.g. pickled back from workers, add
+        # up to the sketch of the whole data
+        parts = [
+            pickle.loads(pickle.dumps(QuantileSketch().add(part)))
+            for part in np.array_split(self.db, 3, axis=1)
+        ]
+        merged = parts[0].merge(parts[1]).merge(parts[2])
+
+        np.testing.assert_array_equal(
+            QuantileSketch().add(self.db).counts, merged.counts
+        )
+        with self.assertRaises(ValueError):
+            merged.merge(QuantileSketch(step=DB_PER_DIGIT))
+
+    def test_out_of_range_and_nan(self):
+        sketch = QuantileSketch(-10.0, 10.0)
+        sketch.add(np.array([-50.0, np.nan, 0.0, 50.0, np.nan]))
+
+        self.assertEqual(3, sketch.count)
+        self.assertEqual(1, sketch.counts[0])
+        self.assertEqual(1, sketch.counts[-1])
+
+        with self.assertRaises(ValueError):
+            QuantileSketch().quantile(0.5)
+
+    def test_auto_limits(self):
+        v_min, v_max = auto_limits(self.db, (0.05, 0.995))
+        chunks = np.array_split(self.db, 7, axis=1)
+
+        self.assertEqual((v_min, v_max), auto_limits(chunks, (0.05, 0.995)))
+        self.assertAlmostEqual(np.quantile(self.db, 0.05), v_min, delta=DB_PER_DIGIT)
+        self.assertAlmostEqual(np.quantile(self.db, 0.995), v_max, delta=DB_PER_DIGIT)
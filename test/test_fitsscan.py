@@ -0,0 +1,66 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitserror import FitsFileError
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsscan import scan_header, scan_headers
+
+
+class FitsScanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+
+        return super().setUp()
+
+    def test_scan_header(self):
+        fitsfile = ECallistoFitsFile(self.fits_paths[0].name, self.fits_paths[0])
+        dataset = fitsfile.hdul_dataset
+        summary = scan_header(self.fits_paths[0])
+
+        self.assertEqual("BLEN7M", summary.instrument)
+        self.assertEqual(dataset.header["FRQFILE"], summary.frqfile)
+        self.assertEqual(np.datetime64("2011-02-16T13:30:09.282"), summary.start)
+        self.assertEqual(np.datetime64("2011-02-16T13:45:09"), summary.end)
+        self.assertEqual(
+            (dataset["rows"], dataset["columns"]), (summary.rows, summary.columns)
+        )
+        self.assertEqual(dataset["dt"], summary.dt)
+        self.assertEqual(dataset["f0"].min(), summary.freq_low)
+        self.assertEqual(dataset["f0"].max(), summary.freq_high)
+
+        # Uncompressed files are read the same way, seeking past the image
+        uncompressed = Path(self.tmp_dir.name, "BLEN7M_20110216_133009_24.fit")
+        with gzip.open(self.fits_paths[0]) as file:
+            uncompressed.write_bytes(file.read())
+        self.assertEqual(summary[1:-1], scan_header(uncompressed)[1:-1])
+
+    def test_scan_headers(self):
+        table = scan_headers(self.fits_paths, workers=2)
+        self.assertEqual([str(path) for path in self.fits_paths], list(table["path"]))
+        self.assertEqual(
+            [tuple(scan_header(path)) for path in self.fits_paths], table.tolist()
+        )
+        np.testing.assert_array_equal(
+            table, scan_headers(self.fits_paths, workers=2, processes=True)
+        )
+
+    def test_invalid_file(self):
+        truncated = Path(self.tmp_dir.name, "truncated.fit.gz")
+        truncated.write_bytes(self.fits_paths[0].read_bytes()[:50000])
+        with self.assertRaises(FitsFileError):
+            scan_header(truncated)
+        with self.assertRaises(FitsFileError):
+            scan_headers([self.fits_paths[0], truncated])
+
+        table = scan_headers([self.fits_paths[0], truncated], errors="skip")
+        self.assertEqual([str(self.fits_paths[0])], list(table["path"]))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
@@ -0,0 +1,91 @@
+import pickle
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsspectrogram import Spectrogram
+
+
+class SpectrogramTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:2]
+        self.fitsfiles = [
+            ECallistoFitsFile(path.name, path) for path in self.fits_paths
+        ]
+        self.spectrogram = self.fitsfiles[0].spectrogram()
+
+        return super().setUp()
+
+    def test_fitsfile_spectrogram(self):
+        dataset = self.fitsfiles[0].hdul_dataset
+        db, time_axis, frequency = self.spectrogram
+
+        np.testing.assert_array_equal(dataset["db"], db)
+        np.testing.assert_array_equal(dataset["time_axis"], time_axis)
+        np.testing.assert_array_equal(dataset["f0"], frequency)
+        # Once the dataset is decoded, spectrograms view its arrays
+        spectrogram = self.fitsfiles[0].spectrogram(columns=slice(100, 200))
+        self.assertTrue(np.shares_memory(dataset["db"], spectrogram.db))
+        self.assertEqual((200, 100), spectrogram.shape)
+
+        with self.assertRaises(ValueError):
+            Spectrogram(db, time_axis, frequency[1:])
+
+    def test_views(self):
+        spectrogram = self.spectrogram
+        part = spectrogram[10:20, 100:300]
+        self.assertTrue(np.shares_memory(spectrogram.db, part.db))
+        np.testing.assert_array_equal(spectrogram.db[10:20, 100:300], part.db)
+        np.testing.assert_array_equal(spectrogram.frequency[10:20], part.frequency)
+        self.assertEqual((1, 3600), spectrogram[5].shape)
+        self.assertEqual((200, 1), spectrogram[:, -1].shape)
+
+        time_axis = spectrogram.time_axis
+        part = spectrogram.time_slice(time_axis[100], time_axis[199])
+        self.assertTrue(np.shares_memory(spectrogram.db, part.db))
+        np.testing.assert_array_equal(time_axis[100:200], part.time_axis)
+
+        part = spectrogram.frequency_slice(300, 400)
+        self.assertTrue(np.shares_memory(spectrogram.db, part.db))
+        self.assertTrue(np.all((part.frequency >= 300) & (part.frequency <= 400)))
+        self.assertEqual(0, spectrogram.frequency_slice(2000).shape[0])
+
+        # Arrays of indices select copies
+        part = spectrogram[[0, 2], [5, 7]]
+        np.testing.assert_array_equal(spectrogram.db[[0, 2]][:, [5, 7]], part.db)
+
+    def test_concatenate(self):
+        spectrograms = [fitsfile.spectrogram() for fitsfile in self.fitsfiles]
+        joined = Spectrogram.concatenate(spectrograms)
+
+        np.testing.assert_array_equal(
+            np.hstack([spectrogram.db for spectrogram in spectrograms]), joined.db
+        )
+        self.assertEqual(7200, len(joined.time_axis))
+        with self.assertRaises(ValueError):
+            Spectrogram.concatenate([spectrograms[0], spectrograms[1][1:, :]])
+
+    def test_pickle(self):
+        part = self.spectrogram[:, :10]
+        unpickled = pickle.loads(pickle.dumps(part, protocol=5))
+
+        np.testing.assert_array_equal(part.db, unpickled.db)
+        np.testing.assert_array_equal(part.time_axis, unpickled.time_axis)
+        # Only the viewed part of the array is pickled
+        self.assertLess(len(pickle.dumps(part)), self.spectrogram.db.nbytes / 100)
+
+    def test_shared_memory(self):
+        shared = self.spectrogram.share()
+        attached = Spectrogram.attach(pickle.loads(pickle.dumps(shared)))
+
+        np.testing.assert_array_equal(self.spectrogram.db, attached.db)
+        np.testing.assert_array_equal(self.spectrogram.frequency, attached.frequency)
+
+        # Other types of decibels are shared as they are
+        for dtype in (np.float16, np.float64):
+            spectrogram = self.fitsfiles[0].spectrogram(dtype=dtype)
+            attached = Spectrogram.attach(spectrogram.share())
+            self.assertEqual(dtype, attached.db.dtype)
+            np.testing.assert_array_equal(spectrogram.db, attached.db)
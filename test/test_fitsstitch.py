@@ -0,0 +1,152 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsbackground import remove_background
+from pycallisto.fitscatalog import FitsCatalog
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsscale import QuantileSketch
+from pycallisto.fitsstitch import (
+    load_range,
+    stitch,
+    stitch_background,
+    stitch_spectrogram,
+)
+
+
+class StitchTestCase(unittest.TestCase):
+    def setUp(self):
+        list_dir = Path("assets/test/list")
+        self.fits_paths = sorted(list_dir.iterdir())
+
+        return super().setUp()
+
+    def test_stitch(self):
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        db, time_axis, frequency = stitch(fitsfiles)
+
+        np.testing.assert_array_equal(
+            np.hstack([fits.hdul_dataset["db"] for fits in fitsfiles]), db
+        )
+        np.testing.assert_array_equal(
+            np.hstack([fits.hdul_dataset["time_axis"] for fits in fitsfiles]),
+            time_axis,
+        )
+        np.testing.assert_array_equal(fitsfiles[0].hdul_dataset["frequency"], frequency)
+
+        spectrogram = stitch_spectrogram(fitsfiles)
+        np.testing.assert_array_equal(db, spectrogram.db)
+        np.testing.assert_array_equal(time_axis, spectrogram.time_axis)
+        np.testing.assert_array_equal(
+            fitsfiles[0].hdul_dataset["f0"], spectrogram.frequency
+        )
+
+    def test_stitch_channel_mask(self):
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        db, _, _ = stitch(fitsfiles)
+        mask = np.ones(db.shape[0], dtype=bool)
+        mask[[0, 5, 100]] = False
+
+        masked_db, _, frequency = stitch(fitsfiles[:3] + fitsfiles[3:], mask)
+        np.testing.assert_array_equal(db[mask], masked_db)
+        np.testing.assert_array_equal(fitsfiles[0].hdul_dataset["f0"][mask], frequency)
+
+        with self.assertRaises(ValueError):
+            stitch(fitsfiles, mask[1:])
+
+    def test_stitch_background(self):
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        db, time_axis, _ = stitch(fitsfiles)
+
+        sketch = QuantileSketch()
+        spectrogram = stitch_background(fitsfiles, sketch=sketch)
+        np.testing.assert_allclose(remove_background(db), spectrogram.db, atol=1e-5)
+        np.testing.assert_array_equal(time_axis, spectrogram.time_axis)
+        # The sketch holds every background-subtracted value, once
+        np.testing.assert_array_equal(
+            QuantileSketch().add(spectrogram.db).counts, sketch.counts
+        )
+
+        # A single file is split into the same blocks as by remove_background
+        sketch = QuantileSketch()
+        spectrogram = stitch_background(fitsfiles[:1], window=600, sketch=sketch)
+        np.testing.assert_allclose(
+            remove_background(db[:, :3600], 600), spectrogram.db, atol=1e-5
+        )
+        np.testing.assert_array_equal(
+            QuantileSketch().add(spectrogram.db).counts, sketch.counts
+        )
+
+    def test_stitch_without_files(self):
+        with self.assertRaises(ValueError):
+            stitch([])
+
+
+class LoadRangeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:4]
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        self.db, self.time_axis, self.frequency = stitch(fitsfiles)
+        self.catalog = FitsCatalog(":memory:")
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        return super().setUp()
+
+    def window(self, first: int, last: int):
+        # Samples are 0.25 s apart, so a 0.1 s margin keeps both in the window
+        midnight = datetime(2011, 2, 16)
+        margin = timedelta(seconds=0.1)
+        return (
+            midnight + timedelta(hours=self.time_axis[first]) - margin,
+            midnight + timedelta(hours=self.time_axis[last]) + margin,
+        )
+
+    def test_load_range(self):
+        self.catalog.update("assets/test/list")
+        start, end = self.window(2500, 9000)
+        db, time_axis, frequency = load_range(
+            "BLEN7M", start, end, 200, 300, self.catalog
+        )
+
+        in_band = (self.frequency >= 200) & (self.frequency <= 300)
+        np.testing.assert_array_equal(
+            self.db[: len(self.frequency)][in_band, 2500:9001], db
+        )
+        np.testing.assert_allclose(self.time_axis[2500:9001], time_axis)
+        np.testing.assert_array_equal(self.frequency[in_band], frequency)
+
+        with self.assertRaises(ValueError):
+            load_range(
+                "BLEN7M",
+                datetime(2011, 2, 17),
+                datetime(2011, 2, 18),
+                catalog=self.catalog,
+            )
+        with self.assertRaises(ValueError):
+            load_range("BLEN7M", start, end, 200, 300)
+
+    def test_load_range_overlap(self):
+        # The same files twice, and a gap where the second file is missing
+        for copy in ("a", "b"):
+            directory = Path(self.tmp_dir.name, copy)
+            directory.mkdir()
+            for path in self.fits_paths[:1] + self.fits_paths[2:]:
+                shutil.copy(path, directory)
+        self.catalog.update(self.tmp_dir.name)
+
+        start, end = self.window(1000, 12000)
+        db, time_axis, _ = load_range("BLEN7M", start, end, catalog=self.catalog)
+
+        columns = np.r_[1000:3600, 7200:10800, 10800:12001]
+        np.testing.assert_array_equal(self.db[: len(self.frequency), columns], db)
+        np.testing.assert_allclose(self.time_axis[columns], time_axis)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
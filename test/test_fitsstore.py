@@ -0,0 +1,107 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_station
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsstitch import stitch
+from pycallisto.fitsstore import SpectrogramStore, SpectrogramWriter, export
+
+
+class SpectrogramStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_path = Path(self.tmp_dir.name, "store")
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        self.db, self.time_axis, self.frequency = stitch(fitsfiles)
+        self.db = self.db[: len(self.frequency)]
+
+        return super().setUp()
+
+    def test_export(self):
+        store = export(self.fits_paths, self.store_path, chunks=(64, 1000))
+        metadata = json.loads((self.store_path / "db" / ".zarray").read_text())
+        self.assertEqual([len(self.frequency), 3 * 3600], metadata["shape"])
+        self.assertEqual({"id": "zlib", "level": 1}, metadata["compressor"])
+
+        db, time_axis, frequency = store.read()
+        np.testing.assert_array_equal(self.db, db)
+        np.testing.assert_array_equal(self.time_axis, time_axis)
+        np.testing.assert_array_equal(self.frequency, frequency)
+
+    def test_read_range(self):
+        store = export(self.fits_paths, self.store_path, chunks=(64, 1000))
+        start, end = self.time_axis[2500], self.time_axis[4200]
+        db, time_axis, frequency = store.read(start, end, 200, 300)
+
+        in_band = (self.frequency >= 200) & (self.frequency <= 300)
+        np.testing.assert_array_equal(self.db[in_band, 2500:4201], db)
+        np.testing.assert_array_equal(self.time_axis[2500:4201], time_axis)
+        np.testing.assert_array_equal(self.frequency[in_band], frequency)
+        # Columns 2500-4200 span 3 chunks, and the band a single row of chunks
+        self.assertEqual(3, store.chunks_read)
+
+        db, time_axis, _ = store.read(end=self.time_axis[0] - 1)
+        self.assertEqual((len(self.frequency), 0), db.shape)
+
+    def test_append(self):
+        export(self.fits_paths[:2], self.store_path, chunks=(64, 1000))
+        store = export(self.fits_paths[2:], self.store_path)
+
+        db, time_axis, _ = store.read()
+        np.testing.assert_array_equal(self.db, db)
+        np.testing.assert_array_equal(self.time_axis, time_axis)
+
+        with self.assertRaises(ValueError):
+            SpectrogramWriter(self.store_path, self.frequency[:-1])
+
+    def test_midnight(self):
+        paths = synthetic_station(
+            Path(self.tmp_dir.name, "fits"),
+            4,
+            datetime(2011, 8, 9, 23, 57),
+            rows=20,
+            columns=400,
+        )
+        store = export(paths, self.store_path, chunks=(16, 300))
+        self.assertEqual(np.datetime64("2011-08-09"), store.epoch)
+
+        db, time_axis, _ = store.read()
+        self.assertEqual(4 * 400, len(time_axis))
+        self.assertTrue(np.all(np.diff(time_axis) > 0))
+        self.assertGreater(time_axis[-1], 24)
+
+        # Times of the next day follow on from 24 hours
+        _, time_axis, _ = store.read(23.96, 23.99)
+        self.assertEqual(int(0.03 * 3600 / 0.25) + 1, len(time_axis))
+        _, time_axis, _ = store.read(24, 24.05)
+        self.assertTrue(np.all((time_axis >= 24) & (time_axis <= 24.05)))
+        column = store.find_column(24)
+        self.assertEqual(time_axis[0], store.time(column))
+        self.assertLess(store.time(column - 1), 24)
+
+        with SpectrogramWriter(self.store_path, store.frequency) as writer:
+            with self.assertRaises(ValueError):
+                writer.append(db[:, :10], time_axis[:10])
+
+    def test_writer(self):
+        with SpectrogramWriter(self.store_path, self.frequency, (32, 500)) as writer:
+            for start in range(0, self.db.shape[1], 700):
+                writer.append(
+                    self.db[:, start : start + 700], self.time_axis[start : start + 700]
+                )
+
+        store = SpectrogramStore(self.store_path)
+        self.assertEqual(self.db.shape, store.shape)
+        self.assertEqual(self.time_axis[1234], store.time(1234))
+        np.testing.assert_array_equal(self.db, store.read()[0])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
@@ -0,0 +1,157 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pycallisto.fitsfile import ECallistoFitsFile
+from pycallisto.fitsscale import QuantileSketch
+from pycallisto.fitsstitch import stitch
+from pycallisto.fitswatch import LiveRenderer, LiveSpectrogram, watch
+
+
+class LiveSpectrogramTestCase(unittest.TestCase):
+    def test_append(self):
+        fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in fits_paths]
+        db, time_axis, frequency = stitch(fitsfiles)
+
+        spectrogram = LiveSpectrogram()
+        appended = [spectrogram.append(fitsfile) for fitsfile in fitsfiles]
+        np.testing.assert_array_equal(
+            db, np.concatenate([part.db for part in appended], axis=1)
+        )
+        np.testing.assert_array_equal(
+            time_axis, np.concatenate([part.time_axis for part in appended])
+        )
+        np.testing.assert_array_equal(frequency, spectrogram.frequency)
+        self.assertEqual(10800, spectrogram.columns)
+        self.assertEqual(time_axis[-1], spectrogram.last_time)
+
+        # Columns already appended are skipped, and none are kept
+        self.assertEqual((200, 0), spectrogram.append(fitsfiles[-1]).shape)
+        self.assertEqual(3, len(spectrogram.filenames))
+        arrays = [
+            value
+            for value in vars(spectrogram).values()
+            if isinstance(value, np.ndarray)
+        ]
+        self.assertEqual([spectrogram.frequency], arrays)
+
+
+class LiveRendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.tmp_dir.name)
+        self.fits_paths = sorted(Path("assets/test/list").iterdir())[:3]
+
+        return super().setUp()
+
+    def test_update(self):
+        renderer = LiveRenderer(width=720, start_hour=13, end_hour=16)
+        for fits_path in self.fits_paths:
+            image = renderer.update(fits_path, self.output_dir)
+        self.assertEqual("BLEN7M_20110216_133009_141500_24.png", image.name)
+        self.assertTrue(image.is_file())
+
+        # Every image column averages 15 s of background-subtracted columns
+        fitsfiles = [ECallistoFitsFile(path.name, path) for path in self.fits_paths]
+        db, time_axis, _ = stitch(fitsfiles)
+        db -= np.median(db, axis=1, keepdims=True)
+        index = np.floor((time_axis - 13) / 3 * 720).astype(int)
+        expected = np.full((db.shape[0], 720), np.nan, dtype=np.float32)
+        for column in np.unique(index):
+            expected[:, column] = db[:, index == column].mean(axis=1)
+        np.testing.assert_allclose(expected, renderer.image.get_array(), atol=1e-3)
+
+    def test_background_window(self):
+        renderer = LiveRenderer(
+            width=720, start_hour=13, end_hour=16, background_window=3600
+        )
+        for fits_path in self.fits_paths:
+            renderer.update(fits_path, self.output_dir)
+
+        # The background of every file is the median over that file only
+        fitsfile = ECallistoFitsFile(self.fits_paths[-1].name, self.fits_paths[-1])
+        db = fitsfile.read_db()
+        index = np.floor((fitsfile.hdul_dataset["time_axis"] - 13) / 3 * 720)
+        column = int(index[-1])
+        db -= np.median(db, axis=1, keepdims=True)
+        np.testing.assert_allclose(
+            db[:, index == column].mean(axis=1),
+            renderer.image.get_array()[:, column],
+            atol=1e-3,
+        )
+
+    def test_auto_scale(self):
+        renderer = LiveRenderer(
+            width=720,
+            start_hour=13,
+            end_hour=16,
+            background_window=3600,
+            auto_scale=(0.01, 0.99),
+        )
+        sketch = QuantileSketch()
+        for fits_path in self.fits_paths:
+            renderer.update(fits_path, self.output_dir)
+            # The limits are the quantiles of the background-subtracted
+            # columns of every file so far, not of the averaged image
+            fitsfile = ECallistoFitsFile(fits_path.name, fits_path)
+            db = fitsfile.read_db()
+            sketch.add(db - np.median(db, axis=1, keepdims=True))
+            np.testing.assert_allclose(
+                sketch.limits((0.01, 0.99)), renderer.image.get_clim(), atol=0.1
+            )
+
+    def test_watch(self):
+        incoming = self.output_dir / "incoming"
+        incoming.mkdir()
+        for fits_path in self.fits_paths[:2]:
+            shutil.copy(fits_path, incoming)
+
+        images = watch(incoming, filename="live.png", poll_interval=0.01)
+        self.assertEqual(incoming / "live.png", next(images))
+        next(images)
+        # A new file is taken once its size is the same on two polls
+        shutil.copy(self.fits_paths[2], incoming)
+        self.assertEqual(incoming / "live.png", next(images))
+        images.close()
+
+        self.assertEqual(
+            sorted(path.name for path in self.fits_paths) + ["live.png"],
+            sorted(path.name for path in incoming.iterdir()),
+        )
+        self.assertEqual(
+            [],
+            list(
+                watch(incoming, existing=False, idle_timeout=0.05, poll_interval=0.01)
+            ),
+        )
+
+    def test_watch_new_day(self):
+        incoming = self.output_dir / "incoming"
+        incoming.mkdir()
+        for fits_path in self.fits_paths[:2]:
+            shutil.copy(fits_path, incoming)
+
+        images = watch(
+            incoming, filename="live.png", poll_interval=0.01, idle_timeout=1.0
+        )
+        next(images)
+        next(images)
+        done = images.gi_frame.f_locals["done"]
+        self.assertEqual({path.name for path in self.fits_paths[:2]}, done)
+
+        # Files of the previous day are forgotten once a new day starts,
+        # and never taken again
+        name = self.fits_paths[2].name.replace("20110216", "20110217")
+        shutil.copy(self.fits_paths[2], incoming / name)
+        next(images)
+        self.assertEqual({name}, done)
+        self.assertEqual([], list(images))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
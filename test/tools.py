@@ -91,10 +91,16 @@ def get_test_file() -> Path:
     fitsfile = "BLEN7M_20110809_080004_25.fit.gz"
     fitsurl = callisto_archives + date_xpath + fitsfile
 
-    with open(fitsfile, "wb") as fin:
-        with httpx.stream("GET", fitsurl) as r:
-            for chunk in r.iter_raw():
-                fin.write(chunk)
+    try:
+        with open(fitsfile, "wb") as fin:
+            with httpx.stream("GET", fitsurl) as r:
+                for chunk in r.iter_raw():
+                    fin.write(chunk)
+    except BaseException:
+        # Don't leave an empty or partial file behind, FitsFile would find
+        # it when looking the name up in the current directory
+        Path(fitsfile).unlink(missing_ok=True)
+        raise
 
     return Path(fitsfile)
 